@@ -8,14 +8,22 @@ Execute '%run coare36vnWarm_et' from the iPython command line for test run with
 'test_36_data.txt' input data file. 
 List of functions in this code are:
     ['ComputeEsat',
+    'advance',
+    'coare36vnWarm_et',
+    'coare36vnWarm_et_batch',
+    'day_starts',
+    'local_time',
     'scalarv',
-    'coare36vnWarm_et']
+    'warm_layer',
+    'warm_layer_batch',
+    'warm_state']
 The rest of the functions are imported via the module 'coare36vn_zrf_et'
 
 ludovic Bariteau, CU/CIRES, NOAA/ESRL/PSL
 v1: September 2022
 """
 
+import math
 import numpy as np
 import coare36vn_zrf_et as c36
 import os
@@ -77,7 +85,6 @@ def coare36vnWarm_et(Jd, U, Zu, Tair, Zt, RH, Zq, P, Tsea, SW_dn, LW_dn, Lat, Lo
     
 #********** Set cool skin options ******************
     jcool = 1
-    icount = 1
 #********** Set wave ******************
 ### ... not sure if this is necessary ...
 # if no wave info is provided, fill array with nan.
@@ -91,142 +98,145 @@ def coare36vnWarm_et(Jd, U, Zu, Tair, Zt, RH, Zq, P, Tsea, SW_dn, LW_dn, Lat, Lo
     # be sure array inputs are ndarray floats for single value function
     # if inputs are already ndarray float this does nothing
     # otherwise copies are created in the local namespace
-    if U.size ==1 and Tair.size ==1: 
-        U = np.copy(np.asarray([U], dtype=float))
-        Zu = np.copy(np.asarray([Zu], dtype=float))
-        Tair = np.copy(np.asarray([Tair], dtype=float))
-        Zt = np.copy(np.asarray([Zt], dtype=float))
-        RH = np.copy(np.asarray([RH], dtype=float))
-        Zq = np.copy(np.asarray([Zq], dtype=float))
-        P = np.copy(np.asarray([P], dtype=float))
-        Tsea = np.copy(np.asarray([Tsea], dtype=float))
-        SW_dn = np.copy(np.asarray([SW_dn], dtype=float))
-        LW_dn = np.copy(np.asarray([LW_dn], dtype=float))
-        Lat = np.copy(np.asarray([Lat], dtype=float))
-        Lon = np.copy(np.asarray([Lon], dtype=float))
-        Jd = np.copy(np.asarray([Jd], dtype=float))
-        Zi = np.copy(np.asarray([Zi], dtype=float))
-        Rainrate = np.copy(np.asarray([Rainrate], dtype=float))
-        Ss = np.copy(np.asarray([Ss], dtype=float))
-        zrf_u = np.copy(np.asarray([zrf_u], dtype=float))
-        zrf_t = np.copy(np.asarray([zrf_t], dtype=float))
-        zrf_q = np.copy(np.asarray([zrf_q], dtype=float))
-        Ts_depth = np.copy(np.asarray([Ts_depth], dtype=float))
+    if np.size(U) ==1 and np.size(Tair) ==1: 
+        U, Zu, Tair, Zt, RH, Zq, P, Tsea, SW_dn, LW_dn, Lat, Lon, Jd, Zi, Rainrate, Ss, zrf_u, zrf_t, zrf_q, Ts_depth = [np.array(x, dtype=float, ndmin=1).ravel()
+            for x in (U, Zu, Tair, Zt, RH, Zq, P, Tsea, SW_dn, LW_dn, Lat, Lon, Jd, Zi, Rainrate, Ss, zrf_u, zrf_t, zrf_q, Ts_depth)]
 
     N = np.size(U)
  
-    if cp is not None and cp.size==1:
-        cp = np.copy(np.asarray([cp], dtype=float))
+    if cp is not None and np.size(cp)==1:
+        cp = np.array(cp, dtype=float, ndmin=1).ravel()
     elif cp is None:
         cp = np.nan * np.ones(N)
     
-    if sigH is not None and sigH.size==1:
-        sigH = np.copy(np.asarray([sigH], dtype=float))
+    if sigH is not None and np.size(sigH)==1:
+        sigH = np.array(sigH, dtype=float, ndmin=1).ravel()
     elif sigH is None:
         sigH = np.nan * np.ones(N)
 
-#*********************  housekeep variables  ********
-# Call coare36vn to get initial flux values
-    Bx = c36.coare36vn_zrf_et(U[0],Zu[0],Tair[0],Zt[0],RH[0],Zq[0],P[0],Tsea[0],SW_dn[0],LW_dn[0],Lat[0],Lon[0],Jd[0],Zi[0],Rainrate[0],Ss[0],cp[0],sigH[0],zrf_u,zrf_t,zrf_q)
-
-    ### check these indices for you latest version of coare!
-    tau_old = Bx[0,1]
-    hs_old = Bx[0,2]
-    hl_old = Bx[0,3]
-    dT_skin_old = Bx[0,17]
-    hrain_old = Bx[0,37]
-    
-    qcol_ac = 0.0
-    tau_ac = 0.0
-    dT_warm = 0.0
-    du_warm = 0.0
-    max_pwp = 19.0
-    dz_warm = max_pwp
-    dT_warm_to_skin = 0.0
-    q_pwp = 0.0
-    fxp = 0.5
+    nx = np.size(Jd)
     
-    rich = 0.65
+    #********************************************************
+    #****  Compute apply warm layer  correction *************
+    #********************************************************
+    Bx, warm_output, state = _warm_record(Jd,U,Zu,Tair,Zt,RH,Zq,P,Tsea,SW_dn,LW_dn,Lat,Lon,Zi,Rainrate,Ts_depth,Ss,cp,sigH,zrf_u,zrf_t,zrf_q,warm_state())
     
-    jtime = 0
-    jamset = 0
-    jump = 1
+    # get rid of filled values where nans are present in input data
+    # (sw_dn is the last sample here, as at the end of a sample by sample loop)
+    sw_dn = SW_dn[nx - 1]
+    bad_input = np.unique(np.where(np.isnan(sw_dn) == 1))
+    # disp(['bad solar values = ' sprintf('#i',length(bad_input))]);
+    warm_output[bad_input,:] = np.nan
     
-    #*******************  set constants  ****************
+    #**************************************************
+    # Recompute the fluxes where the warm layer values were removed, Bx already
+    # has the entire time series with seawater T adjusted for warm layer
+    #**************************************************
+    if bad_input.size > 0:
+        Bx[bad_input] = _coare_rows(bad_input,U,Zu,Tair,Zt,RH,Zq,P,Tsea + warm_output[:,2],SW_dn,LW_dn,Lat,Lon,Jd,Zi,Rainrate,Ss,cp,sigH,zrf_u,zrf_t,zrf_q)
+    B = np.hstack((Bx,warm_output))
+    
+    #************* output from routine  *****************************
+    ### adds to coarevn_zrf output the following 4 vars:
+    # B = [ <<< outputs from main coare function >>> .... dT_warm  dz_warm  dT_warm_to_skin  du_warm ]
+    return B
+    
+#------------------------------------------------------------------------------
+def advance(chunk = None,state = None): 
+# Continues coare36vnWarm_et over the next chunk of a record (e.g. a new day of
+# mooring data) from the warm layer state at the end of the chunks before it,
+# without reprocessing them. Running a record chunk by chunk gives the same
+# output as coare36vnWarm_et on the whole record (except that the latter also
+# removes the warm layer values of the first time step when the last SW_dn of
+# the record is NaN).
+# Inputs:
+# chunk  dict of the coare36vnWarm_et inputs of the new time steps, keyed by
+#        argument name: Jd, U, Zu, Tair, Zt, RH, Zq, P, Tsea, SW_dn, LW_dn,
+#        Lat, Lon, Zi, Rainrate, Ts_depth, Ss, and optionally cp, sigH,
+#        zrf_u, zrf_t, zrf_q. Single values are used for every time step.
+# state  warm layer state returned by the last call, or None for the start of
+#        a record (see warm_state)
+# Outputs: B, as coare36vnWarm_et for the time steps of the chunk, and the
+#          warm layer state at the end of the chunk, for the next call
+# Example:
+#   state = None
+#   for chunk in daily_chunks:
+#       B, state = advance(chunk, state)
+#       json.dump(state, open('warm_state.json', 'w'))
+    
+    if state is None:
+        state = warm_state()
+    
+    names = ['Jd','U','Zu','Tair','Zt','RH','Zq','P','Tsea','SW_dn','LW_dn','Lat','Lon','Zi','Rainrate','Ts_depth','Ss','cp','sigH']
+    N = np.size(chunk['Jd'])
+    Jd,U,Zu,Tair,Zt,RH,Zq,P,Tsea,SW_dn,LW_dn,Lat,Lon,Zi,Rainrate,Ts_depth,Ss,cp,sigH = [np.array(np.broadcast_to(np.asarray(chunk.get(name, np.nan), dtype=float), (N,))) for name in names]
+    zrf_u = chunk.get('zrf_u', 10.0)
+    zrf_t = chunk.get('zrf_t', 10.0)
+    zrf_q = chunk.get('zrf_q', 10.0)
+    
+    if N == 0:
+        return np.zeros([0,len(c36.output_names) + 4]), state
+    
+    Bx, warm_output, state = _warm_record(Jd,U,Zu,Tair,Zt,RH,Zq,P,Tsea,SW_dn,LW_dn,Lat,Lon,Zi,Rainrate,Ts_depth,Ss,cp,sigH,zrf_u,zrf_t,zrf_q,state)
+    B = np.hstack((Bx,warm_output))
+    
+    return B, state
+    
+#------------------------------------------------------------------------------
+def warm_layer(tau = None,hsb = None,hlb = None,dT_skin = None,hrain = None,newtime = None,tsea = None,sw_net = None,lw_dn = None,ts_depth = None,ctd1 = None,ctd2 = None,state = None): 
+# Warm layer recursion of Fairall et al. (1996) over a time series, from the
+# COARE fluxes of every time step (tau, hsb, hlb, dT_skin, hrain, computed with
+# tsea + dT_warm_to_skin). Each time step uses the fluxes of the time step
+# before it, and the accumulations are reset at the start of each local day.
+# Inputs:
+# newtime   local time of day (s)
+# tsea      sea temp (C) at ts_depth
+# sw_net    net solar flux (W/m^2), positive warming ocean
+# lw_dn     downward IR flux (W/m^2)
+# ts_depth  depth (m) of tsea, positive below surface
+# ctd1,ctd2 warm layer thickness and dT coefficients
+# state     warm layer state before the first time step (see warm_state),
+#           by default the start of a record
+# Outputs: array of dT_warm, dz_warm, dT_warm_to_skin, du_warm for each time
+#          step, and the warm layer state after the last one
+    
+    jcool = 1
     T2K = 273.16
-    Rgas = 287.1
-    cpa = 1004.67
-    cpw = 4000.0
     rhow = 1022.0
-    visw = 1e-06
-    
-    be = 0.026
-    tcw = 0.6
-    #**********************************************************
-    #******************  setup read data loop  ****************
-    P_tq = P - (0.125 * Zt)
-    Press,tseak,tairk,Qsatsea,Qsat,Qair,Rhoair,Rhodry = scalarv(P,Tsea,Tair,RH,Zt)
-
-    nx = np.size(Jd)
+    max_pwp = 19.0
     
-    # this is an empty array for saving warm layer code output values. Will be
-    # added to coare output at the end.
-    warm_output = np.full([nx,4],np.nan)
-    for ibg in np.arange(0,nx).reshape(-1):  #np.arange(0,53).reshape(-1):
-        jd = Jd[ibg]
-        p = P[ibg]
-        u = U[ibg]
-        tsea = Tsea[ibg]
-        t = Tair[ibg]
-        ss = Ss[ibg]
-        qs = Qsatsea[ibg]
-        q = Qair[ibg]
-        rh = RH[ibg]
-        sw_dn = SW_dn[ibg]
-        lw_dn = LW_dn[ibg]
-        rain = Rainrate[ibg]
-        grav = c36.grv(Lat[ibg])
-        lat = Lat[ibg]
-        lon = Lon[ibg]
-        rhoa = Rhoair[ibg]
-        cpi = cp[ibg]
-        sigHi = sigH[ibg]
-        zi=Zi[ibg]
-        zu=Zu[ibg]
-        zt=Zt[ibg]
-        zq=Zq[ibg]
-        ts_depth=Ts_depth[ibg]
-        
-        #*****  variables for warm layer  ***
-        ### for constant albedo
-        # sw_net=.945*sw_dn;     #Net Solar: positive warming ocean, constant albedo
-        ### for albedo that is time-varying, i.e. zenith angle varying
-        # insert 'E' for input to albedo function if longitude is defined positive
-        # to E, so that lon can be flipped. The function ideally works with
-        # longitude positive to the west. Check: albedo should peak at sunrise not
-        # sunset.
-        alb,T_sw,solarmax_sw,psi_sw = c36.albedo_vector(sw_dn,jd,lon,lat,'E')
-        sw_net = np.multiply((1 - alb[0]),sw_dn)
-        lw_net = 0.97 * (5.67e-08 * (tsea - dT_skin_old * jcool + T2K) ** 4 - lw_dn)
-        cpv = cpa * (1 + 0.84 * q / 1000)
-        visa = 1.326e-05 * (1 + 0.006542 * t + 8.301e-06 * t * t - 4.84e-09 * t * t * t)
-        Al = 2.1e-05 * (tsea + 3.2) ** 0.79
-        ctd1 = np.sqrt(2 * rich * cpw / (Al * grav * rhow))
-        ctd2 = np.sqrt(2 * Al * grav / (rich * rhow)) / (cpw ** 1.5)
-        
-        #********************************************************
-        #****  Compute apply warm layer  correction *************
-        #********************************************************
-        intime = jd - np.fix(jd)
-        loc = (lon + 7.5) / 15
-        chktime = loc + intime * 24
-        if chktime > 24:
-            chktime = chktime - 24
-        newtime = (chktime - 24 * np.fix(chktime / 24)) * 3600
-        if icount > 1:
-            if newtime <= 21600 or jump == 0:
+    if state is None:
+        state = warm_state()
+    qcol_ac = state['qcol_ac']
+    tau_ac = state['tau_ac']
+    dT_warm = state['dT_warm']
+    du_warm = state['du_warm']
+    dz_warm = state['dz_warm']
+    dT_warm_to_skin = state['dT_warm_to_skin']
+    fxp = state['fxp']
+    
+    jtime = state['jtime']
+    jamset = state['jamset']
+    jump = state['jump']
+    started = state['started']
+    
+    # dz_warm of the last absorption profile, and its fxp
+    dz_fxp = None
+    fxp_dz = None
+    
+    # plain floats, which are much faster than numpy scalars one value at a time,
+    # with the fluxes of the time step before the series in front
+    tau, hsb, hlb, dT_skin, hrain = [[state[name]] + x.tolist() for name, x in (('tau',tau),('hsb',hsb),('hlb',hlb),('dT_skin',dT_skin),('hrain',hrain))]
+    newtime, tsea, sw_net, lw_dn, ts_depth = newtime.tolist(), tsea.tolist(), sw_net.tolist(), lw_dn.tolist(), ts_depth.tolist()
+    ctd1, ctd2 = ctd1.tolist(), ctd2.tolist()
+    
+    nx = len(newtime)
+    warm_output = []
+    for ibg in range(nx):
+        if started:
+            if newtime[ibg] <= 21600 or jump == 0:
                 jump = 0
-                if newtime < jtime:
+                if newtime[ibg] < jtime:
                     jamset = 0
                     fxp = 0.5
                     dz_warm = max_pwp
@@ -238,20 +248,26 @@ def coare36vnWarm_et(Jd, U, Zu, Tair, Zt, RH, Zq, P, Tsea, SW_dn, LW_dn, Lat, Lo
                     #************************************
                     #****   set warm layer constants  ***
                     #************************************
-                    dtime = newtime - jtime
-                    qr_out = lw_net + hs_old + hl_old + hrain_old
-                    q_pwp = fxp * sw_net - qr_out
-                    # qqrx[ibg] = hs_old
+                    dtime = newtime[ibg] - jtime
+                    lw_net = 0.97 * (5.67e-08 * (tsea[ibg] - dT_skin[ibg] * jcool + T2K) ** 4 - lw_dn[ibg])
+                    qr_out = lw_net + hsb[ibg] + hlb[ibg] + hrain[ibg]
+                    q_pwp = fxp * sw_net[ibg] - qr_out
                     if q_pwp >= 50 or jamset == 1:
                         jamset = 1
-                        tau_ac = tau_ac + np.maximum(0.002,tau_old) * dtime
+                        # (NaN tau is kept, as with np.maximum)
+                        tau_ac = tau_ac + (0.002 if tau[ibg] < 0.002 else tau[ibg]) * dtime
                         if qcol_ac + q_pwp * dtime > 0:
                             #******************************************
                             # Compute the absorption profile
                             #******************************************
-                            for i in np.arange(1,5+1).reshape(-1):
+                            for i in range(5):
                                 #### The original version since Fairall et al. 1996:
-                                fxp = 1 - (0.28 * 0.014 * (1 - np.exp(- dz_warm / 0.014)) + 0.27 * 0.357 * (1 - np.exp(- dz_warm / 0.357)) + 0.45 * 12.82 * (1 - np.exp(- dz_warm / 12.82))) / dz_warm
+                                # (the three exponentials in one call, and only when dz_warm has changed)
+                                if dz_warm != dz_fxp:
+                                    e1, e2, e3 = np.exp(np.array([- dz_warm / 0.014, - dz_warm / 0.357, - dz_warm / 12.82])).tolist()
+                                    fxp_dz = 1 - (0.28 * 0.014 * (1 - e1) + 0.27 * 0.357 * (1 - e2) + 0.45 * 12.82 * (1 - e3)) / dz_warm
+                                    dz_fxp = dz_warm
+                                fxp = fxp_dz
                                 # the above integrated flux formulation is wrong for the warm layer,
                                 # but it has been used in this scheme since 1996 without
                                 # making bad predictions.
@@ -269,70 +285,371 @@ def coare36vnWarm_et(Jd, U, Zu, Tair, Zt, RH, Zq, P, Tsea, SW_dn, LW_dn, Lat, Lo
                                 # --using DYNAMO absorption bands (F, invgamma defined above):
                                 #### NOT TESTED!! Correction of fxp from Simon ***
                                 #fxp=1-sum(F.*(exp(-tk_pwp*invgamma)),2);
-                                qjoule = (fxp * sw_net - qr_out) * dtime
+                                qjoule = (fxp * sw_net[ibg] - qr_out) * dtime
                                 if qcol_ac + qjoule > 0:
-                                    dz_warm = np.minimum(max_pwp,ctd1 * tau_ac / np.sqrt(qcol_ac + qjoule))
+                                    dz_warm = ctd1[ibg] * tau_ac / math.sqrt(qcol_ac + qjoule)
+                                    if dz_warm > max_pwp:
+                                        dz_warm = max_pwp
                         else:
                             fxp = 0.75
                             dz_warm = max_pwp
-                            qjoule = (fxp * sw_net - qr_out) * dtime
+                            qjoule = (fxp * sw_net[ibg] - qr_out) * dtime
                         qcol_ac = qcol_ac + qjoule
                         #*******  compute dt_warm  ******
                         if qcol_ac > 0:
-                            dT_warm = ctd2 * (qcol_ac) ** 1.5 / tau_ac
+                            dT_warm = ctd2[ibg] * (qcol_ac) ** 1.5 / tau_ac
                             du_warm = 2 * tau_ac / (dz_warm * rhow)
                         else:
                             dT_warm = 0
                             du_warm = 0
                 # Compute warm layer dT between input measurement and skin layer
-                if dz_warm < ts_depth:
+                if dz_warm < ts_depth[ibg]:
                     dT_warm_to_skin = dT_warm
                 else:
-                    dT_warm_to_skin = dT_warm * ts_depth / dz_warm
-        jtime = newtime
+                    dT_warm_to_skin = dT_warm * ts_depth[ibg] / dz_warm
+        jtime = newtime[ibg]
+        started = True
         
-        #************* output from routine  *****************************
-        # Adjust tsea for warm layer above measurement. Even if tsea is at 5 cm for the sea snake,
-        # there could be warming present between the interface and the subsurface
-        # temperature. dT_warm_to_skin estimates that warming between the levels.
-        ts = tsea + dT_warm_to_skin
+        warm_output.append((dT_warm,dz_warm,dT_warm_to_skin,du_warm))
+    
+    state = dict(qcol_ac=qcol_ac, tau_ac=tau_ac, dT_warm=dT_warm, du_warm=du_warm, dz_warm=dz_warm,
+                 dT_warm_to_skin=dT_warm_to_skin, fxp=fxp, jtime=jtime, jamset=jamset, jump=jump, started=started,
+                 tau=tau[nx], hsb=hsb[nx], hlb=hlb[nx], dT_skin=dT_skin[nx], hrain=hrain[nx])
+    
+    return np.array(warm_output,dtype=float).reshape(nx,4), state
+    
+#------------------------------------------------------------------------------
+def coare36vnWarm_et_batch(Jd, U, Zu, Tair, Zt, RH, Zq, P, Tsea, SW_dn, LW_dn, Lat, Lon, Zi, Rainrate, Ts_depth, Ss, cp=None, sigH=None,zrf_u = 10.0,zrf_t = 10.0,zrf_q = 10.0): 
+# coare36vnWarm_et for many platforms (moorings, Saildrones, gliders...) at once.
+# The inputs are (platform, time) arrays, or anything that broadcasts to the
+# shape of U, e.g. Zu of shape (platform, 1) for fixed heights on each
+# platform or Jd of shape (time,) for a common time axis. Each platform is an
+# independent warm layer record: pad the shorter records at the end with NaN.
+#
+# The passes of COARE and of the warm layer recursion are the same as in
+# coare36vnWarm_et. Since the warm layer is reset at the start of each day,
+# every day of every platform is an independent recursion, and
+# warm_layer_batch steps all of them forward together with array operations.
+# The Python cost of the recursion is then that of the longest day, shared by
+# all the days of all the platforms.
+#
+# Outputs: B of shape (platform, time, 54), with the columns of
+# coare36vnWarm_et. The values match coare36vnWarm_et on each platform to
+# rounding (array powers can differ from scalar ones in the last bit), and the
+# warm layer values are NaN where SW_dn is NaN.
+    
+    shape = np.shape(U)
+    nplat, nx = shape
+    
+    if cp is None:
+        cp = np.nan
+    if sigH is None:
+        sigH = np.nan
+    
+    # (platform, time) copies of the inputs
+    Jd, U, Zu, Tair, Zt, RH, Zq, P, Tsea, SW_dn, LW_dn, Lat, Lon, Zi, Rainrate, Ts_depth, Ss, cp, sigH = [np.array(np.broadcast_to(x, shape), dtype=float) for x in (Jd, U, Zu, Tair, Zt, RH, Zq, P, Tsea, SW_dn, LW_dn, Lat, Lon, Zi, Rainrate, Ts_depth, Ss, cp, sigH)]
+    
+    #*******************  set constants  ****************
+    cpw = 4000.0
+    rhow = 1022.0
+    rich = 0.65
+    
+    #*****  variables for warm layer that do not depend on the fluxes  ***
+    # (see coare36vnWarm_et)
+    alb,T_sw,solarmax_sw,psi_sw = c36.albedo_vector(SW_dn.ravel(),Jd.ravel(),Lon.ravel(),Lat.ravel(),'E')
+    sw_net = np.multiply((1 - alb.reshape(shape)),SW_dn)
+    newtime = local_time(Jd,Lon)
+    grav = c36.grv(Lat)
+    Al = 2.1e-05 * (Tsea + 3.2) ** 0.79
+    ctd1 = np.sqrt(2 * rich * cpw / (Al * grav * rhow))
+    ctd2 = np.sqrt(2 * Al * grav / (rich * rhow)) / (cpw ** 1.5)
+    
+    #********************************************************
+    #****  Compute apply warm layer  correction *************
+    #********************************************************
+    # Passes of COARE on all the samples whose dT_warm_to_skin has changed, and
+    # of the warm layer recursion on the days that have any, until
+    # dT_warm_to_skin no longer changes (see coare36vnWarm_et). The samples are
+    # indexed in the flattened (platform, time) arrays.
+    flat = [x.ravel() for x in (U,Zu,Tair,Zt,RH,Zq,P,Tsea,SW_dn,LW_dn,Lat,Lon,Jd,Zi,Rainrate,Ss,cp,sigH)]
+    Tsea, sw_net, LW_dn, Ts_depth, ctd1, ctd2 = [x.ravel() for x in (Tsea, sw_net, LW_dn, Ts_depth, ctd1, ctd2)]
+    
+    # days of all the platforms, as a (day, time step) array of samples, padded
+    # after the end of each day with its last sample (and a NaN local time)
+    starts = np.concatenate([p * nx + np.concatenate(([0], day_starts(newtime[p]))) for p in range(nplat)])
+    stops = np.append(starts[1:], nplat * nx)
+    day_start = starts % nx > 0
+    length = stops - starts
+    steps = np.arange(length.max())
+    rows = np.minimum(starts[:,None] + steps, stops[:,None] - 1)
+    inday = steps < length[:,None]
+    day = np.repeat(np.arange(starts.size), length)
+    newtime = np.where(inday, newtime.ravel()[rows], np.nan)
+    
+    warm_output = np.zeros([nplat * nx,4])
+    Bx = np.zeros([nplat * nx,len(c36.output_names)])
+    redo = np.arange(nplat * nx)
+    while redo.size > 0:
+        Bx[redo] = _coare_rows(redo,*flat[:7],Tsea + warm_output[:,2],*flat[8:],zrf_u,zrf_t,zrf_q)
+        new_output = np.copy(warm_output)
+        k = np.unique(day[redo])
+        r = rows[k]
+        ### check these indices for you latest version of coare!
+        days_output = warm_layer_batch(Bx[r,1],Bx[r,2],Bx[r,3],Bx[r,17],Bx[r,37],newtime[k],Tsea[r],sw_net[r],LW_dn[r],Ts_depth[r],ctd1[r],ctd2[r],day_start[k])
+        new_output[r[inday[k]]] = days_output[inday[k]]
+        same = (new_output[:,2] == warm_output[:,2]) | (np.isnan(new_output[:,2]) & np.isnan(warm_output[:,2]))
+        redo = np.flatnonzero(~same)
+        warm_output = new_output
+    
+    # get rid of filled values where nans are present in input data, and
+    # recompute the fluxes there
+    bad_input = np.flatnonzero(np.isnan(SW_dn))
+    if bad_input.size > 0:
+        warm_output[bad_input] = np.nan
+        Bx[bad_input] = _coare_rows(bad_input,*flat[:7],Tsea + warm_output[:,2],*flat[8:],zrf_u,zrf_t,zrf_q)
+    B = np.hstack((Bx,warm_output)).reshape(nplat,nx,-1)
+    
+    return B
+    
+#------------------------------------------------------------------------------
+def warm_layer_batch(tau = None,hsb = None,hlb = None,dT_skin = None,hrain = None,newtime = None,tsea = None,sw_net = None,lw_dn = None,ts_depth = None,ctd1 = None,ctd2 = None,day_start = None): 
+# warm_layer for many time series at once (e.g. platforms, or days of
+# platforms): the inputs are (series, time) arrays, and at each time step all
+# the series are stepped forward with array operations. The branches of
+# warm_layer (start of record, day resets, warm layer onset with jamset,
+# absorption profile) are masks, so each series follows its own local time,
+# and the warm layer itself is only computed on the series that have one at
+# that time step. A NaN local time leaves a series unchanged except for jtime.
+# Inputs: as warm_layer, and
+# day_start True for the series that begin at the start of a day (see
+#           day_starts), False (default) for those that begin a record
+# Outputs: array of dT_warm, dz_warm, dT_warm_to_skin, du_warm of shape
+# (series, time, 4)
+    
+    jcool = 1
+    T2K = 273.16
+    rhow = 1022.0
+    max_pwp = 19.0
+    
+    # depths and weights of the three solar absorption bands in fxp
+    absorption_depth = np.array([0.014, 0.357, 12.82])
+    absorption_weight = np.array([0.28 * 0.014, 0.27 * 0.357, 0.45 * 12.82])
+    
+    # (time, platform) copies, so that each time step is contiguous
+    tau, hsb, hlb, dT_skin, hrain, newtime, tsea, sw_net, lw_dn, ts_depth, ctd1, ctd2 = [np.ascontiguousarray(np.transpose(x)) for x in (tau, hsb, hlb, dT_skin, hrain, newtime, tsea, sw_net, lw_dn, ts_depth, ctd1, ctd2)]
+    nx, nplat = np.shape(newtime)
+    
+    qcol_ac = np.zeros(nplat)
+    tau_ac = np.zeros(nplat)
+    dT_warm = np.zeros(nplat)
+    du_warm = np.zeros(nplat)
+    dz_warm = np.full(nplat,max_pwp)
+    dT_warm_to_skin = np.zeros(nplat)
+    fxp = np.full(nplat,0.5)
+    
+    jtime = newtime[0]
+    jamset = np.zeros(nplat,dtype=bool)
+    jump = np.ones(nplat,dtype=bool)
+    
+    warm_output = np.zeros([nx,nplat,4])
+    warm_output[0,:,1] = max_pwp
+    if day_start is not None:
+        # the first time step of a day is a reset, which leaves the initial
+        # values, except for the warm layer computed from then on
+        jump = ~np.asarray(day_start)
+        warm_output[0,:,2] = np.where(jump | (max_pwp < ts_depth[0]), 0.0, 0.0 * ts_depth[0] / max_pwp)
+    with np.errstate(invalid='ignore',divide='ignore'):
+        for ibg in range(1,nx):
+            # platforms where the warm layer is computed, and those of them where it is reset
+            jump &= ~(newtime[ibg] <= 21600)
+            run = ~jump
+            reset = run & (newtime[ibg] < jtime)
+            if reset.any():
+                jamset[reset] = False
+                fxp[reset] = 0.5
+                dz_warm[reset] = max_pwp
+                tau_ac[reset] = 0.0
+                qcol_ac[reset] = 0.0
+                dT_warm[reset] = 0.0
+                du_warm[reset] = 0.0
+            
+            #************************************
+            #****   set warm layer constants  ***
+            #************************************
+            dtime = newtime[ibg] - jtime
+            lw_net = 0.97 * (5.67e-08 * (tsea[ibg] - dT_skin[ibg - 1] * jcool + T2K) ** 4 - lw_dn[ibg])
+            qr_out = lw_net + hsb[ibg - 1] + hlb[ibg - 1] + hrain[ibg - 1]
+            q_pwp = fxp * sw_net[ibg] - qr_out
+            # platforms with a warm layer at this time step, which are computed
+            # as the subset k of all the platforms
+            warm = run & ~reset & ((q_pwp >= 50) | jamset)
+            if warm.any():
+                k = np.flatnonzero(warm)
+                jamset[k] = True
+                dt = dtime[k]
+                sw = sw_net[ibg,k]
+                qr = qr_out[k]
+                qcol = qcol_ac[k]
+                dz = dz_warm[k]
+                fx = fxp[k]
+                tau_k = tau_ac[k] + np.maximum(0.002,tau[ibg - 1,k]) * dt
+                #******************************************
+                # Compute the absorption profile (see warm_layer)
+                #******************************************
+                profile = qcol + q_pwp[k] * dt > 0
+                for i in range(5):
+                    #### The original version since Fairall et al. 1996:
+                    # (the three bands in one (platform, band) array), stopping
+                    # once dz_warm no longer changes
+                    bands = (1 - np.exp(np.divide(- dz[:,None], absorption_depth))) * absorption_weight
+                    fx = np.where(profile, 1 - (bands[:,0] + bands[:,1] + bands[:,2]) / dz, fx)
+                    qjoule = (fx * sw - qr) * dt
+                    dz_new = np.where(profile & (qcol + qjoule > 0), np.minimum(max_pwp,ctd1[ibg,k] * tau_k / np.sqrt(qcol + qjoule)), dz)
+                    if np.array_equal(dz_new, dz):
+                        break
+                    dz = dz_new
+                fx[~profile] = 0.75
+                dz[~profile] = max_pwp
+                qjoule = (fx * sw - qr) * dt
+                qcol = qcol + qjoule
+                #*******  compute dt_warm  ******
+                heat = qcol > 0
+                dT_warm[k] = np.where(heat, ctd2[ibg,k] * qcol ** 1.5 / tau_k, 0.0)
+                du_warm[k] = np.where(heat, 2 * tau_k / (dz * rhow), 0.0)
+                tau_ac[k] = tau_k
+                qcol_ac[k] = qcol
+                dz_warm[k] = dz
+                fxp[k] = fx
+            # Compute warm layer dT between input measurement and skin layer
+            dT_warm_to_skin = np.where(run, np.where(dz_warm < ts_depth[ibg], dT_warm, dT_warm * ts_depth[ibg] / dz_warm), dT_warm_to_skin)
+            jtime = newtime[ibg]
+            
+            warm_output[ibg,:,0] = dT_warm
+            warm_output[ibg,:,1] = dz_warm
+            warm_output[ibg,:,2] = dT_warm_to_skin
+            warm_output[ibg,:,3] = du_warm
+    
+    return np.ascontiguousarray(np.transpose(warm_output,(1,0,2)))
+    
+#------------------------------------------------------------------------------
+def local_time(jd = None,lon = None): 
+# Local time of day (s) used by the warm layer, from the year day jd and the
+# longitude lon (deg E=+)
+    intime = jd - np.fix(jd)
+    loc = (lon + 7.5) / 15
+    chktime = loc + intime * 24
+    chktime = np.where(chktime > 24, chktime - 24, chktime)
+    newtime = (chktime - 24 * np.fix(chktime / 24)) * 3600
+    return newtime
+    
+#------------------------------------------------------------------------------
+def day_starts(newtime = None,state = None): 
+# Time steps (other than the first) where warm_layer resets the warm layer
+# whatever the fluxes: the first time step of each day, once the local time
+# has been before 6 am (21600 s) for the first time. state is the warm layer
+# state before newtime[0] (see warm_state), by default the start of a record.
+    if state is None:
+        state = warm_state()
+    below = newtime <= 21600
+    if not state['started']:
+        below[0] = False
+    jump = (np.cumsum(below) == 0) & (state['jump'] == 1)
+    reset = ~jump[1:] & (newtime[1:] < newtime[:-1])
+    return np.flatnonzero(reset) + 1
+    
+#------------------------------------------------------------------------------
+def warm_state(): 
+# Warm layer state at the start of a record, for warm_layer and advance. The
+# state is a dict of plain numbers (the accumulations and values of the warm
+# layer recursion, and the COARE fluxes of the last time step), so it can be
+# saved with json or pickle and a record continued later with advance.
+    max_pwp = 19.0
+    return dict(qcol_ac=0.0, tau_ac=0.0, dT_warm=0.0, du_warm=0.0, dz_warm=max_pwp,
+                dT_warm_to_skin=0.0, fxp=0.5, jtime=0.0, jamset=0, jump=1, started=False,
+                tau=np.nan, hsb=np.nan, hlb=np.nan, dT_skin=np.nan, hrain=np.nan)
+    
+#------------------------------------------------------------------------------
+def _day_state(): 
+    # State before the first time step of a day (see day_starts): that time step
+    # is a reset, so only jump, jtime and started matter
+    return dict(warm_state(), jump=0, jtime=np.inf, started=True)
+    
+#------------------------------------------------------------------------------
+def _warm_record(Jd,U,Zu,Tair,Zt,RH,Zq,P,Tsea,SW_dn,LW_dn,Lat,Lon,Zi,Rainrate,Ts_depth,Ss,cp,sigH,zrf_u,zrf_t,zrf_q,state): 
+    # COARE fluxes Bx and warm layer values warm_output of a record, or of the
+    # next chunk of a record from the warm layer state at the end of the last
+    # chunk, and the state at the end of this one
+    
+    #*******************  set constants  ****************
+    cpw = 4000.0
+    rhow = 1022.0
+    rich = 0.65
+
+    nx = np.size(Jd)
+    
+    #*****  variables for warm layer that do not depend on the fluxes  ***
+    ### for constant albedo
+    # sw_net=.945*sw_dn;     #Net Solar: positive warming ocean, constant albedo
+    ### for albedo that is time-varying, i.e. zenith angle varying
+    # insert 'E' for input to albedo function if longitude is defined positive
+    # to E, so that lon can be flipped. The function ideally works with
+    # longitude positive to the west. Check: albedo should peak at sunrise not
+    # sunset.
+    alb,T_sw,solarmax_sw,psi_sw = c36.albedo_vector(SW_dn,Jd,Lon,Lat,'E')
+    sw_net = np.multiply((1 - alb),SW_dn)
+    newtime = local_time(Jd,Lon)
+    # warm layer thickness and dT coefficients, one sample at a time since
+    # scalar powers can differ from array powers in the last bit
+    ctd1 = np.zeros(nx)
+    ctd2 = np.zeros(nx)
+    for ibg in range(nx):
+        grav = c36.grv(Lat[ibg])
+        Al = 2.1e-05 * (Tsea[ibg] + 3.2) ** 0.79
+        ctd1[ibg] = np.sqrt(2 * rich * cpw / (Al * grav * rhow))
+        ctd2[ibg] = np.sqrt(2 * Al * grav / (rich * rhow)) / (cpw ** 1.5)
+    
+    # The fluxes of each time step depend on the warm layer correction of tsea,
+    # which depends on the fluxes of the time steps before it. Instead of
+    # calling COARE on one sample at a time, COARE is run on the whole record
+    # with the current dT_warm_to_skin and warm_layer is rerun with the new
+    # fluxes, until dT_warm_to_skin no longer changes. Each pass fixes at least
+    # one more time step, so this ends with the same values as a sample by
+    # sample loop (after 10-15 passes in practice). Each pass only recomputes
+    # COARE where dT_warm_to_skin has changed, and since the warm layer is reset
+    # at the start of each day whatever the fluxes, only reruns warm_layer on
+    # the days where the fluxes have changed.
+    starts = np.concatenate(([0], day_starts(newtime,state)))
+    stops = np.append(starts[1:], nx)
+    warm_output = np.zeros([nx,4])
+    Bx = np.zeros([nx,len(c36.output_names)])
+    redo = np.arange(nx)
+    while redo.size > 0:
         # Rerun COARE with the warm-layer corrected tsea temperature. COARE will
         # apply a cool skin to this, completing all calculations needed for Tskin and fluxes.
         # Using COARE ouput from this function, Tskin = Tsnake - dT_skin + dT_warm_to_skin
         # note: in prior COARE lingo/code: dT_warm_to_skin used to be dsea and dT_skin used to be dter
-        Bx = c36.coare36vn_zrf_et(u,zu,t,zt,rh,zq,p,ts,sw_dn,lw_dn,lat,lon,jd,zi,rain,ss,cpi,sigHi,zrf_u,zrf_t,zrf_q)
-        # save values from this time step to be used in next time step, this is how
-        # the integral is computed
-        tau_old = Bx[0,1]
-        hs_old = Bx[0,2]
-        hl_old = Bx[0,3]
-        dT_skin_old = Bx[0,17]
-        hrain_old = Bx[0,37]
-        warm_output[ibg,0] = dT_warm
-        warm_output[ibg,1] = dz_warm
-        warm_output[ibg,2] = dT_warm_to_skin
-        warm_output[ibg,3] = du_warm
-        
-        icount = icount + 1
-    #end of data line loop 
+        Bx[redo] = _coare_rows(redo,U,Zu,Tair,Zt,RH,Zq,P,Tsea + warm_output[:,2],SW_dn,LW_dn,Lat,Lon,Jd,Zi,Rainrate,Ss,cp,sigH,zrf_u,zrf_t,zrf_q)
+        new_output = np.copy(warm_output)
+        for k in np.unique(np.searchsorted(starts, redo, side='right') - 1):
+            i = slice(starts[k], stops[k])
+            ### check these indices for you latest version of coare!
+            new_output[i] = warm_layer(Bx[i,1],Bx[i,2],Bx[i,3],Bx[i,17],Bx[i,37],newtime[i],Tsea[i],sw_net[i],LW_dn[i],Ts_depth[i],ctd1[i],ctd2[i],state if k == 0 else _day_state())[0]
+        same = (new_output[:,2] == warm_output[:,2]) | (np.isnan(new_output[:,2]) & np.isnan(warm_output[:,2]))
+        redo = np.flatnonzero(~same)
+        warm_output = new_output
+    
+    # state at the end of the last day, with the final fluxes
+    k = starts.size - 1
+    i = slice(starts[k], stops[k])
+    state = warm_layer(Bx[i,1],Bx[i,2],Bx[i,3],Bx[i,17],Bx[i,37],newtime[i],Tsea[i],sw_net[i],LW_dn[i],Ts_depth[i],ctd1[i],ctd2[i],state if k == 0 else _day_state())[1]
+    
+    return Bx, warm_output, state
     
-    # get rid of filled values where nans are present in input data
-    bad_input = np.where(np.isnan(sw_dn) == 1)
-    # disp(['bad solar values = ' sprintf('#i',length(bad_input))]);
-    warm_output[bad_input,:] = np.nan
-    
-    #**************************************************
-    # Recompute entire time series of fluxes with seawater T adjusted for warm layer
-    #**************************************************
-    del Bx
-    Tsea = Tsea + warm_output[:,2]
-    Bx = c36.coare36vn_zrf_et(U,Zu,Tair,Zt,RH,Zq,P,Tsea,SW_dn,LW_dn,Lat,Lon,Jd,Zi,Rainrate,Ss,cp,sigH,zrf_u,zrf_t,zrf_q)
-    B = np.hstack((Bx,warm_output))
-    
-    #************* output from routine  *****************************
-    ### adds to coarevn_zrf output the following 4 vars:
-    # B = [ <<< outputs from main coare function >>> .... dT_warm  dz_warm  dT_warm_to_skin  du_warm ]
-    return B
+#------------------------------------------------------------------------------
+def _coare_rows(rows,U,Zu,Tair,Zt,RH,Zq,P,Tsea,SW_dn,LW_dn,Lat,Lon,Jd,Zi,Rainrate,Ss,cp,sigH,zrf_u,zrf_t,zrf_q): 
+    # COARE on the time steps rows of the record (indexing copies the inputs, so
+    # the sigH that COARE fills in from cp is not changed)
+    return c36.coare36vn_zrf_et(U[rows],Zu[rows],Tair[rows],Zt[rows],RH[rows],Zq[rows],P[rows],Tsea[rows],SW_dn[rows],LW_dn[rows],Lat[rows],Lon[rows],Jd[rows],Zi[rows],Rainrate[rows],Ss[rows],cp[rows],sigH[rows],zrf_u,zrf_t,zrf_q)
     
 #------------------------------------------------------------------------------  
 def scalarv(P0 = None,tsea = None,tair = None,rh = None,zt = None): 
@@ -0,0 +1,285 @@
+"""
+Benchmark and regression checks of the COARE 3.6 functions on test_36_data.txt.
+
+benchmark times coare36vn_zrf_et, coare36vnWarm_et and albedo_vector on the test data
+tiled up to the requested numbers of samples, and records the throughput (samples/s)
+and the peak memory of each call. check compares the outputs of coare36vnWarm_et on the
+test data with a reference output file: one of the published outputs of the COARE
+repository (test_36_output_withwavesinput_withwarmlayer.txt with waves=True, or
+test_36_output_withnowavesinput_withwarmlayer.txt with waves=False), or a snapshot of an
+earlier version written with save_reference. Together they show whether a change is
+faster and still gives the same results.
+
+Run from the command line, e.g.:
+    python coare36vn_benchmark.py --sizes 1e4 1e5 1e6 --reference test_36_output_withwavesinput_withwarmlayer.txt
+or:
+    import coare36vn_benchmark as bench
+    results = bench.benchmark(sizes=[10**4, 10**5])
+    failed = bench.check('test_36_output_withwavesinput_withwarmlayer.txt')
+
+The outputs of coare36vn_zrf_et take 400 bytes per sample (50 float64 columns), so 10^7
+samples need several GB of memory.
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import time
+import tracemalloc
+
+import numpy as np
+import coare36vn_zrf_et as c36
+import coare36vnWarm_et as c36warm
+
+# test data file of the COARE repository, and its column names
+TEST_DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'test_36_data.txt')
+test_names = ['jd','u','zu','ta','zt','rh','zq','P','tsnk','sw_dn','lw_dn','lat','lon','zi','rain','Ss','cp','sigH',
+              'tsg','ztsg']
+
+# names of the columns of the coare36vnWarm_et output, in order
+warm_output_names = c36.output_names + ['dT_warm','dz_warm','dT_warm_to_skin','du_warm']
+
+FUNCTIONS = ['coare36vn_zrf_et', 'coare36vnWarm_et', 'albedo_vector']
+
+# numbers of samples n at which check compares coare36vn_zrf_et on n samples with the
+# first n of n + 1 samples (around the block sizes of the compiled and NumPy code paths)
+PREFIX_SIZES = (1, 2, 63, 64, 65, 1000)
+
+# chunk sizes at which check runs coare36vnWarm_et.advance over the test record
+ADVANCE_CHUNKS = (1, 7, 500)
+
+
+def load_test_data(path=TEST_DATA, n=None):
+    """
+    Reads the test data file, optionally tiled to n samples.
+
+    Args:
+        path (str): path of test_36_data.txt (or of a file with the same columns).
+        n (int): number of samples, None for the record as it is. The record is repeated
+            as many times as needed and cut at n samples, with the year day jd of each
+            repetition continuing from the end of the previous one, so that the tiled
+            record is one continuous time series (as coare36vnWarm_et needs).
+
+    Returns:
+        dict of the columns (see test_names), each an array.
+    """
+
+    data = np.loadtxt(path, skiprows=1)
+    data = {name: data[:, i] for i, name in enumerate(test_names)}
+    if n is None:
+        return data
+
+    n = int(n)
+    nx = data['jd'].size
+    reps = -(-n // nx)
+    tiled = {name: np.tile(value, reps)[:n] for name, value in data.items()}
+    # span of the record, with one more time step so the repetitions do not overlap
+    span = data['jd'][-1] - data['jd'][0] + np.median(np.diff(data['jd']))
+    tiled['jd'] = tiled['jd'] + span * (np.arange(n) // nx)
+    return tiled
+
+
+def run(function, data, waves=True, jit=None):
+    """
+    Runs one of the FUNCTIONS on the test data (e.g. of load_test_data), in the way of the
+    test runs of the COARE repository: coare36vn_zrf_et with the sea snake temperature
+    tsnk, coare36vnWarm_et with the temperature tsg at depth ztsg.
+
+    Args:
+        function (str): name of the function, one of FUNCTIONS.
+        data: dict of the test data columns, which are not changed.
+        waves (bool): whether the wave inputs cp and sigH are used.
+        jit: jit option of coare36vn_zrf_et (the bulk loop of coare36vnWarm_et always
+            uses the default).
+
+    Returns:
+        the output of the function.
+    """
+
+    # copies, since coare36vn_zrf_et changes some of its inputs in place
+    d = {name: np.copy(value) for name, value in data.items()}
+    cp, sigH = (d['cp'], d['sigH']) if waves else (None, None)
+
+    if function == 'coare36vn_zrf_et':
+        return c36.coare36vn_zrf_et(d['u'], d['zu'], d['ta'], d['zt'], d['rh'], d['zq'], d['P'], d['tsnk'], d['sw_dn'],
+                                    d['lw_dn'], d['lat'], d['lon'], d['jd'], d['zi'], d['rain'], d['Ss'], cp, sigH, jit=jit)
+    if function == 'coare36vnWarm_et':
+        # without the print of coare36vnWarm_et
+        with contextlib.redirect_stdout(io.StringIO()):
+            return c36warm.coare36vnWarm_et(d['jd'], d['u'], d['zu'], d['ta'], d['zt'], d['rh'], d['zq'], d['P'], d['tsg'],
+                                            d['sw_dn'], d['lw_dn'], d['lat'], d['lon'], d['zi'], d['rain'], d['ztsg'],
+                                            d['Ss'], cp, sigH)
+    if function == 'albedo_vector':
+        return c36.albedo_vector(d['sw_dn'], d['jd'], d['lon'], d['lat'], 'E')
+    raise ValueError('unknown function %r, not one of %s' % (function, FUNCTIONS))
+
+
+def benchmark(sizes=(10**4, 10**5, 10**6), functions=FUNCTIONS, repeat=3, waves=True, jit=None, path=TEST_DATA):
+    """
+    Times the functions on the test data tiled to each number of samples.
+
+    Args:
+        sizes: numbers of samples.
+        functions: names of the functions, from FUNCTIONS.
+        repeat (int): number of timed runs of each function and size; the fastest is kept.
+        waves, jit: as for run.
+        path (str): path of the test data file.
+
+    Returns:
+        list of dicts, one per function and size, with the function name, the number of
+        samples n, the time of the fastest run in seconds, the throughput in samples/s
+        and the peak memory in MB allocated by one run (measured with tracemalloc, in a
+        separate run that is not timed).
+    """
+
+    results = []
+    for n in sizes:
+        data = load_test_data(path, n)
+        for function in functions:
+            seconds = np.inf
+            for i in range(repeat):
+                start = time.perf_counter()
+                run(function, data, waves, jit)
+                seconds = min(seconds, time.perf_counter() - start)
+
+            tracemalloc.start()
+            base = tracemalloc.get_traced_memory()[0]
+            run(function, data, waves, jit)
+            peak = tracemalloc.get_traced_memory()[1] - base
+            tracemalloc.stop()
+
+            results.append(dict(function=function, n=int(n), seconds=seconds, samples_per_s=n / seconds,
+                                peak_mb=peak / 1e6))
+    return results
+
+
+def check(reference, waves=True, rtol=1e-6, path=TEST_DATA):
+    """
+    Compares the coare36vnWarm_et outputs on the test data with a reference output file,
+    and checks that the coare36vn_zrf_et output of a sample does not depend on the
+    number of samples of the call (as the blocks of coare36vn_zrf_et_chunked and
+    coare36vn_zrf_et_parallel, and the rows recomputed by coare36vnWarm_et, need), and
+    that coare36vnWarm_et.advance over the record in chunks gives the same output as
+    coare36vnWarm_et on the whole record.
+
+    Args:
+        reference (str): path of the reference file, with a header line and one column per
+            output of coare36vnWarm_et (see warm_output_names), as the published outputs
+            of the COARE repository and the files of save_reference.
+        waves (bool): whether the reference was computed with the wave inputs cp and
+            sigH.
+        rtol (float): tolerance of each column, relative to the largest absolute value of
+            the column in the reference.
+        path (str): path of the test data file.
+
+    Returns:
+        dict of the columns that differ, keyed by output name, with their largest
+        difference relative to the largest absolute value of the column (inf where the
+        NaN values are not the same), and 'coare36vn_zrf_et[:n]' for the numbers of
+        samples n of PREFIX_SIZES where the output on n samples is not exactly the first
+        n rows of the output on n + 1 samples, and 'advance[size]' for the chunk sizes of
+        ADVANCE_CHUNKS where advance is not exactly the whole record output. Empty if all
+        the outputs agree.
+    """
+
+    ref = np.loadtxt(reference, skiprows=1)
+    out = run('coare36vnWarm_et', load_test_data(path), waves)
+    if ref.shape != out.shape:
+        raise ValueError('reference has shape %s, the outputs %s' % (ref.shape, out.shape))
+
+    failed = {}
+    for name, a, b in zip(warm_output_names, out.T, ref.T):
+        err = _difference(a, b)
+        if err > rtol:
+            failed[name] = err
+
+    for n in PREFIX_SIZES:
+        data = load_test_data(path, n + 1)
+        a = run('coare36vn_zrf_et', {name: value[:n] for name, value in data.items()}, waves)
+        b = run('coare36vn_zrf_et', data, waves)[:n]
+        if not np.array_equal(a, b, equal_nan=True):
+            failed['coare36vn_zrf_et[:%d]' % n] = _difference(a, b)
+
+    data = load_test_data(path)
+    for size in ADVANCE_CHUNKS:
+        chunked = _advance(data, size, waves)
+        if np.isnan(data['sw_dn'][-1]):
+            # coare36vnWarm_et also removes the warm layer values of the first time step
+            chunked[0, len(c36.output_names):] = out[0, len(c36.output_names):]
+        if not np.array_equal(chunked, out, equal_nan=True):
+            failed['advance[%d]' % size] = _difference(chunked, out)
+    return failed
+
+
+def _advance(data, size, waves=True):
+
+    # coare36vnWarm_et.advance over the test data in chunks of size time steps, as run
+    # runs coare36vnWarm_et on the whole record
+    names = dict(Jd='jd', U='u', Zu='zu', Tair='ta', Zt='zt', RH='rh', Zq='zq', P='P', Tsea='tsg', SW_dn='sw_dn',
+                 LW_dn='lw_dn', Lat='lat', Lon='lon', Zi='zi', Rainrate='rain', Ts_depth='ztsg', Ss='Ss')
+    if waves:
+        names.update(cp='cp', sigH='sigH')
+    state, out = None, []
+    for start in range(0, data['jd'].size, size):
+        chunk = {name: np.copy(data[column][start:start + size]) for name, column in names.items()}
+        B, state = c36warm.advance(chunk, state)
+        out.append(B)
+    return np.vstack(out)
+
+
+def _difference(a, b):
+
+    # largest difference of a and b relative to the largest absolute value of b, inf
+    # where the NaN values are not the same
+    if not np.array_equal(np.isnan(a), np.isnan(b)):
+        return np.inf
+    scale = np.nanmax(np.abs(b), initial=0)
+    return np.nanmax(np.abs(a - b), initial=0) / (scale if scale > 0 else 1)
+
+
+def save_reference(reference, waves=True, path=TEST_DATA):
+    """
+    Writes the coare36vnWarm_et outputs on the test data to a reference file for check, in
+    the format of the outputs of the coare36vnWarm_et test run.
+
+    Args:
+        reference (str): path of the file to write.
+        waves (bool): whether the wave inputs cp and sigH are used.
+        path (str): path of the test data file.
+    """
+
+    out = run('coare36vnWarm_et', load_test_data(path), waves)
+    np.savetxt(reference, out, fmt='%.18e', delimiter='\t', header='\t'.join(warm_output_names), comments='')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark and regression checks of COARE 3.6 on test_36_data.txt')
+    parser.add_argument('--sizes', nargs='+', type=float, default=[1e4, 1e5, 1e6],
+                        help='numbers of samples of the tiled test data')
+    parser.add_argument('--functions', nargs='+', default=FUNCTIONS, choices=FUNCTIONS)
+    parser.add_argument('--repeat', type=int, default=3, help='timed runs per function and size')
+    parser.add_argument('--no-waves', dest='waves', action='store_false', help='without the wave inputs cp and sigH')
+    parser.add_argument('--jit', action='store_true',
+                        help='bulk loop of coare36vn_zrf_et compiled by Numba instead of NumPy')
+    parser.add_argument('--reference', help='reference output file to check the coare36vnWarm_et outputs against')
+    parser.add_argument('--rtol', type=float, default=1e-6, help='tolerance of the check, see check')
+    parser.add_argument('--save-reference', help='write the coare36vnWarm_et outputs to this reference file')
+    parser.add_argument('--data', default=TEST_DATA, help='path of test_36_data.txt')
+    args = parser.parse_args()
+
+    print('%-18s %10s %10s %14s %10s' % ('function', 'samples', 'seconds', 'samples/s', 'peak MB'))
+    for r in benchmark([int(n) for n in args.sizes], args.functions, args.repeat, args.waves, args.jit, args.data):
+        print('%-18s %10d %10.3f %14.0f %10.1f' % (r['function'], r['n'], r['seconds'], r['samples_per_s'], r['peak_mb']))
+
+    if args.save_reference:
+        save_reference(args.save_reference, args.waves, args.data)
+        print('wrote', args.save_reference)
+
+    if args.reference:
+        failed = check(args.reference, args.waves, args.rtol, args.data)
+        for name, err in failed.items():
+            print('%-16s differs by %.3g' % (name, err))
+        print('check against %s: %s' % (args.reference, 'FAILED' if failed else 'passed'))
+        if failed:
+            raise SystemExit(1)
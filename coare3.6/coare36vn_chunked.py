@@ -0,0 +1,107 @@
+"""
+Block by block (chunked) processing of very long records with the COARE 3.6 bulk flux
+function coare36vn_zrf_et.
+
+The record is read chunksize samples at a time, from arrays (which may be on disk, e.g.
+np.memmap, h5py or zarr arrays), a text file or a generator of blocks, and the outputs of
+each block are written to the output store before the next block is read. Only one block
+of inputs, intermediate arrays and outputs is in memory at a time, so the memory use is
+set by chunksize and not by the length of the record.
+
+Example, for the test data file (whose air and sea temperature columns are ta and tsnk):
+    import coare36vn_chunked as c36c
+    c36c.coare36vn_zrf_et_chunked('test_36_data.txt', 'fluxes.parquet', chunksize=500,
+                                  columns={'t': 'ta', 'ts': 'tsnk'}, outputs=['tau', 'hsb', 'hlb'])
+    fluxes = pd.read_parquet('fluxes.parquet')
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import coare36vn_zrf_et as c36
+
+
+def coare36vn_zrf_et_chunked(source, store, chunksize=100000, outputs=None, columns=None, sep=r'\s+', tol=None, jit=None, **constants):
+    """
+    Runs coare36vn_zrf_et over a record block by block, writing the outputs of each block
+    to store as they are computed.
+
+    Args:
+        source: the record, one of
+            - a dict of the coare36vn_zrf_et inputs keyed by input name (u, zu, t, ...,
+              see c36.input_names), each an array of the record or a single value. Any
+              array that can be sliced works, e.g. np.load(..., mmap_mode='r'), and only
+              the slice of each block is read.
+            - the path of a text file with a header line and one sample per line (e.g.
+              test_36_data.txt), read chunksize lines at a time with pd.read_csv.
+            - an iterable (e.g. a generator) of blocks, each a dict as above.
+        store: path of the output Parquet file, written with one row group per block, or
+            a callable that is called as store(start, A) for each block, with the index
+            start of its first sample in the record and its outputs A.
+        chunksize (int): number of samples per block (not used for an iterable of blocks).
+        outputs: list of output names (see c36.output_names), defaults to all of them.
+        columns (dict): names of the columns of a text file for the inputs whose column
+            does not have the input name, e.g. {'t': 'ta', 'ts': 'tsnk'}.
+        sep (str): column separator of a text file, whitespace by default.
+        tol, jit: as for coare36vn_zrf_et.
+        **constants: single values of inputs that are not in source, e.g. zi=600.0.
+
+    Returns:
+        int: number of samples processed.
+    """
+
+    outputs = list(c36.output_names if outputs is None else outputs)
+
+    if callable(store):
+        write, writer = store, None
+    else:
+        schema = pa.schema([(name, pa.float64()) for name in outputs])
+        writer = pq.ParquetWriter(store, schema, compression='zstd')
+
+        def write(start, A):
+            writer.write_table(pa.Table.from_arrays([A[name] for name in outputs], schema=schema))
+
+    start = 0
+    try:
+        for block in _blocks(source, chunksize, columns, sep):
+            inputs = dict(constants, **block)
+            n = max(np.size(value) for value in inputs.values())
+            if n == 0:
+                continue
+
+            # copies of the block of each input as float arrays of n samples, since
+            # coare36vn_zrf_et changes some inputs in place
+            inputs = {name: np.array(np.broadcast_to(np.asarray(value, dtype=float), (n,))) for name, value in inputs.items()}
+            A = c36.coare36vn_zrf_et(**inputs, tol=tol, outputs=outputs, jit=jit)
+
+            write(start, A)
+            start += n
+    finally:
+        if writer is not None:
+            writer.close()
+
+    return start
+
+
+def _blocks(source, chunksize, columns, sep):
+
+    # Yields the blocks of the record as dicts of inputs keyed by input name
+    if isinstance(source, (str, os.PathLike)):
+        columns = dict(columns or {})
+        with pd.read_csv(source, sep=sep, chunksize=chunksize) as reader:
+            for frame in reader:
+                yield {name: frame[columns.get(name, name)].to_numpy(dtype=float) for name in c36.input_names
+                       if columns.get(name, name) in frame}
+
+    elif isinstance(source, dict):
+        arrays = {name: value for name, value in source.items() if np.ndim(value) > 0 and np.size(value) > 1}
+        values = {name: value for name, value in source.items() if name not in arrays}
+        n = max([len(value) for value in arrays.values()], default=1)
+        for start in range(0, n, chunksize):
+            yield dict(values, **{name: value[start:start + chunksize] for name, value in arrays.items()})
+
+    else:
+        yield from source
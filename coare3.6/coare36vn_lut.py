@@ -0,0 +1,252 @@
+"""
+Lookup tables of the COARE 3.6 transfer coefficients Cd, Ch and Ce, for fast approximate
+fluxes (e.g. model coupling tests and sensitivity sweeps over millions of cases).
+
+build_table runs coare36vn_zrf_et once over a grid of wind speed u, sea minus air
+temperature dT = ts - t and measurement height z (zu = zt = zq), with the other inputs
+set to fixed reference conditions, and stores Cd, Ch and Ce on the grid in a cache
+directory. transfer_coefficients then evaluates them anywhere by trilinear interpolation.
+
+This is only about 15 times faster than coare36vn_zrf_et (with or without jit), not the
+orders of magnitude of speedup that the tables were meant to give: the interpolation
+gathers 8 corners of 3 tables for every sample, which costs a sizeable fraction of the
+full solution.
+
+The error of the interpolation against the full solution is measured in each of the
+WIND_RANGES when the table is built (table['error']), and can be measured for other cases
+with table_error. With the default grids, the 99th percentile / maximum relative errors are
+  u >= 4 m/s:      0.5% / 1% for all three coefficients
+  2 <= u < 4 m/s:  3% / 33% (Cd) to 66% (Ch), the large errors in stable conditions
+                   (dT < -5 K) below 3 m/s
+  u < 2 m/s:       20% (Cd) to 80% (Ce) / up to 3000% (Ce)
+where the coefficients drop steeply with dT. Do not use the tables below 4 m/s where
+errors of more than a few percent matter.
+
+Example:
+    import coare36vn_lut as lut
+    table = lut.build_table()
+    Cd, Ch, Ce = lut.transfer_coefficients(u, ts - t, 10.0, table)
+    print(table['error']['Ce'][(4.0, 10.0)])
+"""
+
+import hashlib
+import os
+
+import numpy as np
+import coare36vn_zrf_et as c36
+
+# default grid of the tables: finer at low wind speeds and close to neutral, where the
+# coefficients change fastest, and evenly spaced in log(z)
+U_GRID  = np.concatenate([np.arange(0.25, 4, 0.125), np.arange(4, 10, 0.25), np.arange(10, 30.1, 0.5)])
+DT_GRID = np.concatenate([np.arange(-10, -2, 0.5), np.arange(-2, 2, 0.1), np.arange(2, 10.1, 0.5)])
+Z_GRID  = np.round(np.geomspace(2, 50, 30), 2)
+
+# reference conditions of the other inputs of coare36vn_zrf_et
+REFERENCE = dict(t=20.0, rh=80.0, P=1013.0, sw_dn=0.0, lw_dn=400.0, lat=45.0, zi=600.0, rain=0.0, Ss=35.0)
+
+COEFFICIENTS = ('Cd', 'Ch', 'Ce')
+
+# wind speed ranges (m/s) of the error of the tables, see table_error
+WIND_RANGES = ((0.0, 2.0), (2.0, 4.0), (4.0, 10.0), (10.0, np.inf))
+
+CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'coare36vn_lut')
+
+
+def build_table(u=None, dT=None, z=None, cache_dir=CACHE_DIR, **conditions):
+    """
+    Builds (or loads from the cache) the tables of Cd, Ch and Ce.
+
+    Args:
+        u, dT, z: increasing grids of wind speed (m/s), sea minus air temperature (K) and
+            measurement height (m). Default to U_GRID, DT_GRID and Z_GRID.
+        cache_dir (str): directory of the cached tables, created if it does not exist, or
+            None to always build the table. A table is stored under a name made from its
+            grids, its reference conditions and the source of coare36vn_zrf_et, so it is
+            built again when any of them changes.
+        **conditions: reference values of the other inputs, to replace those of REFERENCE,
+            e.g. t=5.0, rh=90.0.
+
+    Returns:
+        dict with the grids u, dT and z, the tables Cd, Ch and Ce (shape u x dT x z), and
+        error: the 99th percentile and maximum relative error of each coefficient in each
+        of the WIND_RANGES, against coare36vn_zrf_et (see table_error).
+    """
+
+    u  = np.asarray(U_GRID if u is None else u, dtype=float)
+    dT = np.asarray(DT_GRID if dT is None else dT, dtype=float)
+    z  = np.asarray(Z_GRID if z is None else z, dtype=float)
+
+    unknown = [name for name in conditions if name not in REFERENCE]
+    if unknown:
+        raise ValueError('unknown reference conditions: %s' % unknown)
+    conditions = dict(REFERENCE, **conditions)
+
+    path = None
+    if cache_dir is not None:
+        path = _cache_path(u, dT, z, conditions, cache_dir)
+        if os.path.exists(path):
+            with np.load(path) as data:
+                table = {name: data[name] for name in ('u', 'dT', 'z') + COEFFICIENTS}
+                table['error'] = _error_dict(data['error'])
+                table['conditions'] = conditions
+            return table
+
+    U, DT, Z = np.meshgrid(u, dT, z, indexing='ij')
+    A = _coefficients(U.ravel(), DT.ravel(), Z.ravel(), conditions)
+
+    table = dict(u=u, dT=dT, z=z, conditions=conditions)
+    for name in COEFFICIENTS:
+        table[name] = A[name].reshape(U.shape)
+    table['error'] = table_error(table)
+
+    if path is not None:
+        # write to a temporary file and move it into place, so a reader never sees a
+        # partial file
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp = '%s.%d.tmp.npz' % (path[:-4], os.getpid())
+        np.savez(tmp, u=u, dT=dT, z=z, error=_error_array(table['error']),
+                 **{name: table[name] for name in COEFFICIENTS})
+        os.replace(tmp, path)
+
+    return table
+
+
+def transfer_coefficients(u, dT, z, table=None):
+    """
+    Cd, Ch and Ce by trilinear interpolation of the tables.
+
+    Args:
+        u: wind speed (m/s) at height z.
+        dT: sea minus air temperature ts - t (K).
+        z: measurement height (m) of wind, temperature and humidity.
+        table: table of build_table, built with the default grids and reference
+            conditions if None.
+        u, dT and z are broadcast against each other. Values outside the grids are
+        clipped to their ends.
+
+    Returns:
+        Cd, Ch, Ce: arrays of the broadcast shape, relative to the wind speed at z, as
+        the Cd, Ch and Ce outputs of coare36vn_zrf_et.
+    """
+
+    if table is None:
+        table = build_table()
+
+    u, dT, z = np.broadcast_arrays(np.asarray(u, dtype=float), np.asarray(dT, dtype=float), np.asarray(z, dtype=float))
+    shape = u.shape
+
+    # cell index and weight of the upper corner along each axis
+    index, weight = [], []
+    for x, grid in [(u, table['u']), (dT, table['dT']), (z, table['z'])]:
+        i, w = _cell(x.ravel(), grid)
+        index.append(i)
+        weight.append(w)
+
+    # trilinear interpolation of each coefficient, as linear interpolations along z, then
+    # dT, then u between the values at the corners of the cell (np.take of the flat
+    # tables is much faster than fancy indexing)
+    nu, ndT, nz = table['Cd'].shape
+    flat = (index[0] * ndT + index[1]) * nz + index[2]
+    wu, wdT, wz = weight
+    out = []
+    for name in COEFFICIENTS:
+        values = table[name].ravel()
+        c = []
+        for corner in (0, nz, ndT * nz, (ndT + 1) * nz):
+            c0 = np.take(values, flat + corner)
+            c.append(c0 + wz * (np.take(values, flat + (corner + 1)) - c0))
+        c0 = c[0] + wdT * (c[1] - c[0])
+        c1 = c[2] + wdT * (c[3] - c[2])
+        out.append(c0 + wu * (c1 - c0))
+
+    return tuple(x.reshape(shape) for x in out)
+
+
+def table_error(table, n=10000, seed=0, ranges=WIND_RANGES):
+    """
+    Relative error of transfer_coefficients against coare36vn_zrf_et, at n random points
+    in each wind speed range (uniform within the range and the grids of the table, with its
+    reference conditions). The error grows steeply at low wind speeds, so it is reported
+    for each range rather than for the whole grid.
+
+    Returns:
+        dict keyed by coefficient name of dicts keyed by wind speed range (lo, hi) of the
+        (99th percentile, maximum) of |interpolated / full - 1|, (nan, nan) for a range
+        outside the grid.
+    """
+
+    rng = np.random.default_rng(seed)
+
+    error = {name: {} for name in COEFFICIENTS}
+    for lo, hi in ranges:
+        ulo, uhi = max(lo, table['u'][0]), min(hi, table['u'][-1])
+        if ulo >= uhi:
+            for name in COEFFICIENTS:
+                error[name][(lo, hi)] = (np.nan, np.nan)
+            continue
+
+        u = rng.uniform(ulo, uhi, n)
+        dT, z = [rng.uniform(table[name][0], table[name][-1], n) for name in ('dT', 'z')]
+
+        A = _coefficients(u, dT, z, table['conditions'])
+        approx = transfer_coefficients(u, dT, z, table)
+
+        for name, value in zip(COEFFICIENTS, approx):
+            rel = np.abs(value / A[name] - 1)
+            error[name][(lo, hi)] = (float(np.nanpercentile(rel, 99)), float(np.nanmax(rel)))
+    return error
+
+
+def _cell(x, grid):
+
+    # index i of the cell grid[i] <= x < grid[i + 1] of each x (clipped to the ends of
+    # grid) and the weight of grid[i + 1]. Instead of a binary search (np.searchsorted),
+    # the index is looked up in a map of the cells on a uniform grid with the smallest
+    # spacing of grid, so that each uniform step contains at most one node of grid and
+    # the index is at most one too small
+    h = np.min(np.diff(grid))
+    cells = np.searchsorted(grid, grid[0] + h * np.arange(int((grid[-1] - grid[0]) / h) + 1), side='right') - 1
+    x = np.clip(x, grid[0], grid[-1])
+    i = np.take(cells, ((x - grid[0]) * (1 / h)).astype(np.intp), mode='clip')
+    i = np.minimum(i, grid.size - 2)
+    i += x >= np.take(grid, i + 1)
+    i = np.minimum(i, grid.size - 2)
+    return i, (x - np.take(grid, i)) / (np.take(grid, i + 1) - np.take(grid, i))
+
+
+def _coefficients(u, dT, z, conditions):
+
+    # Cd, Ch and Ce of coare36vn_zrf_et for the samples u, dT, z at the reference conditions
+    n = np.size(u)
+    value = {name: np.full(n, float(x)) for name, x in conditions.items()}
+    z = np.array(z, dtype=float)
+    return c36.coare36vn_zrf_et(np.array(u, dtype=float), z.copy(), value['t'], z.copy(), value['rh'], z.copy(),
+                                value['P'], value['t'] + dT, value['sw_dn'], value['lw_dn'], value['lat'],
+                                np.zeros(n), np.zeros(n), value['zi'], value['rain'], value['Ss'],
+                                outputs=list(COEFFICIENTS))
+
+
+def _cache_path(u, dT, z, conditions, cache_dir):
+
+    # coare36vn_lut-<hash of the grids, conditions, error ranges and coare36vn_zrf_et source>.npz
+    key = hashlib.sha1()
+    for grid in (u, dT, z):
+        key.update(grid.tobytes())
+    key.update(repr(sorted(conditions.items())).encode())
+    key.update(repr(WIND_RANGES).encode())
+    with open(c36.__file__, 'rb') as f:
+        key.update(f.read())
+
+    return os.path.join(cache_dir, 'coare36vn_lut-%s.npz' % key.hexdigest())
+
+
+def _error_array(error):
+
+    # table_error dict as an array (coefficient x wind range x (p99, max)) for np.savez
+    return np.array([[error[name][r] for r in WIND_RANGES] for name in COEFFICIENTS])
+
+
+def _error_dict(error):
+
+    return {name: {r: tuple(float(x) for x in row) for r, row in zip(WIND_RANGES, rows)}
+            for name, rows in zip(COEFFICIENTS, error)}
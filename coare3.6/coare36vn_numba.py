@@ -0,0 +1,562 @@
+"""
+Compiled (Numba) version of the bulk loop of coare36vn_zrf_et, and of all of
+coare36vn_zrf_et for a few samples.
+
+bulk_loop runs all the passes of the bulk loop (see bulk_iteration in coare36vn_zrf_et)
+for one element at a time, with the variables of the element kept in registers instead
+of the temporary arrays of every step of every pass, and the elements are spread over
+the CPUs (numba.prange; NUMBA_NUM_THREADS sets the number of threads) when it is called
+from the main thread. The functions are compiled on first use and cached in __pycache__.
+
+coare_samples runs every step of coare36vn_zrf_et (inputs to outputs, including the bulk
+loop of bulk_loop) for one sample at a time, in about 6 microseconds per sample, where
+the NumPy code takes milliseconds whatever the number of samples.
+
+coare36vn_zrf_et uses its NumPy bulk loop by default, bulk_loop with jit=True and
+coare_samples with jit='samples' (both need Numba, available is True when it is
+installed). They agree to round-off (about 1e-13 relative on test_36_data.txt), so the
+output of a sample does not depend on the number of samples of the call only with the
+first two.
+
+List of functions in this code are:
+    ['bulk_loop',
+    'coare_samples',
+    'psit_26',
+    'psiu_26',
+    'psiu_40']
+"""
+import math
+import threading
+import numpy as np
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+available = numba is not None
+
+# names of the bulk loop variables returned by bulk_loop, as by bulk_iteration
+loop_names = ['usr','tsr','qsr','ut','charn','dT_skin','dz_skin','lw_net','gf','gust','dq_skin','zeta','L',
+              'zo','zot','zoq','tvsr','tvsr1','tssr','tssr1']
+
+# inputs of bulk_loop from the c dict of coare36vn_zrf_et that may differ
+# between elements, in the order of the arguments of _bulk_loop
+input_names = ['grav','zu','zt','zq','ta','Q','visa','ice','du','dT','dq','wetc','jcool','zi','rhoa','Le',
+               'sw_net','Al','be','bigc','ts','lw_dn','sigH','cp']
+
+# constants of the bulk loop from the c dict, in the order of the arguments of _bulk_loop
+constant_names = ['von','zos','fdg','Beta','cpa','cpw','rhow','visw','tcw','T2K','a1','a2','umax','Ad','Bd']
+
+
+def _njit(**options):
+
+    # numba.njit, or no compilation when Numba is not installed (the functions are
+    # then still defined, but coare36vn_zrf_et does not use them)
+    if numba is None:
+        return lambda f: f
+    return numba.njit(cache=True, **options)
+
+
+prange = range if numba is None else numba.prange
+
+# constants of the convective parts of the psi functions, as np.sqrt(3),
+# 4 * np.arctan(1) / np.sqrt(3) and 2 * np.arctan(1) in coare36vn_zrf_et
+_SQRT3 = math.sqrt(3)
+_PI_SQRT3 = 4 * math.atan(1) / math.sqrt(3)
+_PI_2 = 2 * math.atan(1)
+
+
+def bulk_loop(s, c, nits, tol=None, k50=None):
+    """
+    Runs the nits passes of the bulk loop of coare36vn_zrf_et for each element.
+
+    Args:
+        s: dict of the first guess of the variables updated by each pass (usr, tsr, qsr,
+            ut, charn, dT_skin, dz_skin and lw_net), arrays or single values.
+        c: dict of the inputs and constants of the bulk loop, as for bulk_iteration.
+        nits: number of passes.
+        tol: None for nits passes of every element, or the relative tolerance of usr,
+            tsr and qsr at which an element is done (see tol of coare36vn_zrf_et).
+        k50: boolean array of the elements (zetau > 50) that keep the usr, tsr, qsr, L,
+            zeta, dT_skin, dq_skin and dz_skin of the first pass, or None.
+
+    Returns:
+        dict of the arrays of loop_names, as returned by bulk_iteration after the last pass.
+    """
+
+    N = np.size(c['ta'])
+    shape = (N,)
+    # contiguous arrays of N elements (single values are repeated) in the
+    # precision of the calculation (float64, or float32 with the dtype option of
+    # coare36vn_zrf_et), so that the loop is only compiled for one type of each
+    # argument per precision. The steps themselves are always computed in float64
+    dtype = np.asarray(c['ta']).dtype
+    state = [np.ascontiguousarray(np.broadcast_to(np.asarray(s[name], dtype=dtype), shape)) for name in loop_names[:8]]
+    inputs = [np.ascontiguousarray(np.broadcast_to(np.asarray(c[name], dtype=dtype), shape)) for name in input_names]
+    constants = [float(c[name]) for name in constant_names]
+    if k50 is None:
+        k50 = np.zeros(N, dtype=bool)
+    k50 = np.ascontiguousarray(np.broadcast_to(np.asarray(k50, dtype=bool), shape))
+
+    # Numba's default (workqueue) threading layer can only run one parallel
+    # function at a time, so calls from other threads (e.g. the threaded dask
+    # scheduler of coare36vn_xr, which already runs blocks in parallel) use
+    # the serial loop
+    if threading.current_thread() is threading.main_thread():
+        loop = _bulk_loop_parallel
+    else:
+        loop = _bulk_loop_serial
+
+    out = np.empty((len(loop_names), N), dtype=dtype)
+    loop(out, *state, *inputs, *constants, k50, nits, tol is not None, 0.0 if tol is None else float(tol))
+
+    return dict(zip(loop_names, out))
+
+
+def coare_samples(x, albedo, tol=None):
+    """
+    Runs all of coare36vn_zrf_et for each sample in the compiled kernel, with the
+    variables of the sample in registers instead of one-element arrays: for a few
+    samples (e.g. one time step of a model, or the time steps of a warm layer record
+    that are recomputed) the setup of the NumPy arrays takes much longer than the
+    calculation itself.
+
+    Args:
+        x: array (21, N) of the inputs of coare36vn_zrf_et (u, zu, ..., zrf_q, see
+            input_names there) for each of the N samples, with NaN for missing cp and
+            sigH.
+        albedo: the Payne (1972) table of albedo_vector, as (payne_T, payne_alt,
+            payne_albedo) of coare36vn_zrf_et.
+        tol: as for coare36vn_zrf_et.
+
+    Returns:
+        array (N, 50) of the outputs of each sample, as the columns of A of
+        coare36vn_zrf_et.
+    """
+
+    x = np.ascontiguousarray(x, dtype=float)
+    out = np.empty((x.shape[1], 50))
+    _coare_samples(out, x, *albedo, tol is not None, 0.0 if tol is None else float(tol))
+    return out
+
+
+@_njit(parallel=True)
+def _bulk_loop_parallel(out, *args):
+
+    # all the elements, spread over the threads
+    for i in prange(out.shape[1]):
+        _bulk_element(i, out, *args)
+
+
+@_njit()
+def _bulk_loop_serial(out, *args):
+
+    # all the elements, one after the other
+    for i in range(out.shape[1]):
+        _bulk_element(i, out, *args)
+
+
+@_njit()
+def _bulk_element(i, out, usr, tsr, qsr, ut, charn, dT_skin, dz_skin, lw_net,
+                  grav, zu, zt, zq, ta, Q, visa, ice, du, dT, dq, wetc, jcool, zi, rhoa, Le,
+                  sw_net, Al, be, bigc, ts, lw_dn, sigH, cp,
+                  von, zos, fdg, Beta, cpa, cpw, rhow, visw, tcw, T2K, a1, a2, umax, Ad, Bd,
+                  k50, nits, adaptive, tol):
+
+    # _bulk_passes for element i, with its variables in the rows of out (loop_names)
+    values = _bulk_passes(usr[i], tsr[i], qsr[i], ut[i], charn[i], dT_skin[i], dz_skin[i], lw_net[i],
+                          grav[i], zu[i], zt[i], zq[i], ta[i], Q[i], visa[i], ice[i], du[i], dT[i], dq[i], wetc[i],
+                          jcool[i], zi[i], rhoa[i], Le[i], sw_net[i], Al[i], be[i], bigc[i], ts[i], lw_dn[i], sigH[i], cp[i],
+                          von, zos, fdg, Beta, cpa, cpw, rhow, visw, tcw, T2K, a1, a2, umax, Ad, Bd,
+                          k50[i], nits, adaptive, tol)
+    for k in range(len(values)):
+        out[k, i] = values[k]
+
+
+@_njit(error_model='numpy')
+def _bulk_passes(usr, tsr, qsr, ut, charn, dT_skin, dz_skin, lw_net,
+                 grav, zu, zt, zq, ta, Q, visa, ice, du, dT, dq, wetc, jcool, zi, rhoa, Le,
+                 sw_net, Al, be, bigc, ts, lw_dn, sigH, cp,
+                 von, zos, fdg, Beta, cpa, cpw, rhow, visw, tcw, T2K, a1, a2, umax, Ad, Bd,
+                 k50, nits, adaptive, tol):
+
+    # The same steps as bulk_iteration, for one element from its first guess of usr,
+    # tsr, qsr, ut, charn, dT_skin, dz_skin and lw_net. Returns the variables of
+    # loop_names. The ice roughness of Andreas (1987) is left out, since its rt and rq
+    # are not used there either
+    gf = gust = dq_skin = zeta = L = zo = zoq = tvsr = tvsr1 = tssr = tssr1 = np.nan
+    first = (usr, tsr, qsr, L, zeta, dT_skin, dq_skin, dz_skin)
+    sqrt_rho = math.sqrt(rhoa / rhow)
+    for it in range(nits):
+        usr_last, tsr_last, qsr_last = usr, tsr, qsr
+        zeta = von * grav * zu / ta * (tsr + 0.61 * ta * qsr) / (usr ** 2)
+        L = zu / zeta
+        zo = charn * usr ** 2.0 / grav + 0.11 * visa / usr
+        if ice != 0:
+            zo = zos
+        rr = zo * usr / visa
+        zoq = 5.8e-05 / rr ** 0.72
+        if zoq > 0.00016:
+            zoq = 0.00016
+        cdhf = von / (math.log(zu / zo) - psiu_26(zu / L))
+        cqhf = von * fdg / (math.log(zq / zoq) - psit_26(zq / L))
+        # zot = zoq, so cthf is cqhf when t and rh are measured at the same height
+        if zt == zq:
+            cthf = cqhf
+        else:
+            cthf = von * fdg / (math.log(zt / zoq) - psit_26(zt / L))
+        usr = ut * cdhf
+        qsr = - (dq - wetc * dT_skin * jcool) * cqhf
+        tsr = - (dT - dT_skin * jcool) * cthf
+        tvsr1 = tsr + 0.61 * ta * qsr
+        tssr1 = tsr + 0.51 * ta * qsr
+        tvsr = tsr * (1 + 0.61 * Q) + 0.61 * ta * qsr
+        tssr = tsr * (1 + 0.51 * Q) + 0.51 * ta * qsr
+        Bf = - grav / ta * usr * tvsr
+        gust = 0.2
+        if Bf > 0:
+            gust = Beta * (Bf * zi) ** 0.333
+        ut = math.sqrt(du ** 2 + gust ** 2)
+        gf = ut / du
+        hsb = - rhoa * cpa * usr * tsr
+        hlb = - rhoa * Le * usr * qsr
+        qout = lw_net + hsb + hlb
+        dels = sw_net * (0.065 + 11 * dz_skin - 6.6e-05 / dz_skin * (1 - math.exp(- dz_skin / 0.0008)))
+        qcol = qout - dels
+        alq = Al * qcol + be * hlb * cpw / Le
+        dz_skin = 6.0 * visw / (sqrt_rho * usr)
+        if dz_skin > 0.01:
+            dz_skin = 0.01
+        if alq > 0:
+            xlamx = 6.0 / (1 + (bigc * alq / usr ** 4) ** 0.75) ** 0.333
+            dz_skin = xlamx * visw / (sqrt_rho * usr)
+        dT_skin = qcol * dz_skin / tcw
+        dq_skin = wetc * dT_skin
+        lw_net = 0.97 * (5.67e-08 * (ts - dT_skin * jcool + T2K) ** 4 - lw_dn)
+        u10N = usr / von / gf * math.log(10.0 / zo)
+        charn = a1 * u10N + a2
+        if u10N > umax:
+            charn = a1 * umax + a2
+        if not np.isnan(cp):
+            charn = sigH * Ad * (usr / cp) ** Bd * grav / usr / usr
+        if it == 0:
+            first = (usr, tsr, qsr, L, zeta, dT_skin, dq_skin, dz_skin)
+        elif adaptive:
+            # done once usr, tsr and qsr changed by less than tol (NaN is done)
+            if not (abs(usr - usr_last) > tol * abs(usr) or abs(tsr - tsr_last) > tol * abs(tsr)
+                    or abs(qsr - qsr_last) > tol * abs(qsr)):
+                break
+
+    # first pass solution for the elements with zetau > 50
+    if k50:
+        usr, tsr, qsr, L, zeta, dT_skin, dq_skin, dz_skin = first
+
+    return (usr, tsr, qsr, ut, charn, dT_skin, dz_skin, lw_net, gf, gust,
+            dq_skin, zeta, L, zo, zoq, zoq, tvsr, tvsr1, tssr, tssr1)
+
+
+@_njit(error_model='numpy')
+def _coare_samples(out, x, albedo_T, albedo_alt, albedo, adaptive, tol):
+
+    # all the samples, one after the other
+    for i in range(x.shape[1]):
+        values = _coare_sample(x[0, i], x[1, i], x[2, i], x[3, i], x[4, i], x[5, i], x[6, i], x[7, i], x[8, i],
+                               x[9, i], x[10, i], x[11, i], x[12, i], x[13, i], x[14, i], x[15, i], x[16, i],
+                               x[17, i], x[18, i], x[19, i], x[20, i], albedo_T, albedo_alt, albedo, adaptive, tol)
+        for k in range(len(values)):
+            out[i, k] = values[k]
+
+
+@_njit(error_model='numpy')
+def _coare_sample(u, zu, t, zt, rh, zq, P, ts, sw_dn, lw_dn, lat, lon, jd, zi, rain, Ss, cp, sigH,
+                  zrf_u, zrf_t, zrf_q, albedo_T, albedo_alt, albedo, adaptive, tol):
+
+    # The steps of coare36vn_zrf_et for one sample, in the same order, returning the
+    # columns of its output A. As there, ts is set to the freezing point Tf under ice
+    # (after Le and Qs), and sigH is parameterized from cp when it is missing
+    jcool = 1.0
+    us = 0 * u
+    Tf = - 0.0575 * Ss + 0.00171052 * Ss ** 1.5 - 0.0002154996 * Ss * Ss
+    es = (1 - 0.02 * Ss / 35) * _bucksat(ts, P, Tf)
+    Qs = 622 * es / (P - 0.378 * es) / 1000
+    P_tq = P - (0.125 * zt)
+    Pv = 0.01 * rh * _bucksat(t, P_tq, 0.0)
+    Q = 622 * Pv / (P_tq - 0.378 * Pv) / 1000
+
+    ice = ts < Tf
+    if ice:
+        jcool = 0.0
+    zos = 0.0005
+    zref = 10
+    Beta = 1.2
+    von = 0.4
+    fdg = 1.0
+    T2K = 273.16
+    phi = lat * np.pi / 180
+    s = math.sin(phi)
+    grav = 9.7803267715 * (1 + 0.0052790414 * s ** 2 + 2.32718e-05 * s ** 4 + 1.262e-07 * s ** 6 + 7e-10 * s ** 8)
+    Rgas = 287.1
+    Le = (2.501 - 0.00237 * ts) * 1000000.0
+    cpa = 1004.67
+    rhoa = P_tq * 100.0 / (Rgas * (t + T2K) * (1 + 0.61 * Q))
+    visa = 1.326e-05 * (1 + 0.006542 * t + 8.301e-06 * t ** 2 - 4.84e-09 * t ** 3)
+    lapse = grav / cpa
+
+    if ts < Tf:
+        ts = Tf
+    tsw = ts
+    Al35 = 2.1e-05 * (tsw + 3.2) ** 0.79
+    Al0 = (2.2 * (tsw - 1) ** 0.82 - 5) * 1e-05
+    Al = Al0 + (Al35 - Al0) * Ss / 35
+    bets = 0.00075
+    be = bets * Ss
+    cpw = 4000.0
+    rhow = 1022.0
+    visw = 1e-06
+    tcw = 0.6
+    bigc = 16 * grav * cpw * (rhow * visw) ** 3.0 / (tcw ** 2 * rhoa ** 2)
+    wetc = 0.622 * Le * Qs / (Rgas * (ts + T2K) ** 2)
+
+    alb = _albedo(sw_dn, jd, - lon, lat, albedo_T, albedo_alt, albedo)
+    sw_net = (1 - alb) * sw_dn
+    lw_net = 0.97 * (5.67e-08 * (ts - 0.3 * jcool + T2K) ** 4 - lw_dn)
+
+    # first guess
+    du = u - us
+    dT = ts - t - lapse * zt
+    dq = Qs - Q
+    ta = t + T2K
+    gust = 0.5
+    dT_skin = 0.3
+    ut = math.sqrt(du ** 2 + gust ** 2)
+    u10 = ut * math.log(10 / 0.0001) / math.log(zu / 0.0001)
+    usr = 0.035 * u10
+    zo10 = 0.011 * usr ** 2.0 / grav + 0.11 * visa / usr
+    Cd10 = (von / math.log(10.0 / zo10)) ** 2
+    Ch10 = 0.00115
+    Ct10 = Ch10 / math.sqrt(Cd10)
+    zot10 = 10.0 / math.exp(von / Ct10)
+    Cd = (von / math.log(zu / zo10)) ** 2
+    Ct = von / math.log(zt / zot10)
+    CC = von * Ct / Cd
+    Ribcu = - zu / zi / 0.004 / Beta ** 3
+    Ribu = - grav * zu / ta * ((dT - dT_skin * jcool) + 0.61 * ta * dq) / ut ** 2
+    zetau = CC * Ribu * (1 + 27 / 9 * Ribu / CC)
+    k50 = zetau > 50
+    if Ribu < 0:
+        zetau = CC * Ribu / (1 + Ribu / Ribcu)
+    L10 = zu / zetau
+    usr = ut * von / (math.log(zu / zo10) - psiu_40(zu / L10))
+    tsr = - (dT - dT_skin * jcool) * von * fdg / (math.log(zt / zot10) - psit_26(zt / L10))
+    qsr = - (dq - wetc * dT_skin * jcool) * von * fdg / (math.log(zq / zot10) - psit_26(zq / L10))
+    dz_skin = 0.001
+
+    umax = 19.0
+    a1 = 0.0017
+    a2 = - 0.005
+    charnC = a1 * u10 + a2
+    if u10 > umax:
+        charnC = a1 * umax + a2
+    hsig = (0.02 * (cp / u10) ** 1.1 - 0.0025) * u10 ** 2
+    if hsig < 0.25:
+        hsig = 0.25
+    if not np.isnan(cp) and np.isnan(sigH):
+        sigH = hsig
+    Ad = 0.2
+    Bd = 2.2
+    zoS = sigH * Ad * (usr / cp) ** Bd
+    charnS = zoS * grav / usr / usr
+    nits = 10
+    charn = charnC
+    if not np.isnan(cp):
+        charn = charnS
+
+    # bulk loop
+    (usr, tsr, qsr, ut, charn, dT_skin, dz_skin, lw_net, gf, gust, dq_skin, zeta, L, zo, zot, zoq,
+     tvsr, tvsr1, tssr, tssr1) = _bulk_passes(usr, tsr, qsr, ut, charn, dT_skin, dz_skin, lw_net,
+                                              grav, zu, zt, zq, ta, Q, visa, ice, du, dT, dq, wetc, jcool, zi,
+                                              rhoa, Le, sw_net, Al, be, bigc, ts, lw_dn, sigH, cp,
+                                              von, zos, fdg, Beta, cpa, cpw, rhow, visw, tcw, T2K, a1, a2, umax,
+                                              Ad, Bd, k50, nits, adaptive, tol)
+
+    # fluxes and transfer coefficients
+    tau = rhoa * usr * usr / gf
+    hsb = - rhoa * cpa * usr * tsr
+    hlb = - rhoa * Le * usr * qsr
+    hbb = - rhoa * cpa * usr * tvsr
+    hsbb = - rhoa * cpa * usr * tssr
+    wbar = 1.61 * hlb / Le / (1 + 1.61 * Q) / rhoa + hsb / rhoa / cpa / ta
+    hlwebb = rhoa * wbar * Q * Le
+    Evap = 1000 * hlb / Le / 1000 * 3600
+    Cd = tau / rhoa / ut / (0.1 if du < 0.1 else du)
+    Ch = - usr * tsr / ut / (dT - dT_skin * jcool)
+    Ce = - usr * qsr / (dq - dq_skin * jcool) / ut
+    Cdn_10 = von ** 2.0 / math.log(10.0 / zo) ** 2
+    Chn_10 = von ** 2.0 * fdg / math.log(10.0 / zo) / math.log(10.0 / zot)
+    Cen_10 = von ** 2.0 * fdg / math.log(10.0 / zo) / math.log(10.0 / zoq)
+
+    # profiles at zu, 10 m and the reference heights
+    psi = psiu_26(zu / L)
+    psi10 = psiu_26(10.0 / L)
+    psirf = psiu_26(zrf_u / L)
+    psiT = psit_26(zt / L)
+    psi10T = psit_26(10.0 / L)
+    psirfT = psit_26(zrf_t / L)
+    psirfQ = psit_26(zrf_q / L)
+    gf = ut / du
+    S10 = ut + usr / von * (math.log(10.0 / zu) - psi10 + psi)
+    U10 = S10 / gf
+    Urf = du + usr / von / gf * (math.log(zrf_u / zu) - psirf + psi)
+    UN = du + psi * usr / von / gf
+    U10N = U10 + psi10 * usr / von / gf
+    UrfN = Urf + psirf * usr / von / gf
+
+    dwat = 2.11e-05 * ((t + T2K) / T2K) ** 1.94
+    dtmp = (1.0 + 0.003309 * t - 1.44e-06 * t * t) * 0.02411 / (rhoa * cpa)
+    dqs_dt = Q * Le / (Rgas * (t + T2K) ** 2)
+    alfac = 1.0 / (1 + 0.622 * (dqs_dt * Le * dwat) / (cpa * dtmp))
+    hrain = rain * alfac * cpw * ((ts - t - dT_skin * jcool) + (Qs - Q - dq_skin * jcool) * Le / cpa) / 3600
+
+    P10 = P - (0.125 * 10)
+    Prf = P - (0.125 * zref)
+    T10 = t + tsr / von * (math.log(10.0 / zt) - psi10T + psiT) + lapse * (zt - 10)
+    Trf = t + tsr / von * (math.log(zrf_t / zt) - psirfT + psiT) + lapse * (zt - zrf_t)
+    T10N = T10 + psi10T * tsr / von
+    TrfN = Trf + psirfT * tsr / von
+    dq_skin = wetc * dT_skin * jcool
+    Qs = Qs - dq_skin
+    dq_skin = dq_skin * 1000
+    Qs = Qs * 1000
+    Q = Q * 1000
+    Q10 = Q + 1000.0 * qsr / von * (math.log(10.0 / zq) - psi10T + psiT)
+    Qrf = Q + 1000.0 * qsr / von * (math.log(zrf_q / zq) - psirfQ + psiT)
+    Q10N = Q10 + psi10T * 1000.0 * qsr / von
+    QrfN = Qrf + psirfQ * 1000.0 * qsr / von
+    RHrf = _rhcalc(Trf, Prf, Qrf / 1000, Tf)
+    RH10 = _rhcalc(T10, P10, Q10 / 1000, Tf)
+    rhoa10 = P10 * 100.0 / (Rgas * (T10 + T2K) * (1 + 0.61 * (Q10 / 1000)))
+
+    # wave breaking statistics
+    wc_frac = 0.00073 * (U10N - 2) ** 1.43
+    if U10 < 2.1:
+        wc_frac = 1e-05
+    if np.isfinite(cp):
+        wc_frac = 0.0016 * U10N ** 1.1 / math.sqrt(cp / U10N)
+    Edis = 0.095 * rhoa * U10N * usr ** 2
+    if ice:
+        wc_frac = 0.0
+        Edis = 0.0
+
+    dT_skinx = dT_skin * jcool
+    dq_skinx = dq_skin * jcool
+    if np.isnan(u):
+        gust = dz_skin = zot = zoq = np.nan
+    lw_net = - lw_net
+
+    return (usr, tau, hsb, hlb, hbb, hsbb, hlwebb, tsr, qsr, zo, zot, zoq, Cd, Ch, Ce, L, zeta,
+            dT_skinx, dq_skinx, dz_skin, Urf, Trf, Qrf, RHrf, UrfN, TrfN, QrfN, lw_net, sw_net, Le,
+            rhoa, UN, U10, U10N, Cdn_10, Chn_10, Cen_10, hrain, Qs, Evap, T10, T10N, Q10, Q10N,
+            RH10, P10, rhoa10, gust, wc_frac, Edis)
+
+
+@_njit()
+def _bucksat(T, P, Tf):
+    # saturation vapor pressure [mb], as bucksat of coare36vn_zrf_et
+    if T < Tf:
+        return (1.0003 + 4.18e-06 * P) * 6.1115 * math.exp(22.452 * T / (T + 272.55))
+    return 6.1121 * math.exp(17.502 * T / (T + 240.97)) * (1.0007 + 3.46e-06 * P)
+
+
+@_njit()
+def _rhcalc(T, P, Q, Tf):
+    # relative humidity, as RHcalc of coare36vn_zrf_et
+    if T < Tf:
+        es = 6.1115 * math.exp(22.452 * T / (T + 272.55)) * (1.0003 + 4.18e-06 * P)
+    else:
+        es = 6.1121 * math.exp(17.502 * T / (T + 240.97)) * (1.0007 + 3.46e-06 * P)
+    em = Q * P / (0.378 * Q + 0.622)
+    return 100 * em / es
+
+
+@_njit(error_model='numpy')
+def _albedo(sw_dn, jd, lon, lat, Ts, As, a):
+    # albedo of albedo_vector (lon positive to the west), with the nearest bins of the
+    # table as nearest_bin
+    lat = lat * np.pi / 180
+    lon = lon * np.pi / 180
+    utc = (jd - np.trunc(jd)) * 24
+    h = np.pi * utc / 12 - lon
+    declination = 23.45 * math.cos(2 * np.pi * (jd - 173) / 365.25)
+    sd = declination * np.pi / 180
+    sinpsi = math.sin(lat) * math.sin(sd) - math.cos(lat) * math.cos(sd) * math.cos(h)
+    psi = math.asin(sinpsi) * 180 / np.pi
+    solarmax = 1380 * sinpsi
+    T = sw_dn / solarmax
+    if T > 2:
+        T = 2.0
+    if psi < 0:
+        return 0.0
+    if np.isnan(T + psi):
+        return np.nan
+    return a[_nearest_bin(Ts, T), _nearest_bin(As, psi)]
+
+
+@_njit()
+def _nearest_bin(bins, x):
+    # index of the bin nearest to x (not NaN), as nearest_bin of coare36vn_zrf_et
+    n = bins.size
+    step = (bins[n - 1] - bins[0]) / (n - 1)
+    k = int(min(max(np.floor((x - bins[0]) / step), 0), n - 2))
+    if abs(bins[k + 1] - x) < abs(bins[k] - x):
+        k += 1
+    return k
+
+
+@_njit()
+def psit_26(zeta):
+    # computes temperature structure function, for a single zeta
+    if zeta < 0:
+        x = (1 - 15 * zeta) ** 0.5
+        psik = 2 * math.log((1 + x) / 2)
+        x = (1 - 34.15 * zeta) ** 0.3333
+        psic = 1.5 * math.log((1 + x + x ** 2) / 3) - _SQRT3 * math.atan((1 + 2 * x) / _SQRT3) + _PI_SQRT3
+        f = zeta ** 2.0 / (1 + zeta ** 2)
+        return (1 - f) * psik + f * psic
+    dzeta = min(50, 0.35 * zeta)
+    return - ((1 + 0.6667 * zeta) ** 1.5 + 0.6667 * (zeta - 14.28) * math.exp(- dzeta) + 8.525)
+
+
+@_njit()
+def psiu_26(zeta):
+    # computes velocity structure function, for a single zeta
+    if zeta < 0:
+        x = (1 - 15 * zeta) ** 0.25
+        psik = 2 * math.log((1 + x) / 2) + math.log((1 + x * x) / 2) - 2 * math.atan(x) + _PI_2
+        x = (1 - 10.15 * zeta) ** 0.3333
+        psic = 1.5 * math.log((1 + x + x ** 2) / 3) - _SQRT3 * math.atan((1 + 2 * x) / _SQRT3) + _PI_SQRT3
+        f = zeta ** 2.0 / (1 + zeta ** 2)
+        return (1 - f) * psik + f * psic
+    dzeta = min(50, 0.35 * zeta)
+    a = 0.7
+    b = 3 / 4
+    c = 5
+    d = 0.35
+    return - (a * zeta + b * (zeta - c / d) * math.exp(- dzeta) + b * c / d)
+
+
+@_njit()
+def psiu_40(zeta):
+    # computes velocity structure function of the first guess, for a single zeta
+    if zeta < 0:
+        x = (1 - 18 * zeta) ** 0.25
+        psik = 2 * math.log((1 + x) / 2) + math.log((1 + x * x) / 2) - 2 * math.atan(x) + _PI_2
+        x = (1 - 10 * zeta) ** 0.3333
+        psic = 1.5 * math.log((1 + x + x ** 2) / 3) - _SQRT3 * math.atan((1 + 2 * x) / _SQRT3) + _PI_SQRT3
+        f = zeta ** 2.0 / (1 + zeta ** 2)
+        return (1 - f) * psik + f * psic
+    dzeta = min(50, 0.35 * zeta)
+    b = 3 / 4
+    c = 5
+    d = 0.35
+    return - (zeta + b * (zeta - c / d) * math.exp(- dzeta) + b * c / d)
@@ -0,0 +1,161 @@
+"""
+Parallel (multi-process) version of the COARE 3.6 bulk flux function coare36vn_zrf_et,
+for large sets of independent samples (without the warm layer, the samples do not depend
+on each other).
+
+The array inputs are copied once into a block of shared memory, and the outputs are
+written by the worker processes straight into another one, so that only the names of the
+shared memory blocks and the index ranges of the blocks of samples are sent to the
+workers, instead of pickled arrays. Each worker runs coare36vn_zrf_et on contiguous blocks
+of samples, so the run time scales with the number of processes up to the number of
+CPUs.
+
+Example:
+    import coare36vn_parallel as c36p
+    A = c36p.coare36vn_zrf_et_parallel(u, zu, t, zt, rh, zq, P, ts, sw_dn, lw_dn, lat, lon, jd,
+                                       zi, rain, Ss, processes=8)
+
+On Windows and macOS (where new processes are spawned, not forked), call it from under
+if __name__ == '__main__'.
+"""
+
+import concurrent.futures
+import multiprocessing
+import os
+from multiprocessing import shared_memory
+
+import numpy as np
+import coare36vn_numba
+import coare36vn_zrf_et as c36
+
+# blocks of samples per process when blocksize is not given, so that processes that
+# finish early take more blocks
+BLOCKS_PER_PROCESS = 4
+
+
+def coare36vn_zrf_et_parallel(u, zu, t, zt, rh, zq, P, ts, sw_dn, lw_dn, lat, lon, jd, zi, rain, Ss, cp=None, sigH=None, zrf_u=10.0, zrf_t=10.0, zrf_q=10.0, tol=None, outputs=None, jit=None, dtype=None, processes=None, blocksize=None, pool=None):
+    """
+    Runs coare36vn_zrf_et on blocks of the samples in parallel processes.
+
+    Args:
+        u, zu, t, ..., zrf_q, tol, outputs, jit, dtype: as for coare36vn_zrf_et. The
+            inputs are not changed.
+        processes (int): number of worker processes, os.cpu_count() by default. With 1
+            (and no pool), coare36vn_zrf_et is run in this process.
+        blocksize (int): number of samples per block, by default the samples split into
+            BLOCKS_PER_PROCESS blocks per process.
+        pool: a concurrent.futures.ProcessPoolExecutor to run the blocks in (e.g. to use
+            the same worker processes for many calls; processes should then be its number
+            of workers, and see pool_context), or None to start one for this call.
+
+    Returns:
+        A: as returned by coare36vn_zrf_et for all the samples.
+    """
+
+    values = dict(zip(c36.input_names, [u, zu, t, zt, rh, zq, P, ts, sw_dn, lw_dn, lat, lon, jd, zi, rain, Ss, cp, sigH,
+                                        zrf_u, zrf_t, zrf_q]))
+    options = dict(tol=tol, outputs=outputs, jit=jit, dtype=dtype)
+    N = max(np.size(value) for value in values.values() if value is not None)
+
+    if processes is None:
+        processes = os.cpu_count()
+    if (processes == 1 and pool is None) or N <= 1:
+        return c36.coare36vn_zrf_et(**{name: np.copy(value) if np.ndim(value) else value for name, value in values.items()},
+                                    **options)
+
+    # arrays of the N samples go to shared memory, single values (and None) are sent as
+    # they are
+    arrays = [name for name, value in values.items() if value is not None and np.size(value) > 1]
+    wrong = [name for name in arrays if np.size(values[name]) != N]
+    if wrong:
+        raise ValueError('inputs %s do not have %d samples' % (wrong, N))
+    constants = {name: value if value is None else np.asarray(value).item() for name, value in values.items()
+                 if name not in arrays}
+
+    # the output of coare36vn_zrf_et for N samples: float columns, or a structured array
+    # with one field per output
+    ftype = np.dtype(float if dtype is None else dtype)
+    if outputs is None:
+        out_dtype, out_shape = ftype, (N, len(c36.output_names))
+    else:
+        out_dtype, out_shape = np.dtype([(name, ftype) for name in outputs]), (N,)
+
+    if blocksize is None:
+        blocksize = -(-N // (processes * BLOCKS_PER_PROCESS))
+    blocks = [(start, min(start + blocksize, N)) for start in range(0, N, blocksize)]
+
+    shm_in = shared_memory.SharedMemory(create=True, size=max(1, len(arrays) * N * ftype.itemsize))
+    shm_out = shared_memory.SharedMemory(create=True, size=int(np.prod(out_shape)) * out_dtype.itemsize)
+    try:
+        x = np.ndarray((len(arrays), N), dtype=ftype, buffer=shm_in.buf)
+        for i, name in enumerate(arrays):
+            x[i] = np.ravel(values[name])
+        del x
+
+        tasks = [(shm_in.name, shm_out.name, arrays, N, ftype.str, out_dtype.descr, out_shape, start, stop, constants, options)
+                 for start, stop in blocks]
+        if pool is None:
+            with concurrent.futures.ProcessPoolExecutor(min(processes, len(blocks)), mp_context=pool_context()) as executor:
+                list(executor.map(_run_block, tasks))
+        else:
+            list(pool.map(_run_block, tasks))
+
+        A = np.array(np.ndarray(out_shape, dtype=out_dtype, buffer=shm_out.buf))
+    finally:
+        shm_in.close()
+        shm_in.unlink()
+        shm_out.close()
+        shm_out.unlink()
+
+    return A
+
+
+def pool_context():
+    """
+    The multiprocessing context of the worker processes: 'forkserver' where it is
+    available (Linux, macOS), with this module loaded in the server, so that the workers
+    start quickly but are not forked from a process that may already run the threads of
+    the compiled bulk loop (forking those deadlocks), and the default context otherwise.
+    Also to start a pool for many calls, e.g.
+    concurrent.futures.ProcessPoolExecutor(8, mp_context=pool_context()).
+    """
+
+    if 'forkserver' not in multiprocessing.get_all_start_methods():
+        return None
+    context = multiprocessing.get_context('forkserver')
+    context.set_forkserver_preload([__name__])
+    return context
+
+
+def _run_block(task):
+
+    # Runs coare36vn_zrf_et in a worker process on the samples start:stop, reading its
+    # inputs from and writing its outputs to the shared memory blocks
+    in_name, out_name, arrays, N, ftype, out_descr, out_shape, start, stop, constants, options = task
+    _single_threaded()
+
+    shm_in = shared_memory.SharedMemory(name=in_name)
+    shm_out = shared_memory.SharedMemory(name=out_name)
+    try:
+        x = np.ndarray((len(arrays), N), dtype=ftype, buffer=shm_in.buf)
+        # copies, since coare36vn_zrf_et changes some of its inputs in place
+        inputs = {name: np.array(x[i, start:stop]) for i, name in enumerate(arrays)}
+        del x
+        A = c36.coare36vn_zrf_et(**inputs, **constants, **options)
+
+        out = np.ndarray(out_shape, dtype=np.dtype(out_descr), buffer=shm_out.buf)
+        out[start:stop] = A
+        del out
+    finally:
+        shm_in.close()
+        shm_out.close()
+
+    return stop - start
+
+
+def _single_threaded():
+
+    # The processes already use all the CPUs, so the compiled bulk loop of each runs on
+    # one thread (instead of NUMBA_NUM_THREADS threads per process)
+    if coare36vn_numba.available and coare36vn_numba.numba.get_num_threads() != 1:
+        coare36vn_numba.numba.set_num_threads(1)
@@ -0,0 +1,83 @@
+"""
+xarray interface to the COARE 3.6 bulk flux function coare36vn_zrf_et, for gridded
+fields such as ERA5 reanalysis (time x lat x lon).
+
+The inputs are DataArrays (or single values) that are broadcast against each other by
+dimension name, and the calculation is mapped over the blocks of the broadcast arrays
+with xr.apply_ufunc. With dask backed inputs (e.g. from xr.open_mfdataset(..., chunks=...))
+the result is lazy and each chunk is computed separately, in parallel and out of core,
+when the Dataset is computed or written with to_netcdf/to_zarr.
+
+Example, with ERA5 fields converted to the COARE input units first (degC, mb, W/m^2,
+mm/hr, % relative humidity):
+    import coare36vn_xr as c36xr
+    A = c36xr.coare36vn_zrf_et_xr(ws10, 10.0, t2m, 2.0, rh, 2.0, msl, sst, ssrd, strd,
+                                  ds.latitude, ds.longitude, None, 600.0, tp, 35.0)
+    A[['tau', 'hsb', 'hlb']].to_netcdf('fluxes.nc')
+"""
+
+import numpy as np
+import xarray as xr
+import coare36vn_zrf_et as c36
+
+# input names of coare36vn_zrf_et, in order
+input_names = c36.input_names
+
+
+def coare36vn_zrf_et_xr(u, zu, t, zt, rh, zq, P, ts, sw_dn, lw_dn, lat, lon, jd, zi, rain, Ss, cp=None, sigH=None, zrf_u=10.0, zrf_t=10.0, zrf_q=10.0, tol=None, outputs=None):
+    """
+    Runs coare36vn_zrf_et on DataArray inputs of any shape and returns the outputs as a
+    Dataset with one variable per output column (see c36.output_names), with the dimensions
+    of the broadcast inputs.
+
+    Args:
+        u, zu, t, ..., zrf_q: as for coare36vn_zrf_et, each a DataArray or a single value.
+            Inputs are aligned and broadcast by dimension name, so e.g. lat and lon can be
+            the 1-D coordinates of a lat x lon grid.
+        jd: year day (Jan 1 00:00 UTC = 0). If None, it is computed from the 'time'
+            coordinate of u.
+        tol: convergence tolerance of the bulk loop, see coare36vn_zrf_et.
+        outputs: list of output names to compute (see c36.output_names), e.g.
+            ['tau', 'hsb', 'hlb']. Defaults to all of them.
+
+    Returns:
+        xr.Dataset with the variables usr, tau, hsb, hlb, ..., Edis (or only those in
+        outputs). Lazy (dask) if any
+        input is a dask array.
+    """
+
+    if jd is None:
+        time = u['time']
+        jd = time.dt.dayofyear - 1 + (time - time.dt.floor('D')) / np.timedelta64(1, 'D')
+
+    values = [u, zu, t, zt, rh, zq, P, ts, sw_dn, lw_dn, lat, lon, jd, zi, rain, Ss, cp, sigH, zrf_u, zrf_t, zrf_q]
+    given  = [(name, value) for name, value in zip(input_names, values) if value is not None]
+
+    outputs = list(c36.output_names if outputs is None else outputs)
+    n_out = len(outputs)
+    out = xr.apply_ufunc(_coare_block, *[value for name, value in given],
+                         kwargs={'names': [name for name, value in given], 'tol': tol, 'outputs': outputs},
+                         output_core_dims=[[]] * n_out,
+                         dask='parallelized', output_dtypes=[float] * n_out)
+
+    if n_out == 1:
+        out = (out,)
+
+    return xr.Dataset(dict(zip(outputs, out)))
+
+
+def _coare_block(*arrays, names, tol, outputs):
+
+    # Runs coare36vn_zrf_et on one block: the inputs are broadcast to the block shape and
+    # flattened (as copies, since coare36vn_zrf_et changes some inputs in place), and each
+    # requested output is reshaped back to the block shape
+    shape = np.broadcast_shapes(*[np.shape(a) for a in arrays])
+
+    if np.prod(shape, dtype=int) == 0:
+        out = tuple(np.empty(shape) for name in outputs)
+    else:
+        inputs = {name: np.array(np.broadcast_to(a, shape), dtype=float).ravel() for name, a in zip(names, arrays)}
+        A = c36.coare36vn_zrf_et(**inputs, tol=tol, outputs=outputs)
+        out = tuple(A[name].reshape(shape) for name in outputs)
+
+    return out if len(out) > 1 else out[0]
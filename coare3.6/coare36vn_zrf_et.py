@@ -11,21 +11,58 @@ List of functions in this code are:
     ['RHcalc',
     'albedo_vector',
     'bucksat',
+    'bulk_iteration',
     'coare36vn_zrf_et',
     'grv',
+    'nearest_bin',
+    'psi_convective',
+    'psi_heights',
     'psit_26',
     'psiu_26',
     'psiu_40',
+    'psiu_stable',
     'qsat26air',
-    'qsat26sea']
+    'qsat26sea',
+    'take']
 
 ludovic Bariteau, CU/CIRES, NOAA/ESRL/PSL
 v1: August 2022
 """
 import numpy as np
 import os
-    
-def coare36vn_zrf_et(u, zu , t, zt, rh, zq, P, ts, sw_dn, lw_dn, lat, lon,jd, zi,rain, Ss, cp=None, sigH=None, zrf_u=10.0, zrf_t=10.0, zrf_q=10.0):   
+import coare36vn_numba
+
+# names of the inputs of coare36vn_zrf_et, in order (see INPUTS)
+input_names = ['u','zu','t','zt','rh','zq','P','ts','sw_dn','lw_dn','lat','lon','jd','zi','rain','Ss',
+               'cp','sigH','zrf_u','zrf_t','zrf_q']
+
+# names of the columns of the coare36vn_zrf_et output, in order (see OUTPUTS)
+output_names = ['usr','tau','hsb','hlb','hbb','hsbb','hlwebb','tsr','qsr','zo','zot','zoq','Cd','Ch','Ce','L','zeta',
+                'dT_skinx','dq_skinx','dz_skin','Urf','Trf','Qrf','RHrf','UrfN','TrfN','QrfN','lw_net','sw_net','Le',
+                'rhoa','UN','U10','U10N','Cdn_10','Chn_10','Cen_10','hrain','Qs','Evap','T10','T10N','Q10','Q10N',
+                'RH10','P10','rhoa10','gust','wc_frac','Edis']
+
+# Andreas (1987) snow/ice roughness Reynolds numbers rt and rq (see
+# bulk_iteration): for each regime of rr (column), its upper bound of rr, the
+# coefficients c0, c1, c2 of rt = rr * exp(c0 + c1 * log(rr) + c2 * log(rr)^2),
+# the same for rq, and 1, or 0 above rr = 1000
+andreas_rr = np.array([[0.135, 2.5, 1000, np.inf],
+                       [1.25, 0.149, 0.317, 0],
+                       [0, -0.55, -0.565, 0],
+                       [0, 0, -0.183, 0],
+                       [1.61, 0.351, 0.396, 0],
+                       [0, -0.628, -0.512, 0],
+                       [0, 0, -0.18, 0],
+                       [1, 1, 1, 0]])
+
+# Payne (1972) table of albedo_vector: albedo a for each atmospheric transmissivity
+# Ts (row) and sun altitude As in degrees (column). Only adjustment is to T=0.95 Alt=10 value
+payne_T = np.arange(0,1+0.05,0.05)
+payne_alt = np.arange(0,90+2,2)
+#                  0     2     4     6     8     10    12    14    16    18    20   22     24    26    28    30    32    34    36    38    40    42    44    46    48    50    52    54    56    58    60    62    64    66    68    70    72    74    76    78    80    82    84    86    88    90
+payne_albedo = np.array([[0.061,0.061,0.061,0.061,0.061,0.061,0.061,0.061,0.061,0.061,0.061,0.061,0.061,0.061,0.061,0.061,0.061,0.061,0.061,0.061,0.061,0.061,0.061,0.061,0.061,0.061,0.061,0.061,0.061,0.061,0.061,0.061,0.061,0.061,0.061,0.061,0.061,0.061,0.061,0.061,0.061,0.061,0.061,0.061,0.061,0.061],[0.062,0.062,0.061,0.061,0.061,0.061,0.061,0.061,0.061,0.061,0.061,0.061,0.061,0.061,0.061,0.061,0.061,0.061,0.061,0.061,0.061,0.061,0.061,0.061,0.061,0.061,0.061,0.061,0.061,0.061,0.061,0.061,0.061,0.061,0.061,0.061,0.061,0.061,0.061,0.061,0.061,0.061,0.061,0.061,0.061,0.061],[0.072,0.07,0.068,0.065,0.065,0.063,0.062,0.061,0.061,0.061,0.061,0.061,0.061,0.061,0.061,0.061,0.06,0.061,0.06,0.06,0.06,0.06,0.06,0.06,0.06,0.06,0.06,0.06,0.06,0.06,0.06,0.06,0.06,0.06,0.06,0.06,0.06,0.06,0.06,0.06,0.06,0.06,0.06,0.06,0.06,0.06],[0.087,0.083,0.079,0.073,0.07,0.068,0.066,0.065,0.064,0.063,0.062,0.061,0.061,0.06,0.06,0.06,0.06,0.06,0.06,0.06,0.06,0.06,0.06,0.06,0.06,0.06,0.06,0.06,0.06,0.06,0.06,0.06,0.06,0.06,0.06,0.06,0.06,0.06,0.06,0.06,0.06,0.06,0.06,0.06,0.06,0.06],[0.115,0.108,0.098,0.086,0.082,0.077,0.072,0.071,0.067,0.067,0.065,0.063,0.062,0.061,0.061,0.06,0.06,0.06,0.06,0.061,0.061,0.061,0.061,0.06,0.059,0.06,0.06,0.06,0.06,0.06,0.06,0.06,0.06,0.06,0.06,0.06,0.06,0.06,0.06,0.06,0.06,0.06,0.06,0.059,0.059,0.059],[0.163,0.145,0.13,0.11,0.101,0.092,0.084,0.079,0.072,0.072,0.068,0.067,0.064,0.063,0.062,0.061,0.061,0.061,0.06,0.06,0.06,0.06,0.06,0.059,0.059,0.059,0.059,0.059,0.059,0.059,0.059,0.059,0.059,0.059,0.059,0.059,0.059,0.059,0.059,0.059,0.059,0.059,0.059,0.059,0.059,0.058],[0.235,0.198,0.174,0.15,0.131,0.114,0.103,0.094,0.083,0.08,0.074,0.074,0.07,0.067,0.065,0.064,0.063,0.062,0.061,0.06,0.06,0.06,0.059,0.059,0.059,0.059,0.059,0.059,0.059,0.059,0.059,0.059,0.059,0.059,0.059,0.059,0.059,0.059,0.059,0.059,0.059,0.059,0.059,0.058,0.058,0.058],[0.318,0.263,0.228,0.192,0.168,0.143,0.127,0.113,0.099,0.092,0.084,0.082,0.076,0.072,0.07,0.067,0.065,0.064,0.062,0.062,0.06,0.06,0.06,0.059,0.059,0.059,0.059,0.059,0.059,0.059,0.058,0.058,0.058,0.058,0.058,0.058,0.058,0.058,0.057,0.058,0.058,0.058,0.058,0.057,0.057,0.057],[0.395,0.336,0.29,0.248,0.208,0.176,0.151,0.134,0.117,0.107,0.097,0.091,0.085,0.079,0.075,0.071,0.068,0.067,0.065,0.063,0.062,0.061,0.06,0.06,0.06,0.059,0.059,0.058,0.058,0.058,0.057,0.057,0.057,0.057,0.057,0.057,0.057,0.056,0.056,0.056,0.056,0.056,0.056,0.056,0.056,0.055],[0.472,0.415,0.357,0.306,0.252,0.21,0.176,0.154,0.135,0.125,0.111,0.102,0.094,0.086,0.081,0.076,0.072,0.071,0.068,0.066,0.065,0.063,0.062,0.061,0.06,0.059,0.058,0.057,0.057,0.057,0.056,0.055,0.055,0.055,0.055,0.055,0.055,0.054,0.053,0.054,0.053,0.053,0.054,0.054,0.053,0.053],[0.542,0.487,0.424,0.36,0.295,0.242,0.198,0.173,0.15,0.136,0.121,0.11,0.101,0.093,0.086,0.081,0.076,0.073,0.069,0.067,0.065,0.064,0.062,0.06,0.059,0.058,0.057,0.056,0.055,0.055,0.054,0.053,0.053,0.052,0.052,0.052,0.051,0.051,0.05,0.05,0.05,0.05,0.051,0.05,0.05,0.05],[0.604,0.547,0.498,0.407,0.331,0.272,0.219,0.185,0.16,0.141,0.127,0.116,0.105,0.097,0.089,0.083,0.077,0.074,0.069,0.066,0.063,0.061,0.059,0.057,0.056,0.055,0.054,0.053,0.053,0.052,0.051,0.05,0.05,0.049,0.049,0.049,0.048,0.047,0.047,0.047,0.046,0.046,0.047,0.047,0.046,0.046],[0.655,0.595,0.556,0.444,0.358,0.288,0.236,0.19,0.164,0.145,0.13,0.119,0.107,0.098,0.09,0.084,0.076,0.073,0.068,0.064,0.06,0.058,0.056,0.054,0.053,0.051,0.05,0.049,0.048,0.048,0.047,0.046,0.046,0.045,0.045,0.045,0.044,0.043,0.043,0.043,0.042,0.042,0.043,0.042,0.042,0.042],[0.693,0.631,0.588,0.469,0.375,0.296,0.245,0.193,0.165,0.145,0.131,0.118,0.106,0.097,0.088,0.081,0.074,0.069,0.065,0.061,0.057,0.055,0.052,0.05,0.049,0.047,0.046,0.046,0.044,0.044,0.043,0.042,0.042,0.041,0.041,0.04,0.04,0.039,0.039,0.039,0.038,0.038,0.038,0.038,0.038,0.038],[0.719,0.656,0.603,0.48,0.385,0.3,0.25,0.193,0.164,0.145,0.131,0.116,0.103,0.092,0.084,0.076,0.071,0.065,0.061,0.057,0.054,0.051,0.049,0.047,0.045,0.043,0.043,0.042,0.041,0.04,0.039,0.039,0.038,0.038,0.037,0.036,0.036,0.035,0.035,0.034,0.034,0.034,0.034,0.034,0.034,0.034],[0.732,0.67,0.592,0.474,0.377,0.291,0.246,0.19,0.162,0.144,0.13,0.114,0.1,0.088,0.08,0.072,0.067,0.062,0.058,0.054,0.05,0.047,0.045,0.043,0.041,0.039,0.039,0.038,0.037,0.036,0.036,0.035,0.035,0.034,0.033,0.032,0.032,0.032,0.031,0.031,0.031,0.03,0.03,0.03,0.03,0.03],[0.73,0.652,0.556,0.444,0.356,0.273,0.235,0.188,0.16,0.143,0.129,0.113,0.097,0.086,0.077,0.069,0.064,0.06,0.055,0.051,0.047,0.044,0.042,0.039,0.037,0.035,0.035,0.035,0.034,0.033,0.033,0.032,0.032,0.032,0.029,0.029,0.029,0.029,0.028,0.028,0.028,0.028,0.027,0.027,0.028,0.028],[0.681,0.602,0.488,0.386,0.32,0.252,0.222,0.185,0.159,0.142,0.127,0.111,0.096,0.084,0.075,0.067,0.062,0.058,0.054,0.05,0.046,0.042,0.04,0.036,0.035,0.033,0.032,0.032,0.031,0.03,0.03,0.03,0.03,0.029,0.027,0.027,0.027,0.027,0.026,0.026,0.026,0.026,0.026,0.026,0.026,0.026],[0.581,0.494,0.393,0.333,0.288,0.237,0.211,0.182,0.158,0.141,0.126,0.11,0.095,0.083,0.074,0.066,0.061,0.057,0.053,0.049,0.045,0.041,0.039,0.034,0.033,0.032,0.031,0.03,0.029,0.028,0.028,0.028,0.028,0.027,0.026,0.026,0.026,0.025,0.025,0.025,0.025,0.025,0.025,0.025,0.025,0.025],[0.453,0.398,0.342,0.301,0.266,0.226,0.205,0.18,0.157,0.14,0.125,0.109,0.095,0.083,0.074,0.065,0.061,0.057,0.052,0.048,0.044,0.04,0.038,0.033,0.032,0.031,0.03,0.029,0.028,0.027,0.027,0.026,0.026,0.026,0.025,0.025,0.025,0.025,0.025,0.025,0.025,0.025,0.025,0.025,0.025,0.025],[0.425,0.37,0.325,0.29,0.255,0.22,0.2,0.178,0.157,0.14,0.122,0.108,0.095,0.083,0.074,0.065,0.061,0.056,0.052,0.048,0.044,0.04,0.038,0.033,0.032,0.031,0.03,0.029,0.028,0.027,0.026,0.026,0.026,0.026,0.025,0.025,0.025,0.025,0.025,0.025,0.025,0.025,0.025,0.025,0.025,0.025]])
+    
+def coare36vn_zrf_et(u, zu , t, zt, rh, zq, P, ts, sw_dn, lw_dn, lat, lon,jd, zi,rain, Ss, cp=None, sigH=None, zrf_u=10.0, zrf_t=10.0, zrf_q=10.0, tol=None, outputs=None, jit=None, dtype=None):   
 #**************************************************************************
 # VERSION INFO:
     
@@ -97,6 +134,38 @@ def coare36vn_zrf_et(u, zu , t, zt, rh, zq, P, ts, sw_dn, lw_dn, lat, lon,jd, zi
 #  sigH = significant wave height (m)
 #  zu, zt, zq heights of the observations (m)
 #  zrf_u, zrf_t, zrf_q  reference height for profile.  Use this to compare observations at different heights
+#  tol = None (default) runs the bulk loop nits = 10 times for every element.
+#             A number (e.g. 1e-6) runs it adaptively: an element is no
+#             longer computed once the relative change of its usr, tsr and
+#             qsr in a pass is less than tol (still at most nits passes), so
+#             most of a large input only takes a few passes.
+#  outputs = None (default) returns all the outputs as the columns of A.
+#             A list of output names (see output_names), e.g.
+#             ['tau','hsb','hlb'], returns a structured array with only
+#             those fields (A['tau'], ...) and skips the height profiles,
+#             rain heat flux and wave breaking statistics that are not
+#             needed for them.
+#  jit = None or False (default) runs the bulk loop with NumPy
+#             (bulk_iteration). True runs it with the compiled kernel of
+#             coare36vn_numba, which needs Numba and agrees with NumPy to
+#             round-off (about 1e-13 relative), not bit for bit.
+#             'samples' computes each sample entirely in compiled code, one
+#             sample at a time (coare36vn_numba.coare_samples), for calls
+#             with a few samples (e.g. a single time step): tens of
+#             microseconds per call instead of milliseconds. It agrees with
+#             the other two to round-off only, so use it for all the calls
+#             whose outputs are compared or combined. It works in float64
+#             only: calls with a dtype use the compiled kernel instead.
+#  dtype = None (default) computes in float64. np.float32 converts the
+#             inputs to float32 and keeps the arrays of the calculation and
+#             the outputs in float32, for half the memory use and memory
+#             traffic on large grids (the compiled kernel reads and writes
+#             float32 but works in float64 registers). On test_36_data.txt
+#             all float32 outputs are within 1e-5 relative of the float64
+#             ones, except close to zero: hsb and tsr within 1e-4 W/m^2
+#             and 1e-7 K, and Ch within 3e-5 relative. With jit='samples'
+#             a dtype selects the compiled kernel (jit=True) instead of the
+#             per-sample one, which only computes in float64.
     
 #**************************************************************************
 #### OUTPUTS: the user controls the output array A at the end of the code.
@@ -236,43 +305,49 @@ def coare36vn_zrf_et(u, zu , t, zt, rh, zq, P, ts, sw_dn, lw_dn, lat, lon,jd, zi
 ### Make sure INPUTS are consistent in size. 
 # Best to avoid NaNs as inputs as well. Will prevent weird results
 
+    if outputs is not None:
+        unknown = [name for name in outputs if name not in output_names]
+        if unknown:
+            raise ValueError('unknown COARE outputs: %s' % unknown)
+    
+    if jit and not coare36vn_numba.available:
+        raise ImportError('jit=True needs Numba')
+    
+    # each sample in one call of the compiled kernel, without the arrays of the
+    # NumPy code below
+    if jit == 'samples' and dtype is None:
+        return coare_samples([u, zu, t, zt, rh, zq, P, ts, sw_dn, lw_dn, lat, lon, jd, zi, rain, Ss, cp, sigH, zrf_u, zrf_t, zrf_q],
+                             tol, outputs)
+    
     # be sure array inputs are ndarray floats for single value function
     # if inputs are already ndarray float this does nothing
     # otherwise copies are created in the local namespace
-    # .flatten() return a 1D version in case single value input is already an array (array([[]]) vs array([]))
-    if u.size ==1 and t.size ==1: 
-        u = np.copy(np.asarray([u], dtype=float)).flatten()
-        zu = np.copy(np.asarray([zu], dtype=float)).flatten()
-        t = np.copy(np.asarray([t], dtype=float)).flatten()
-        zt = np.copy(np.asarray([zt], dtype=float)).flatten()
-        rh = np.copy(np.asarray([rh], dtype=float)).flatten()
-        zq = np.copy(np.asarray([zq], dtype=float)).flatten()
-        P = np.copy(np.asarray([P], dtype=float)).flatten()
-        ts = np.copy(np.asarray([ts], dtype=float)).flatten()
-        sw_dn = np.copy(np.asarray([sw_dn], dtype=float)).flatten()
-        lw_dn = np.copy(np.asarray([lw_dn], dtype=float)).flatten()
-        lat = np.copy(np.asarray([lat], dtype=float)).flatten()
-        lon = np.copy(np.asarray([lon], dtype=float)).flatten()
-        jd = np.copy(np.asarray([jd], dtype=float)).flatten()
-        zi = np.copy(np.asarray([zi], dtype=float)).flatten()
-        rain = np.copy(np.asarray([rain], dtype=float)).flatten()
-        Ss = np.copy(np.asarray([Ss], dtype=float)).flatten()
-        zrf_u = np.copy(np.asarray([zrf_u], dtype=float)).flatten()
-        zrf_t = np.copy(np.asarray([zrf_t], dtype=float)).flatten()
-        zrf_q = np.copy(np.asarray([zrf_q], dtype=float)).flatten()
+    # (1D copies, in case a single value input is already an array, array([[]]) vs array([]))
+    if np.size(u) ==1 and np.size(t) ==1: 
+        u, zu, t, zt, rh, zq, P, ts, sw_dn, lw_dn, lat, lon, jd, zi, rain, Ss, zrf_u, zrf_t, zrf_q = [np.array(x, dtype=float, ndmin=1).ravel()
+            for x in (u, zu, t, zt, rh, zq, P, ts, sw_dn, lw_dn, lat, lon, jd, zi, rain, Ss, zrf_u, zrf_t, zrf_q)]
+    
+    # working precision, float64 unless dtype is given
+    ftype = np.dtype(float if dtype is None else dtype)
+    if dtype is not None:
+        u, zu, t, zt, rh, zq, P, ts, sw_dn, lw_dn, lat, lon, jd, zi, rain, Ss, zrf_u, zrf_t, zrf_q = [np.asarray(x, dtype=ftype)
+            for x in (u, zu, t, zt, rh, zq, P, ts, sw_dn, lw_dn, lat, lon, jd, zi, rain, Ss, zrf_u, zrf_t, zrf_q)]
     
     N = np.size(u)
-    jcool = jcoolx * np.ones(N)
+    jcool = jcoolx * np.ones(N, dtype=ftype)
     
-    if cp is not None and cp.size==1:
-        cp = np.copy(np.asarray([cp], dtype=float)).flatten()
+    if cp is not None and np.size(cp)==1:
+        cp = np.array(cp, dtype=float, ndmin=1).ravel()
     elif cp is None:
-        cp = np.nan * np.ones(N)
+        cp = np.nan * np.ones(N, dtype=ftype)
 
-    if sigH is not None and sigH.size==1:
-        sigH = np.copy(np.asarray([sigH], dtype=float)).flatten()
+    if sigH is not None and np.size(sigH)==1:
+        sigH = np.array(sigH, dtype=float, ndmin=1).ravel()
     elif sigH is None:
-        sigH = np.nan * np.ones(N)
+        sigH = np.nan * np.ones(N, dtype=ftype)
+    
+    if dtype is not None:
+        cp, sigH = np.asarray(cp, dtype=ftype), np.asarray(sigH, dtype=ftype)
      
 # Option to set local variables to default values if input is NaN... can do
 # single value or fill each individual. Warning... this will fill arrays
@@ -308,9 +383,7 @@ def coare36vn_zrf_et(u, zu , t, zt, rh, zq, P, ts, sw_dn, lw_dn, lat, lon,jd, zi
     # Pv is the partial pressure due to wate vapor in mb
     Q = Q / 1000
 
-    ice = np.zeros(N)
-    iice = np.array(np.where(ts < Tf))
-    ice[iice] = 1
+    iice = ts < Tf
     jcool[iice] = 0
     zos = 0.0005
     #***********  set constants ***********************************************
@@ -363,7 +436,7 @@ def coare36vn_zrf_et(u, zu , t, zt, rh, zq, P, ts, sw_dn, lw_dn, lat, lon,jd, zi
     # Check: albedo should usually peak at sunrise not at sunset, though it may
     # vary based on sw_dn.
     alb,T_sw,solarmax_sw,psi_sw = albedo_vector(sw_dn,jd,lon,lat,eorw='E')
-    sw_net = np.multiply((1 - alb),sw_dn)
+    sw_net = np.multiply((1 - alb),sw_dn,dtype=ftype)
     
     # *** for constant albedo:
     # sw_net = 0.945.*sw_dn; # constant albedo correction, positive heating ocean
@@ -443,18 +516,18 @@ def coare36vn_zrf_et(u, zu , t, zt, rh, zq, P, ts, sw_dn, lw_dn, lat, lon,jd, zi
     usr = np.multiply(ut,von) / (np.log(zu / zo10) - psiu_40(zu / L10))
     tsr = np.multiply(- (dT - np.multiply(dT_skin,jcool)),von) * fdg / (np.log(zt / zot10) - psit_26(zt / L10))
     qsr = - (dq - np.multiply(np.multiply(wetc,dT_skin),jcool)) * von * fdg / (np.log(zq / zot10) - psit_26(zq / L10))
-    dz_skin = 0.001 * np.ones(N)
+    dz_skin = 0.001 * np.ones(N, dtype=ftype)
     #**********************************************************
     #  The following gives the new formulation for the
     #  Charnock variable
     #**********************************************************
     #############   COARE 3.5 wind speed dependent charnock
-    charnC = 0.011 * np.ones(N)
+    charnC = 0.011 * np.ones(N, dtype=ftype)
     umax = 19
     a1 = 0.0017
     a2 = - 0.005
     # charnC = a1 * u10 + a2
-    charnC=np.copy(np.asarray(a1 * u10 + a2, dtype=float))
+    charnC=np.copy(np.asarray(a1 * u10 + a2, dtype=ftype))
     k = np.array(np.where(u10 > umax))
     if k.size!=0:
         charnC[k] = a1 * umax + a2
@@ -477,134 +550,79 @@ def coare36vn_zrf_et(u, zu , t, zt, rh, zq, P, ts, sw_dn, lw_dn, lat, lon,jd, zi
     charn[ii] = charnS[ii]
     #**************  bulk loop ************************************************
     
-    for i in np.arange(1,nits+1).reshape(-1):
-        zeta = np.multiply(np.multiply(np.multiply(von,grav),zu) / ta,(tsr + np.multiply(0.61 * ta,qsr))) / (usr ** 2)
-        L = zu / zeta
-        zo = np.multiply(charn,usr ** 2.0) / grav + 0.11 * visa / usr
-        zo[iice] = zos
-        rr = np.multiply(zo,usr) / visa
-        rt = np.zeros(u.size)
-        rq = np.zeros(u.size)
-        # This thermal roughness length Stanton number is close to COARE 3.0 value
-        zoq = np.minimum(0.00016,5.8e-05 / rr ** 0.72)
-        # Andreas 1987 for snow/ice
-        ik = np.array(np.where(rr[iice] <= 0.135))
-        rt[iice[ik]] = rr[iice[ik]] * np.exp(1.25)
-        rq[iice[ik]] = rr[iice[ik]] * np.exp(1.61)
-        ik = np.array(np.where(rr[iice] > np.logical_and(0.135,rr[iice]) <= 2.5))
-        rt[iice[ik]] = np.multiply(rr[iice[ik]],np.exp(0.149 - 0.55 * np.log(rr[iice[ik]])))
-        rq[iice[ik]] = np.multiply(rr[iice[ik]],np.exp(0.351 - 0.628 * np.log(rr[iice[ik]])))
-        ik = np.array(np.where(rr[iice] > np.logical_and(2.5,rr[iice]) <= 1000))
-        rt[iice[ik]] = np.multiply(rr[iice[ik]],np.exp(0.317 - 0.565 * np.log(rr[iice[ik]]) - np.multiply(0.183 * np.log(rr[iice[ik]]),np.log(rr[iice[ik]]))))
-        rq[iice[ik]] = np.multiply(rr[iice[ik]],np.exp(0.396 - 0.512 * np.log(rr[iice[ik]]) - np.multiply(0.18 * np.log(rr[iice[ik]]),np.log(rr[iice[ik]]))))
-        # Dalton number is close to COARE 3.0 value
-        zot = zoq
-        cdhf = von / (np.log(zu / zo) - psiu_26(zu / L))
-        cqhf = np.multiply(von,fdg) / (np.log(zq / zoq) - psit_26(zq / L))
-        cthf = np.multiply(von,fdg) / (np.log(zt / zot) - psit_26(zt / L))
-        usr = np.multiply(ut,cdhf)
-        qsr = np.multiply(- (dq - np.multiply(np.multiply(wetc,dT_skin),jcool)),cqhf)
-        tsr = np.multiply(- (dT - np.multiply(dT_skin,jcool)),cthf)
-        # original COARE version buoyancy flux
-        tvsr1 = tsr + np.multiply(0.61 * ta,qsr)
-        tssr1 = tsr + np.multiply(0.51 * ta,qsr)
-        # new COARE version buoyancy flux from Stull (1988) page 146
-        # tsr here uses dT with the lapse rate adjustment (see code above). The
-        # Q and ta values should be at measurement height, not adjusted heights
-        tvsr = np.multiply(tsr,(1 + np.multiply(0.61,Q))) + np.multiply(0.61 * ta,qsr)
-        tssr = np.multiply(tsr,(1 + np.multiply(0.51,Q))) + np.multiply(0.51 * ta,qsr)
-        Bf = np.multiply(np.multiply(- grav / ta,usr),tvsr)
-        gust = 0.2 * np.ones(N)
-        k = np.array(np.where(Bf > 0))
-        ### gustiness in this way is from the original code. Notes:
-        # we measured the actual gustiness by measuring the variance of the
-        # wind speed and empirically derived the the scaling. It's empirical
-        # but it seems appropriate... the longer the time average then the larger
-        # the gustiness factor should be, to account for the gustiness averaged
-        # or smoothed out by the averaging. wstar is the convective velocity.
-        # gustiness is beta times wstar. gustiness is different between mean of
-        # velocity and square of the mean of the velocity vector components.
-        # The actual wind (mean + fluctuations) is still the most relavent
-        # for the flux. The models do u v w, and then compute vector avg to get
-        # speed, so we've done the same thing. coare alg input is the magnitude
-        # of the mean vector wind relative to water.
-        if np.size(zi) == 1:
-            gust[k] = Beta * (np.multiply(Bf[k],zi)) ** 0.333
-            del k
+    # inputs and constants of the bulk loop, and the variables updated by each
+    # pass (see bulk_iteration)
+    c = dict(von=von,grav=grav,zu=zu,zt=zt,zq=zq,ta=ta,Q=Q,visa=visa,ice=iice,zos=zos,
+             fdg=fdg,du=du,dT=dT,dq=dq,wetc=wetc,jcool=jcool,Beta=Beta,zi=zi,rhoa=rhoa,cpa=cpa,
+             Le=Le,sw_net=sw_net,Al=Al,be=be,cpw=cpw,rhow=rhow,visw=visw,tcw=tcw,bigc=bigc,
+             ts=ts,T2K=T2K,lw_dn=lw_dn,a1=a1,a2=a2,umax=umax,sigH=sigH,Ad=Ad,Bd=Bd,cp=cp,
+             zt_is_zq=np.array_equal(zt,zq))
+    s = dict(usr=usr,tsr=tsr,qsr=qsr,ut=ut,charn=charn,dT_skin=dT_skin,dz_skin=dz_skin,lw_net=lw_net)
+    
+    if jit:
+        # all the passes for one element at a time in the compiled kernel, which
+        # also inserts the first iteration solution for the case with zetau>50
+        s = coare36vn_numba.bulk_loop(s,c,nits,tol,zetau > 50)
+    else:
+        s = bulk_iteration(s,c)
+        usr50 = s['usr'][k50]
+        tsr50 = s['tsr'][k50]
+        qsr50 = s['qsr'][k50]
+        L50 = s['L'][k50]
+        zeta50 = s['zeta'][k50]
+        dT_skin50 = s['dT_skin'][k50]
+        dq_skin50 = s['dq_skin'][k50]
+        tkt50 = s['dz_skin'][k50]
+    
+        if tol is None:
+            # fixed number of passes over all elements
+            for i in np.arange(2,nits+1).reshape(-1):
+                s = bulk_iteration(s,c)
         else:
-            gust[k] = Beta * (np.multiply(Bf[k],zi[k])) ** 0.333
-            del k
-        ut = np.sqrt(du ** 2 + gust ** 2)
-        gf = ut / du
-        hsb = np.multiply(np.multiply(- rhoa * cpa,usr),tsr)
-        hlb = np.multiply(np.multiply(np.multiply(- rhoa,Le),usr),qsr)
-        qout = lw_net + hsb + hlb
-        ### rain heat flux is not included in qout because we don't fully
-        # understand the evolution or gradient of the cool skin layer in the
-        # presence of rain, and the sea snake subsurface measurement input
-        # value will capture some of the rain-cooled water already. TBD.
-        ### solar absorption:
-        # The absorption function below is from a Soloviev paper, appears as
-        # Eq 17 Fairall et al. 1996 and updated/tested by Wick et al. 2005. The
-        # coefficient was changed from 1.37 to 0.065 ~ about halved.
-        # Most of the time this adjustment makes no difference. But then there
-        # are times when the wind is weak, insolation is high, and it matters a
-        # lot. Using the original 1.37 coefficient resulted in many unwarranted
-        # warm-skins that didn't seem realistic. See Wick et al. 2005 for details.
-        # That's the last time the cool-skin routine was updated. The
-        # absorption is not from Paulson & Simpson because that was derived in a lab.
-        # It absorbed too much and produced too many warm layers. It likely
-        # approximated too much near-IR (longerwavelength solar) absorption
-        # which probably doesn't make it to the ocean since it was probably absorbed
-        # somewhere in the atmosphere first. The below expression could
-        # likely use 2 exponentials if you had a shallow mixed layer...
-        # but we find better results with 3 exponentials. That's the best so
-        # far we've found that covers the possible depths.
-        dels = np.multiply(sw_net,(0.065 + 11 * dz_skin - np.multiply(6.6e-05 / dz_skin,(1 - np.exp(- dz_skin / 0.0008)))))
-        qcol = qout - dels
-        # only needs stress, water temp, sum of sensible, latent, ir, solar,
-        # and latent individually.
-        alq = np.multiply(Al,qcol) + np.multiply(np.multiply(be,hlb),cpw) / Le
-        xlamx = 6.0 * np.ones(N)
-        #     the other is the salinity part caused by latent heat flux (evap) leaving behind salt.
-        dz_skin = np.minimum(0.01,np.multiply(xlamx,visw) / (np.multiply(np.sqrt(rhoa / rhow),usr)))
-        k = np.array(np.where(alq > 0))
-        xlamx[k] = 6.0 / (1 + (np.multiply(bigc[k],alq[k]) / usr[k] ** 4) ** 0.75) ** 0.333
-        dz_skin[k] = np.multiply(xlamx[k],visw) / (np.multiply(np.sqrt(rhoa[k] / rhow),usr[k]))
-        del k
-        dT_skin = np.multiply(qcol,dz_skin) / tcw
-        dq_skin = np.multiply(wetc,dT_skin)
-        lw_net = 0.97 * (5.67e-08 * (ts - np.multiply(dT_skin,jcool) + T2K) ** 4 - lw_dn)
-        if i == 1:
-            usr50 = usr[k50]
-            tsr50 = tsr[k50]
-            qsr50 = qsr[k50]
-            L50 = L[k50]
-            zeta50 = zeta[k50]
-            dT_skin50 = dT_skin[k50]
-            dq_skin50 = dq_skin[k50]
-            tkt50 = dz_skin[k50]
-        u10N = np.multiply(usr / von / gf,np.log(10.0 / zo))
-        charnC = a1 * u10N + a2
-        k = u10N > umax
-        charnC[k] = a1 * umax + a2
-        charn = charnC
-        zoS = np.multiply(np.multiply(sigH,Ad),(usr / cp) ** Bd)
-        charnS = np.multiply(zoS,grav) / usr / usr
-        ii = np.array(np.where(np.logical_not(np.isnan(cp))))
-        charn[ii] = charnS[ii]
+            # adaptive: an element is done once its usr, tsr and qsr changed by
+            # less than tol (relative) in a pass, NaN counts as done. The passes
+            # run on a working set of elements ws (with its inputs cw and
+            # variables sw), which is compacted to the elements that are not done
+            # once at most half of it is left. The elements dropped from the
+            # working set are stored in s with the values of their last pass
+            ws, cw, sw = np.arange(N), c, s
+            live = np.ones(N,dtype=bool)
+            for i in np.arange(2,nits+1).reshape(-1):
+                new = bulk_iteration(sw,cw)
+                changed = np.zeros(ws.size,dtype=bool)
+                for key in ['usr','tsr','qsr']:
+                    changed |= np.abs(new[key] - sw[key]) > tol * np.abs(new[key])
+                live &= changed
+                sw = new
+                if i == nits or not live.any():
+                    break
+                if 2 * np.count_nonzero(live) <= ws.size:
+                    for key in s:
+                        s[key][ws[~live]] = sw[key][~live]
+                    ws = ws[live]
+                    cw = {key: take(value,ws) for key,value in c.items()}
+                    sw = {key: value[live] for key,value in sw.items()}
+                    live = np.ones(ws.size,dtype=bool)
+            for key in s:
+                s[key][ws] = sw[key]
+    
+    usr, tsr, qsr, ut, gf, gust = s['usr'], s['tsr'], s['qsr'], s['ut'], s['gf'], s['gust']
+    dT_skin, dq_skin, dz_skin, lw_net = s['dT_skin'], s['dq_skin'], s['dz_skin'], s['lw_net']
+    zeta, L, zo, zot, zoq = s['zeta'], s['L'], s['zo'], s['zot'], s['zoq']
+    tvsr, tvsr1, tssr, tssr1 = s['tvsr'], s['tvsr1'], s['tssr'], s['tssr1']
     
     # end bulk loop
     
     # insert first iteration solution for case with zetau>50
-    usr[k50] = usr50
-    tsr[k50] = tsr50
-    qsr[k50] = qsr50
-    L[k50] = L50
-    zeta[k50] = zeta50
-    dT_skin[k50] = dT_skin50
-    dq_skin[k50] = dq_skin50
-    dz_skin[k50] = tkt50
+    if not jit:
+        usr[k50] = usr50
+        tsr[k50] = tsr50
+        qsr[k50] = qsr50
+        L[k50] = L50
+        zeta[k50] = zeta50
+        dT_skin[k50] = dT_skin50
+        dq_skin[k50] = dq_skin50
+        dz_skin[k50] = tkt50
     #****************  compute fluxes  ****************************************
     tau = np.multiply(np.multiply(rhoa,usr),usr) / gf
     
@@ -636,15 +654,20 @@ def coare36vn_zrf_et(u, zu , t, zt, rh, zq, P, ts, sw_dn, lw_dn, lat, lon,jd, zi
     Cen_10 = von ** 2.0 * fdg / np.log(10.0 / zo) / np.log(10.0 / zoq)
     #***##  compute 10-m neutral coeff relative to ut *************************
     
+    # Groups of outputs below that are only computed when one of them is
+    # requested (all of them when outputs is None)
+    want = set(output_names if outputs is None else outputs)
+    wind_profile = not want.isdisjoint(['Urf','UrfN','UN','U10','U10N','wc_frac','Edis'])
+    tq_profile = not want.isdisjoint(['Trf','TrfN','QrfN','Qrf','RHrf','T10','T10N','Q10','Q10N','RH10','rhoa10'])
+    rain_flux = 'hrain' in want
+    wave_breaking = not want.isdisjoint(['wc_frac','Edis'])
+    
     # Find the stability functions for computing values at user defined
     # reference heights and 10 m
-    psi = psiu_26(zu / L)
-    psi10 = psiu_26(10.0 / L)
-    psirf = psiu_26(zrf_u / L)
-    psiT = psit_26(zt / L)
-    psi10T = psit_26(10.0 / L)
-    psirfT = psit_26(zrf_t / L)
-    psirfQ = psit_26(zrf_q / L)
+    if wind_profile:
+        psi, psi10, psirf = psi_heights(psiu_26,L,[zu,10.0,zrf_u])
+    if tq_profile:
+        psiT, psi10T, psirfT, psirfQ = psi_heights(psit_26,L,[zt,10.0,zrf_t,zrf_q])
     gf = ut / du
     #*********************************************************
     #  Determine the wind speeds relative to ocean surface at different heights
@@ -652,25 +675,27 @@ def coare36vn_zrf_et(u, zu , t, zt, rh, zq, P, ts, sw_dn, lw_dn, lat, lon,jd, zi
     #  gustiness usr = sqrt(Cd) S, which is equation (18) in
     #  Fairall et al. (1996)
     #*********************************************************
-    S = ut
-    U = du
-    S10 = S + np.multiply(usr / von,(np.log(10.0 / zu) - psi10 + psi))
-    U10 = S10 / gf
-    # or U10 = U + usr./von./gf.*(log(10/zu)-psi10+psi);
-    Urf = U + np.multiply(usr / von / gf,(np.log(zrf_u / zu) - psirf + psi))
-    UN = U + np.multiply(psi,usr) / von / gf
-    U10N = U10 + np.multiply(psi10,usr) / von / gf
-    
-    UrfN = Urf + np.multiply(psirf,usr) / von / gf
-    UN2 = np.multiply(usr / von / gf,np.log(zu / zo))
-    U10N2 = np.multiply(usr / von / gf,np.log(10.0 / zo))
-    UrfN2 = np.multiply(usr / von / gf,np.log(zrf_u / zo))
+    if wind_profile:
+        S = ut
+        U = du
+        S10 = S + np.multiply(usr / von,(np.log(10.0 / zu) - psi10 + psi))
+        U10 = S10 / gf
+        # or U10 = U + usr./von./gf.*(log(10/zu)-psi10+psi);
+        Urf = U + np.multiply(usr / von / gf,(np.log(zrf_u / zu) - psirf + psi))
+        UN = U + np.multiply(psi,usr) / von / gf
+        U10N = U10 + np.multiply(psi10,usr) / von / gf
+    
+        UrfN = Urf + np.multiply(psirf,usr) / von / gf
+        UN2 = np.multiply(usr / von / gf,np.log(zu / zo))
+        U10N2 = np.multiply(usr / von / gf,np.log(10.0 / zo))
+        UrfN2 = np.multiply(usr / von / gf,np.log(zrf_u / zo))
     #******** rain heat flux *****************************
-    dwat = 2.11e-05 * ((t + T2K) / T2K) ** 1.94
-    dtmp = np.multiply((1.0 + 0.003309 * t - np.multiply(np.multiply(1.44e-06,t),t)),0.02411) / (np.multiply(rhoa,cpa))
-    dqs_dt = np.multiply(Q,Le) / (np.multiply(Rgas,(t + T2K) ** 2))
-    alfac = 1.0 / (1 + 0.622 * (np.multiply(np.multiply(dqs_dt,Le),dwat)) / (np.multiply(cpa,dtmp)))
-    hrain = np.multiply(np.multiply(np.multiply(rain,alfac),cpw),((ts - t - np.multiply(dT_skin,jcool)) + np.multiply((Qs - Q - np.multiply(dq_skin,jcool)),Le) / cpa)) / 3600
+    if rain_flux:
+        dwat = 2.11e-05 * ((t + T2K) / T2K) ** 1.94
+        dtmp = np.multiply((1.0 + 0.003309 * t - np.multiply(np.multiply(1.44e-06,t),t)),0.02411) / (np.multiply(rhoa,cpa))
+        dqs_dt = np.multiply(Q,Le) / (np.multiply(Rgas,(t + T2K) ** 2))
+        alfac = 1.0 / (1 + 0.622 * (np.multiply(np.multiply(dqs_dt,Le),dwat)) / (np.multiply(cpa,dtmp)))
+        hrain = np.multiply(np.multiply(np.multiply(rain,alfac),cpw),((ts - t - np.multiply(dT_skin,jcool)) + np.multiply((Qs - Q - np.multiply(dq_skin,jcool)),Le) / cpa)) / 3600
     
     Tskin = ts - np.multiply(dT_skin,jcool)
     
@@ -678,49 +703,52 @@ def coare36vn_zrf_et(u, zu , t, zt, rh, zq, P, ts, sw_dn, lw_dn, lat, lon,jd, zi
     # to get P10 and P at reference height
     P10 = P - (0.125 * 10)
     Prf = P - (0.125 * zref)
-    T10 = t + np.multiply(tsr / von,(np.log(10.0 / zt) - psi10T + psiT)) + np.multiply(lapse,(zt - 10))
-    Trf = t + np.multiply(tsr / von,(np.log(zrf_t / zt) - psirfT + psiT)) + np.multiply(lapse,(zt - zrf_t))
-    TN = t + np.multiply(psiT,tsr) / von
-    T10N = T10 + np.multiply(psi10T,tsr) / von
-    TrfN = Trf + np.multiply(psirfT,tsr) / von
-    # unused... these are here to make sure you gets the same answer whether
-    # you used the thermal calculated roughness lengths or the values at the
-    # measurement height. So at this point they are just illustrative and can
-    # be removed or ignored if you want.
-    TN2 = Tskin + np.multiply(tsr / von,np.log(zt / zot)) - np.multiply(lapse,zt)
-    T10N2 = Tskin + np.multiply(tsr / von,np.log(10.0 / zot)) - np.multiply(lapse,10)
-    TrfN2 = Tskin + np.multiply(tsr / von,np.log(zrf_t / zot)) - np.multiply(lapse,zrf_t)
+    if tq_profile:
+        T10 = t + np.multiply(tsr / von,(np.log(10.0 / zt) - psi10T + psiT)) + np.multiply(lapse,(zt - 10))
+        Trf = t + np.multiply(tsr / von,(np.log(zrf_t / zt) - psirfT + psiT)) + np.multiply(lapse,(zt - zrf_t))
+        TN = t + np.multiply(psiT,tsr) / von
+        T10N = T10 + np.multiply(psi10T,tsr) / von
+        TrfN = Trf + np.multiply(psirfT,tsr) / von
+        # unused... these are here to make sure you gets the same answer whether
+        # you used the thermal calculated roughness lengths or the values at the
+        # measurement height. So at this point they are just illustrative and can
+        # be removed or ignored if you want.
+        TN2 = Tskin + np.multiply(tsr / von,np.log(zt / zot)) - np.multiply(lapse,zt)
+        T10N2 = Tskin + np.multiply(tsr / von,np.log(10.0 / zot)) - np.multiply(lapse,10)
+        TrfN2 = Tskin + np.multiply(tsr / von,np.log(zrf_t / zot)) - np.multiply(lapse,zrf_t)
     dq_skin = np.multiply(np.multiply(wetc,dT_skin),jcool)
     Qs = Qs - dq_skin
     dq_skin = dq_skin * 1000
     Qs = Qs * 1000
     Q = Q * 1000
-    Q10 = Q + np.multiply(np.multiply(1000.0,qsr) / von,(np.log(10.0 / zq) - psi10T + psiT))
-    Qrf = Q + np.multiply(np.multiply(1000.0,qsr) / von,(np.log(zrf_q / zq) - psirfQ + psiT))
-    QN = Q + np.multiply(np.multiply(psiT,1000.0),qsr) / von / np.sqrt(gf)
-    Q10N = Q10 + np.multiply(np.multiply(psi10T,1000.0),qsr) / von
-    QrfN = Qrf + np.multiply(np.multiply(psirfQ,1000.0),qsr) / von
-    # unused... these are here to make sure you gets the same answer whether
-    # you used the thermal calculated roughness lengths or the values at the
-    # measurement height. So at this point they are just illustrative and can
-    # be removed or ignored if you want.
-    QN2 = Qs + np.multiply(np.multiply(1000.0,qsr) / von,np.log(zq / zoq))
-    Q10N2 = Qs + np.multiply(np.multiply(1000.0,qsr) / von,np.log(10.0 / zoq))
-    QrfN2 = Qs + np.multiply(np.multiply(1000.0,qsr) / von,np.log(zrf_q / zoq))
-    RHrf = RHcalc(Trf,Prf,Qrf / 1000,Tf)
-    RH10 = RHcalc(T10,P10,Q10 / 1000,Tf)
-    # recompute rhoa10 with 10-m values of everything else.
-    rhoa10 = P10 * 100.0 / (np.multiply(Rgas * (T10 + T2K),(1 + 0.61 * (Q10 / 1000))))
+    if tq_profile:
+        Q10 = Q + np.multiply(np.multiply(1000.0,qsr) / von,(np.log(10.0 / zq) - psi10T + psiT))
+        Qrf = Q + np.multiply(np.multiply(1000.0,qsr) / von,(np.log(zrf_q / zq) - psirfQ + psiT))
+        QN = Q + np.multiply(np.multiply(psiT,1000.0),qsr) / von / np.sqrt(gf)
+        Q10N = Q10 + np.multiply(np.multiply(psi10T,1000.0),qsr) / von
+        QrfN = Qrf + np.multiply(np.multiply(psirfQ,1000.0),qsr) / von
+        # unused... these are here to make sure you gets the same answer whether
+        # you used the thermal calculated roughness lengths or the values at the
+        # measurement height. So at this point they are just illustrative and can
+        # be removed or ignored if you want.
+        QN2 = Qs + np.multiply(np.multiply(1000.0,qsr) / von,np.log(zq / zoq))
+        Q10N2 = Qs + np.multiply(np.multiply(1000.0,qsr) / von,np.log(10.0 / zoq))
+        QrfN2 = Qs + np.multiply(np.multiply(1000.0,qsr) / von,np.log(zrf_q / zoq))
+        RHrf = RHcalc(Trf,Prf,Qrf / 1000,Tf)
+        RH10 = RHcalc(T10,P10,Q10 / 1000,Tf)
+        # recompute rhoa10 with 10-m values of everything else.
+        rhoa10 = P10 * 100.0 / (np.multiply(Rgas * (T10 + T2K),(1 + 0.61 * (Q10 / 1000))))
     ############  Other wave breaking statistics from Banner-Morison wave model
-    wc_frac = 0.00073 * (U10N - 2) ** 1.43
-    wc_frac[U10 < 2.1] = 1e-05
+    if wave_breaking:
+        wc_frac = 0.00073 * (U10N - 2) ** 1.43
+        wc_frac[U10 < 2.1] = 1e-05
     
-    kk = np.array(np.where(np.isfinite(cp) == 1))
-    wc_frac[kk] = 0.0016 * U10N[kk] ** 1.1 / np.sqrt(cp[kk] / U10N[kk])
+        kk = np.array(np.where(np.isfinite(cp) == 1))
+        wc_frac[kk] = 0.0016 * U10N[kk] ** 1.1 / np.sqrt(cp[kk] / U10N[kk])
     
-    Edis = np.multiply(np.multiply(0.095 * rhoa,U10N),usr ** 2)
-    wc_frac[iice] = 0
-    Edis[iice] = 0
+        Edis = np.multiply(np.multiply(0.095 * rhoa,U10N),usr ** 2)
+        wc_frac[iice] = 0
+        Edis[iice] = 0
     #****************  output  ****************************************************
     # only return values if jcool = 1; if cool skin model was intended to be run
     dT_skinx = np.multiply(dT_skin,jcool)
@@ -736,6 +764,14 @@ def coare36vn_zrf_et(u, zu , t, zt, rh, zq, P, ts, sw_dn, lw_dn, lat, lon,jd, zi
     # this sign flip means lw_net, net long wave flux, is equivalent to:
     # lw_net = 0.97*(lw_dn_best - 5.67e-8*(Tskin+C2K).^4);
     
+    # only the requested outputs, as the fields of a structured array
+    if outputs is not None:
+        values = locals()
+        A = np.empty(len(u), dtype=[(name, ftype) for name in outputs])
+        for name in outputs:
+            A[name] = values[name]
+        return A
+    
     # adjust A output as desired:
     out = np.array([usr,tau,hsb,hlb,hbb,hsbb,hlwebb,tsr,qsr,zo,zot,zoq,Cd,Ch,Ce,L,zeta,dT_skinx,dq_skinx,dz_skin,Urf,Trf,Qrf,RHrf,UrfN,TrfN,QrfN,lw_net,sw_net,Le,rhoa,UN,U10,U10N,Cdn_10,Chn_10,Cen_10,hrain,Qs,Evap,T10,T10N,Q10,Q10N,RH10,P10,rhoa10,gust,wc_frac,Edis])
     #                1   2   3   4   5   6    7      8   9  10  11  12 13 14 15 16  17   18       19        20    21  22  23  24   25   26   27     28    29   30  31  32 33   34    35     36    37      38  39  40   41  42   43   44   45  46   47    48     49    50
@@ -744,56 +780,252 @@ def coare36vn_zrf_et(u, zu , t, zt, rh, zq, P, ts, sw_dn, lw_dn, lat, lon,jd, zi
     
 #------------------------------------------------------------------------------
     
+def bulk_iteration(s = None,c = None): 
+    #  One pass of the bulk loop of coare36vn_zrf_et, see there.
+    #  s : dict of the variables updated by each pass: usr, tsr, qsr, ut,
+    #      charn, dT_skin, dz_skin and lw_net
+    #  c : dict of the inputs and constants that are the same for every pass
+    #  Returns a new dict with the updated variables of s and the other
+    #  results of the pass: gf, gust, dq_skin, zeta, L, zo, zot, zoq, tvsr,
+    #  tvsr1, tssr and tssr1. The arrays in s and c all have the same size,
+    #  or are single values, so a subset of the elements can be passed.
+    
+    usr, tsr, qsr, ut, charn = s['usr'], s['tsr'], s['qsr'], s['ut'], s['charn']
+    dT_skin, dz_skin, lw_net = s['dT_skin'], s['dz_skin'], s['lw_net']
+    von, grav, zu, zt, zq, ta, Q, visa = c['von'], c['grav'], c['zu'], c['zt'], c['zq'], c['ta'], c['Q'], c['visa']
+    ice, zos, fdg, du, dT, dq, wetc, jcool = c['ice'], c['zos'], c['fdg'], c['du'], c['dT'], c['dq'], c['wetc'], c['jcool']
+    Beta, zi, rhoa, cpa, Le, sw_net, Al, be = c['Beta'], c['zi'], c['rhoa'], c['cpa'], c['Le'], c['sw_net'], c['Al'], c['be']
+    cpw, rhow, visw, tcw, bigc, ts, T2K, lw_dn = c['cpw'], c['rhow'], c['visw'], c['tcw'], c['bigc'], c['ts'], c['T2K'], c['lw_dn']
+    a1, a2, umax, sigH, Ad, Bd, cp = c['a1'], c['a2'], c['umax'], c['sigH'], c['Ad'], c['Bd'], c['cp']
+    N = np.size(usr)
+    
+    zeta = np.multiply(np.multiply(np.multiply(von,grav),zu) / ta,(tsr + np.multiply(0.61 * ta,qsr))) / (usr ** 2)
+    L = zu / zeta
+    zo = np.multiply(charn,usr ** 2.0) / grav + 0.11 * visa / usr
+    zo[ice] = zos
+    rr = np.multiply(zo,usr) / visa
+    # This thermal roughness length Stanton number is close to COARE 3.0 value
+    zoq = np.minimum(0.00016,5.8e-05 / rr ** 0.72)
+    # Andreas 1987 for snow/ice, on the ice elements only: one partition of
+    # them into the regimes rr <= 0.135, <= 2.5 and <= 1000 (and > 1000, where
+    # rt and rq are 0), with the coefficients of each regime from andreas_rr
+    rt = np.zeros(N, dtype=usr.dtype)
+    rq = np.zeros(N, dtype=usr.dtype)
+    if ice.any():
+        rri = rr[ice]
+        lr = np.log(rri)
+        b = andreas_rr[:,np.searchsorted(andreas_rr[0,:3],rri)].astype(rri.dtype)
+        rt[ice] = np.multiply(rri,np.exp(b[1] + b[2] * lr + np.multiply(b[3] * lr,lr))) * b[7]
+        rq[ice] = np.multiply(rri,np.exp(b[4] + b[5] * lr + np.multiply(b[6] * lr,lr))) * b[7]
+    # Dalton number is close to COARE 3.0 value
+    zot = zoq
+    cdhf = von / (np.log(zu / zo) - psiu_26(zu / L))
+    cqhf = np.multiply(von,fdg) / (np.log(zq / zoq) - psit_26(zq / L))
+    if c['zt_is_zq']:
+        cthf = cqhf
+    else:
+        cthf = np.multiply(von,fdg) / (np.log(zt / zot) - psit_26(zt / L))
+    usr = np.multiply(ut,cdhf)
+    qsr = np.multiply(- (dq - np.multiply(np.multiply(wetc,dT_skin),jcool)),cqhf)
+    tsr = np.multiply(- (dT - np.multiply(dT_skin,jcool)),cthf)
+    # original COARE version buoyancy flux
+    tvsr1 = tsr + np.multiply(0.61 * ta,qsr)
+    tssr1 = tsr + np.multiply(0.51 * ta,qsr)
+    # new COARE version buoyancy flux from Stull (1988) page 146
+    # tsr here uses dT with the lapse rate adjustment (see code above). The
+    # Q and ta values should be at measurement height, not adjusted heights
+    tvsr = np.multiply(tsr,(1 + np.multiply(0.61,Q))) + np.multiply(0.61 * ta,qsr)
+    tssr = np.multiply(tsr,(1 + np.multiply(0.51,Q))) + np.multiply(0.51 * ta,qsr)
+    Bf = np.multiply(np.multiply(- grav / ta,usr),tvsr)
+    gust = 0.2 * np.ones(N, dtype=usr.dtype)
+    k = np.array(np.where(Bf > 0))
+    ### gustiness in this way is from the original code. Notes:
+    # we measured the actual gustiness by measuring the variance of the
+    # wind speed and empirically derived the the scaling. It's empirical
+    # but it seems appropriate... the longer the time average then the larger
+    # the gustiness factor should be, to account for the gustiness averaged
+    # or smoothed out by the averaging. wstar is the convective velocity.
+    # gustiness is beta times wstar. gustiness is different between mean of
+    # velocity and square of the mean of the velocity vector components.
+    # The actual wind (mean + fluctuations) is still the most relavent
+    # for the flux. The models do u v w, and then compute vector avg to get
+    # speed, so we've done the same thing. coare alg input is the magnitude
+    # of the mean vector wind relative to water.
+    if np.size(zi) == 1:
+        gust[k] = Beta * (np.multiply(Bf[k],zi)) ** 0.333
+        del k
+    else:
+        gust[k] = Beta * (np.multiply(Bf[k],zi[k])) ** 0.333
+        del k
+    ut = np.sqrt(du ** 2 + gust ** 2)
+    gf = ut / du
+    hsb = np.multiply(np.multiply(- rhoa * cpa,usr),tsr)
+    hlb = np.multiply(np.multiply(np.multiply(- rhoa,Le),usr),qsr)
+    qout = lw_net + hsb + hlb
+    ### rain heat flux is not included in qout because we don't fully
+    # understand the evolution or gradient of the cool skin layer in the
+    # presence of rain, and the sea snake subsurface measurement input
+    # value will capture some of the rain-cooled water already. TBD.
+    ### solar absorption:
+    # The absorption function below is from a Soloviev paper, appears as
+    # Eq 17 Fairall et al. 1996 and updated/tested by Wick et al. 2005. The
+    # coefficient was changed from 1.37 to 0.065 ~ about halved.
+    # Most of the time this adjustment makes no difference. But then there
+    # are times when the wind is weak, insolation is high, and it matters a
+    # lot. Using the original 1.37 coefficient resulted in many unwarranted
+    # warm-skins that didn't seem realistic. See Wick et al. 2005 for details.
+    # That's the last time the cool-skin routine was updated. The
+    # absorption is not from Paulson & Simpson because that was derived in a lab.
+    # It absorbed too much and produced too many warm layers. It likely
+    # approximated too much near-IR (longerwavelength solar) absorption
+    # which probably doesn't make it to the ocean since it was probably absorbed
+    # somewhere in the atmosphere first. The below expression could
+    # likely use 2 exponentials if you had a shallow mixed layer...
+    # but we find better results with 3 exponentials. That's the best so
+    # far we've found that covers the possible depths.
+    dels = np.multiply(sw_net,(0.065 + 11 * dz_skin - np.multiply(6.6e-05 / dz_skin,(1 - np.exp(- dz_skin / 0.0008)))))
+    qcol = qout - dels
+    # only needs stress, water temp, sum of sensible, latent, ir, solar,
+    # and latent individually.
+    alq = np.multiply(Al,qcol) + np.multiply(np.multiply(be,hlb),cpw) / Le
+    xlamx = 6.0 * np.ones(N, dtype=usr.dtype)
+    #     the other is the salinity part caused by latent heat flux (evap) leaving behind salt.
+    dz_skin = np.minimum(0.01,np.multiply(xlamx,visw) / (np.multiply(np.sqrt(rhoa / rhow),usr)))
+    k = np.array(np.where(alq > 0))
+    xlamx[k] = 6.0 / (1 + (np.multiply(bigc[k],alq[k]) / usr[k] ** 4) ** 0.75) ** 0.333
+    dz_skin[k] = np.multiply(xlamx[k],visw) / (np.multiply(np.sqrt(rhoa[k] / rhow),usr[k]))
+    del k
+    dT_skin = np.multiply(qcol,dz_skin) / tcw
+    dq_skin = np.multiply(wetc,dT_skin)
+    lw_net = 0.97 * (5.67e-08 * (ts - np.multiply(dT_skin,jcool) + T2K) ** 4 - lw_dn)
+    u10N = np.multiply(usr / von / gf,np.log(10.0 / zo))
+    charnC = a1 * u10N + a2
+    k = u10N > umax
+    charnC[k] = a1 * umax + a2
+    charn = charnC
+    zoS = np.multiply(np.multiply(sigH,Ad),(usr / cp) ** Bd)
+    charnS = np.multiply(zoS,grav) / usr / usr
+    ii = np.array(np.where(np.logical_not(np.isnan(cp))))
+    charn[ii] = charnS[ii]
+    
+    return dict(usr=usr,tsr=tsr,qsr=qsr,ut=ut,charn=charn,dT_skin=dT_skin,dz_skin=dz_skin,lw_net=lw_net,
+                gf=gf,gust=gust,dq_skin=dq_skin,zeta=zeta,L=L,zo=zo,zot=zot,zoq=zoq,
+                tvsr=tvsr,tvsr1=tvsr1,tssr=tssr,tssr1=tssr1)
+
+#------------------------------------------------------------------------------
+
+def coare_samples(inputs = None,tol = None,outputs = None): 
+    #  Output of coare36vn_zrf_et (A, or the structured array of outputs) for
+    #  the inputs u, zu, ..., zrf_q (in the order of input_names; cp and sigH
+    #  None for no wave inputs), computed in float64 for each sample by the
+    #  compiled kernel coare36vn_numba.coare_samples
+    
+    N = np.size(inputs[0])
+    inputs = [np.nan if value is None else value for value in inputs]
+    try:
+        # all single values (or all arrays of N samples)
+        x = np.array(inputs,dtype=float).reshape(len(input_names),N)
+    except ValueError:
+        x = np.empty((len(input_names),N))
+        for k,value in enumerate(inputs):
+            x[k] = value
+    A = coare36vn_numba.coare_samples(x,(payne_T,payne_alt,payne_albedo),tol)
+    
+    if outputs is None:
+        return A
+    B = np.empty(N, dtype=[(name, float) for name in outputs])
+    for name in outputs:
+        B[name] = A[:,output_names.index(name)]
+    return B
+    
+#------------------------------------------------------------------------------
+    
+def take(x = None,idx = None): 
+    #  Elements idx of the array x, or x itself if it is a single value
+    
+    if np.size(x) == 1:
+        return x
+    return x[idx]
+
+#------------------------------------------------------------------------------
+    
 def psit_26(zeta = None): 
-    # computes temperature structure function
-    dzeta = np.minimum(50,0.35 * zeta)
-    psi = - ((1 + 0.6667 * zeta) ** 1.5 + np.multiply(0.6667 * (zeta - 14.28),np.exp(- dzeta)) + 8.525)
-    k = np.array(np.where(zeta < 0))
-    x = (1 - 15 * zeta[k]) ** 0.5
+    # computes temperature structure function, with the stable and unstable
+    # forms each computed on their own elements only
+    psi = np.empty_like(zeta)
+    k = zeta < 0
+    zs = zeta[~k]
+    dzeta = np.minimum(50,0.35 * zs)
+    psi[~k] = - ((1 + 0.6667 * zs) ** 1.5 + np.multiply(0.6667 * (zs - 14.28),np.exp(- dzeta)) + 8.525)
+    zc = zeta[k]
+    x = (1 - 15 * zc) ** 0.5
     psik = 2 * np.log((1 + x) / 2)
-    x = (1 - 34.15 * zeta[k]) ** 0.3333
-    psic = 1.5 * np.log((1 + x + x ** 2) / 3) - np.sqrt(3) * np.arctan((1 + 2 * x) / np.sqrt(3)) + 4 * np.arctan(1) / np.sqrt(3)
-    f = zeta[k] ** 2.0 / (1 + zeta[k] ** 2)
-    psi[k] = np.multiply((1 - f),psik) + np.multiply(f,psic)
+    psi[k] = psi_convective(zc,psik,34.15)
     return psi
     
 #------------------------------------------------------------------------------
     
 def psiu_26(zeta = None): 
-    # computes velocity structure function
-    dzeta = np.minimum(50,0.35 * zeta)
-    a = 0.7
-    b = 3 / 4
-    c = 5
-    d = 0.35
-    psi = - (a * zeta + np.multiply(b * (zeta - c / d),np.exp(- dzeta)) + b * c / d)
-    k = np.array(np.where(zeta < 0))
-    x = (1 - 15 * zeta[k]) ** 0.25
+    # computes velocity structure function, with the stable and unstable
+    # forms each computed on their own elements only
+    psi = np.empty_like(zeta)
+    k = zeta < 0
+    psi[~k] = psiu_stable(zeta[~k],0.7)
+    zc = zeta[k]
+    x = (1 - 15 * zc) ** 0.25
     psik = 2 * np.log((1 + x) / 2) + np.log((1 + np.multiply(x,x)) / 2) - 2 * np.arctan(x) + 2 * np.arctan(1)
-    x = (1 - 10.15 * zeta[k]) ** 0.3333
-    psic = 1.5 * np.log((1 + x + x ** 2) / 3) - np.sqrt(3) * np.arctan((1 + 2 * x) / np.sqrt(3)) + 4 * np.arctan(1) / np.sqrt(3)
-    f = zeta[k] ** 2.0 / (1 + zeta[k] ** 2)
-    psi[k] = np.multiply((1 - f),psik) + np.multiply(f,psic)
+    psi[k] = psi_convective(zc,psik,10.15)
     return psi
     
 #------------------------------------------------------------------------------
     
 def psiu_40(zeta = None): 
-    # computes velocity structure function
+    # computes velocity structure function, with the stable and unstable
+    # forms each computed on their own elements only
+    psi = np.empty_like(zeta)
+    k = zeta < 0
+    psi[~k] = psiu_stable(zeta[~k],1)
+    zc = zeta[k]
+    x = (1 - 18 * zc) ** 0.25
+    psik = 2 * np.log((1 + x) / 2) + np.log((1 + np.multiply(x,x)) / 2) - 2 * np.arctan(x) + 2 * np.arctan(1)
+    psi[k] = psi_convective(zc,psik,10)
+    return psi
+    
+#------------------------------------------------------------------------------
+    
+def psiu_stable(zeta = None,a = None): 
+    # stable (zeta >= 0) velocity structure function of psiu_26 (a = 0.7)
+    # and psiu_40 (a = 1)
     dzeta = np.minimum(50,0.35 * zeta)
-    a = 1
     b = 3 / 4
     c = 5
     d = 0.35
-    psi = - (a * zeta + np.multiply(b * (zeta - c / d),np.exp(- dzeta)) + b * c / d)
-    k = np.array(np.where(zeta < 0))
-    x = (1 - 18 * zeta[k]) ** 0.25
-    psik = 2 * np.log((1 + x) / 2) + np.log((1 + np.multiply(x,x)) / 2) - 2 * np.arctan(x) + 2 * np.arctan(1)
-    x = (1 - 10 * zeta[k]) ** 0.3333
+    return - (a * zeta + np.multiply(b * (zeta - c / d),np.exp(- dzeta)) + b * c / d)
+    
+#------------------------------------------------------------------------------
+    
+def psi_convective(zeta = None,psik = None,gamma = None): 
+    # unstable (zeta < 0) structure function: the Kansas form psik blended
+    # with the free convective form of coefficient gamma
+    x = (1 - gamma * zeta) ** 0.3333
     psic = 1.5 * np.log((1 + x + x ** 2) / 3) - np.sqrt(3) * np.arctan((1 + 2 * x) / np.sqrt(3)) + 4 * np.arctan(1) / np.sqrt(3)
-    f = zeta[k] ** 2.0 / (1 + zeta[k] ** 2)
-    psi[k] = np.multiply((1 - f),psik) + np.multiply(f,psic)
-    return psi
+    f = zeta ** 2.0 / (1 + zeta ** 2)
+    return np.multiply((1 - f),psik) + np.multiply(f,psic)
+    
+#------------------------------------------------------------------------------
+    
+def psi_heights(psi_fun = None,L = None,heights = None): 
+    #  psi_fun(z / L) for each height z in heights, computed once for heights
+    #  that are the same (equal single values or arrays)
+    done = []
+    for z in heights:
+        for zd, psi in done:
+            if np.array_equal(z,zd):
+                break
+        else:
+            psi = psi_fun(z / L)
+            done.append((z,psi))
+        yield psi
     
 #------------------------------------------------------------------------------
     
@@ -898,12 +1130,7 @@ def albedo_vector(sw_dn = None,jd = None,lon = None,lat = None,eorw = None):
     
     T = np.minimum(2,sw_dn / solarmax)
     
-    Ts = np.arange(0,1+0.05,0.05)
-    As = np.arange(0,90+2,2)
-    
-    #  Look up table from Payne (1972)  Only adjustment is to T=0.95 Alt=10 value
-    #       0     2     4     6     8     10    12    14    16    18    20   22     24    26    28    30    32    34    36    38    40    42    44    46    48    50    52    54    56    58    60    62    64    66    68    70    72    74    76    78    80    82    84    86    88    90
-    a = np.array([[0.061,0.061,0.061,0.061,0.061,0.061,0.061,0.061,0.061,0.061,0.061,0.061,0.061,0.061,0.061,0.061,0.061,0.061,0.061,0.061,0.061,0.061,0.061,0.061,0.061,0.061,0.061,0.061,0.061,0.061,0.061,0.061,0.061,0.061,0.061,0.061,0.061,0.061,0.061,0.061,0.061,0.061,0.061,0.061,0.061,0.061],[0.062,0.062,0.061,0.061,0.061,0.061,0.061,0.061,0.061,0.061,0.061,0.061,0.061,0.061,0.061,0.061,0.061,0.061,0.061,0.061,0.061,0.061,0.061,0.061,0.061,0.061,0.061,0.061,0.061,0.061,0.061,0.061,0.061,0.061,0.061,0.061,0.061,0.061,0.061,0.061,0.061,0.061,0.061,0.061,0.061,0.061],[0.072,0.07,0.068,0.065,0.065,0.063,0.062,0.061,0.061,0.061,0.061,0.061,0.061,0.061,0.061,0.061,0.06,0.061,0.06,0.06,0.06,0.06,0.06,0.06,0.06,0.06,0.06,0.06,0.06,0.06,0.06,0.06,0.06,0.06,0.06,0.06,0.06,0.06,0.06,0.06,0.06,0.06,0.06,0.06,0.06,0.06],[0.087,0.083,0.079,0.073,0.07,0.068,0.066,0.065,0.064,0.063,0.062,0.061,0.061,0.06,0.06,0.06,0.06,0.06,0.06,0.06,0.06,0.06,0.06,0.06,0.06,0.06,0.06,0.06,0.06,0.06,0.06,0.06,0.06,0.06,0.06,0.06,0.06,0.06,0.06,0.06,0.06,0.06,0.06,0.06,0.06,0.06],[0.115,0.108,0.098,0.086,0.082,0.077,0.072,0.071,0.067,0.067,0.065,0.063,0.062,0.061,0.061,0.06,0.06,0.06,0.06,0.061,0.061,0.061,0.061,0.06,0.059,0.06,0.06,0.06,0.06,0.06,0.06,0.06,0.06,0.06,0.06,0.06,0.06,0.06,0.06,0.06,0.06,0.06,0.06,0.059,0.059,0.059],[0.163,0.145,0.13,0.11,0.101,0.092,0.084,0.079,0.072,0.072,0.068,0.067,0.064,0.063,0.062,0.061,0.061,0.061,0.06,0.06,0.06,0.06,0.06,0.059,0.059,0.059,0.059,0.059,0.059,0.059,0.059,0.059,0.059,0.059,0.059,0.059,0.059,0.059,0.059,0.059,0.059,0.059,0.059,0.059,0.059,0.058],[0.235,0.198,0.174,0.15,0.131,0.114,0.103,0.094,0.083,0.08,0.074,0.074,0.07,0.067,0.065,0.064,0.063,0.062,0.061,0.06,0.06,0.06,0.059,0.059,0.059,0.059,0.059,0.059,0.059,0.059,0.059,0.059,0.059,0.059,0.059,0.059,0.059,0.059,0.059,0.059,0.059,0.059,0.059,0.058,0.058,0.058],[0.318,0.263,0.228,0.192,0.168,0.143,0.127,0.113,0.099,0.092,0.084,0.082,0.076,0.072,0.07,0.067,0.065,0.064,0.062,0.062,0.06,0.06,0.06,0.059,0.059,0.059,0.059,0.059,0.059,0.059,0.058,0.058,0.058,0.058,0.058,0.058,0.058,0.058,0.057,0.058,0.058,0.058,0.058,0.057,0.057,0.057],[0.395,0.336,0.29,0.248,0.208,0.176,0.151,0.134,0.117,0.107,0.097,0.091,0.085,0.079,0.075,0.071,0.068,0.067,0.065,0.063,0.062,0.061,0.06,0.06,0.06,0.059,0.059,0.058,0.058,0.058,0.057,0.057,0.057,0.057,0.057,0.057,0.057,0.056,0.056,0.056,0.056,0.056,0.056,0.056,0.056,0.055],[0.472,0.415,0.357,0.306,0.252,0.21,0.176,0.154,0.135,0.125,0.111,0.102,0.094,0.086,0.081,0.076,0.072,0.071,0.068,0.066,0.065,0.063,0.062,0.061,0.06,0.059,0.058,0.057,0.057,0.057,0.056,0.055,0.055,0.055,0.055,0.055,0.055,0.054,0.053,0.054,0.053,0.053,0.054,0.054,0.053,0.053],[0.542,0.487,0.424,0.36,0.295,0.242,0.198,0.173,0.15,0.136,0.121,0.11,0.101,0.093,0.086,0.081,0.076,0.073,0.069,0.067,0.065,0.064,0.062,0.06,0.059,0.058,0.057,0.056,0.055,0.055,0.054,0.053,0.053,0.052,0.052,0.052,0.051,0.051,0.05,0.05,0.05,0.05,0.051,0.05,0.05,0.05],[0.604,0.547,0.498,0.407,0.331,0.272,0.219,0.185,0.16,0.141,0.127,0.116,0.105,0.097,0.089,0.083,0.077,0.074,0.069,0.066,0.063,0.061,0.059,0.057,0.056,0.055,0.054,0.053,0.053,0.052,0.051,0.05,0.05,0.049,0.049,0.049,0.048,0.047,0.047,0.047,0.046,0.046,0.047,0.047,0.046,0.046],[0.655,0.595,0.556,0.444,0.358,0.288,0.236,0.19,0.164,0.145,0.13,0.119,0.107,0.098,0.09,0.084,0.076,0.073,0.068,0.064,0.06,0.058,0.056,0.054,0.053,0.051,0.05,0.049,0.048,0.048,0.047,0.046,0.046,0.045,0.045,0.045,0.044,0.043,0.043,0.043,0.042,0.042,0.043,0.042,0.042,0.042],[0.693,0.631,0.588,0.469,0.375,0.296,0.245,0.193,0.165,0.145,0.131,0.118,0.106,0.097,0.088,0.081,0.074,0.069,0.065,0.061,0.057,0.055,0.052,0.05,0.049,0.047,0.046,0.046,0.044,0.044,0.043,0.042,0.042,0.041,0.041,0.04,0.04,0.039,0.039,0.039,0.038,0.038,0.038,0.038,0.038,0.038],[0.719,0.656,0.603,0.48,0.385,0.3,0.25,0.193,0.164,0.145,0.131,0.116,0.103,0.092,0.084,0.076,0.071,0.065,0.061,0.057,0.054,0.051,0.049,0.047,0.045,0.043,0.043,0.042,0.041,0.04,0.039,0.039,0.038,0.038,0.037,0.036,0.036,0.035,0.035,0.034,0.034,0.034,0.034,0.034,0.034,0.034],[0.732,0.67,0.592,0.474,0.377,0.291,0.246,0.19,0.162,0.144,0.13,0.114,0.1,0.088,0.08,0.072,0.067,0.062,0.058,0.054,0.05,0.047,0.045,0.043,0.041,0.039,0.039,0.038,0.037,0.036,0.036,0.035,0.035,0.034,0.033,0.032,0.032,0.032,0.031,0.031,0.031,0.03,0.03,0.03,0.03,0.03],[0.73,0.652,0.556,0.444,0.356,0.273,0.235,0.188,0.16,0.143,0.129,0.113,0.097,0.086,0.077,0.069,0.064,0.06,0.055,0.051,0.047,0.044,0.042,0.039,0.037,0.035,0.035,0.035,0.034,0.033,0.033,0.032,0.032,0.032,0.029,0.029,0.029,0.029,0.028,0.028,0.028,0.028,0.027,0.027,0.028,0.028],[0.681,0.602,0.488,0.386,0.32,0.252,0.222,0.185,0.159,0.142,0.127,0.111,0.096,0.084,0.075,0.067,0.062,0.058,0.054,0.05,0.046,0.042,0.04,0.036,0.035,0.033,0.032,0.032,0.031,0.03,0.03,0.03,0.03,0.029,0.027,0.027,0.027,0.027,0.026,0.026,0.026,0.026,0.026,0.026,0.026,0.026],[0.581,0.494,0.393,0.333,0.288,0.237,0.211,0.182,0.158,0.141,0.126,0.11,0.095,0.083,0.074,0.066,0.061,0.057,0.053,0.049,0.045,0.041,0.039,0.034,0.033,0.032,0.031,0.03,0.029,0.028,0.028,0.028,0.028,0.027,0.026,0.026,0.026,0.025,0.025,0.025,0.025,0.025,0.025,0.025,0.025,0.025],[0.453,0.398,0.342,0.301,0.266,0.226,0.205,0.18,0.157,0.14,0.125,0.109,0.095,0.083,0.074,0.065,0.061,0.057,0.052,0.048,0.044,0.04,0.038,0.033,0.032,0.031,0.03,0.029,0.028,0.027,0.027,0.026,0.026,0.026,0.025,0.025,0.025,0.025,0.025,0.025,0.025,0.025,0.025,0.025,0.025,0.025],[0.425,0.37,0.325,0.29,0.255,0.22,0.2,0.178,0.157,0.14,0.122,0.108,0.095,0.083,0.074,0.065,0.061,0.056,0.052,0.048,0.044,0.04,0.038,0.033,0.032,0.031,0.03,0.029,0.028,0.027,0.026,0.026,0.026,0.026,0.025,0.025,0.025,0.025,0.025,0.025,0.025,0.025,0.025,0.025,0.025,0.025]])
+    Ts, As, a = payne_T, payne_alt, payne_albedo
 
     if T.size==1:   ### for single value function
         Tchk = np.abs(Ts - T)
@@ -924,30 +1151,40 @@ def albedo_vector(sw_dn = None,jd = None,lon = None,lat = None,eorw = None):
                 #       print('no j found, not assigning alb to anything');
                 pass
     else:  ### for vectorized function
-        for k in np.arange(0,np.size(sinpsi)).reshape(-1):
-            Tchk = np.abs(Ts - T[k])
-            i = np.array(np.where(Tchk == Tchk.min()))
-            if psi[k] < 0:
-                alb[k] = 0
-                solarmax[k] = 0
-                T[k] = 0
-                j = 0
-                psi[k] = 0
-            else:
-                Achk = np.abs(As - psi[k])
-                j = np.array(np.where(Achk == Achk.min()))
-                szj = j.shape
-                if szj[0] > 0:
-                    alb[k] = a[i,j]
-                else:
-                    #       disp('no j found, not assigning alb to anything');
-                    pass
+        # all samples at once: nearest transmissivity and sun altitude bins of the table,
+        # taking the lower bin on a tie (in the precision of sw_dn, float64 or float32)
+        ftype = np.result_type(sw_dn, 1.0)
+        T, solarmax, psi = [np.array(x, dtype=ftype) for x in np.broadcast_arrays(T, solarmax, psi)]
+        i = nearest_bin(Ts, T)
+        j = nearest_bin(As, psi)
+        alb = a[i, j].astype(ftype)
+        # no bin for a missing transmissivity or sun altitude
+        np.copyto(alb,np.nan,where=np.isnan(T + psi))
+        # sun below the horizon
+        night = psi < 0
+        for x in [alb,solarmax,T,psi]:
+            np.copyto(x,0,where=night)
     
     #disp([num2str(jd) '  ' num2str(sw_dn) '  ' num2str(alb) '  ' num2str(T) '  ' num2str(i) '  ' num2str(j)])
     return alb,T,solarmax,psi
 
 #------------------------------------------------------------------------------
 
+def nearest_bin(bins = None,x = None): 
+    #  Index of the value of the evenly spaced, increasing array bins nearest to
+    #  each x, as np.argmin(np.abs(bins - x)) (the lower index on a tie), but
+    #  without an array of distances per sample: the bin below x is found by
+    #  rounding down and only it and the next bin are compared. A rounding
+    #  error can only move x across a bin it is within a few ulps of, which is
+    #  still one of the two compared. NaN gives index 0.
+    
+    n = np.size(bins)
+    step = (bins[-1] - bins[0]) / (n - 1)
+    k = np.fmin(np.fmax(np.floor((x - bins[0]) / step),0),n - 2).astype(int)
+    return k + (np.abs(bins[k + 1] - x) < np.abs(bins[k] - x))
+
+#------------------------------------------------------------------------------
+
 # This code executes if 'run coare36vn_zrf_et.py' is executed from iPython cmd line
 # Edit line 959 to indicate path to test data file
 if __name__ == '__main__':
@@ -0,0 +1,119 @@
+import glob
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import moxa_cache
+import readmoxa as rm
+
+
+# Output columns of each kind of Moxa log, in the order of the per-file reader output.
+# The first column is the time the output is sorted on
+SONIC_COLUMNS = ('time', 'u', 'v', 'w', 't_sos')
+IMU_COLUMNS   = ('time', 'x_rate', 'y_rate', 'z_rate', 'x_accl', 'y_accl', 'z_accl', 'roll', 'pitch', 'yaw')
+GPS_COLUMNS   = ('time_moxa', 'time_gps', 'pos_status', 'latitude', 'longitude', 'sog_kts', 'cog', 'mag_var', 'var_dir')
+
+
+def read_moxa_batch(files, kind, processes=None, chunksize=4, cache_dir=None):
+    """
+    Reads many Moxa log files of one kind in a process pool and concatenates them into one
+    time-sorted dataset.
+
+    Each file is decoded by its single file reader (read_gill_sonic, read_xbox_imu or the RMC
+    sentences of read_nmea) in a worker process, and only the decoded arrays are sent back.
+    The output arrays are allocated once from the total number of records and every file is
+    copied straight into its slice, so there are no intermediate concatenations. The records
+    are only re-sorted when the files are not already in time order.
+
+    With a cache_dir, each file is read through the Parquet cache of moxa_cache.read_cached, so
+    only the files that are new or have changed since the last call are decoded.
+
+    Args:
+        files (str or list): glob pattern (e.g. '/data/sonic/*.bin') or list of file paths.
+        kind (str): 'sonic', 'imu' or 'gps'.
+        processes (int): number of worker processes, defaults to the number of CPUs. With
+            processes=1 the files are read in this process.
+        chunksize (int): number of files sent to a worker at a time.
+        cache_dir (str): directory of the decoded file cache, or None to always decode the files.
+
+    Returns:
+        dict of np.ndarray keyed by column name (SONIC_COLUMNS, IMU_COLUMNS or GPS_COLUMNS),
+        sorted by time (time_moxa for the GPS).
+    """
+
+    if kind not in _READERS:
+        raise ValueError("kind must be one of %s, not %r" % (sorted(_READERS), kind))
+
+    if isinstance(files, (str, os.PathLike)):
+        files = sorted(glob.glob(os.fspath(files)))
+    files = list(files)
+
+    columns = _READERS[kind][1]
+
+    # Decode the files, in the pool unless there is only one process (or file) to use
+    if processes is None:
+        processes = os.cpu_count() or 1
+    processes = min(processes, len(files))
+
+    jobs = [(kind, f, cache_dir) for f in files]
+    if processes <= 1:
+        parts = [_read_file(job) for job in jobs]
+    else:
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            parts = list(pool.map(_read_file, jobs, chunksize=chunksize))
+
+    return _concatenate(parts, columns)
+
+
+def _read_file(job):
+
+    # Worker: decodes one file (or loads it from the cache) into a tuple of arrays in the
+    # order of the columns
+    kind, fname, cache_dir = job
+    reader, columns = _READERS[kind]
+
+    if cache_dir is None:
+        return reader(fname)
+
+    return moxa_cache.read_cached(fname, reader, columns, cache_dir)
+
+
+def _read_gps_rmc(fname):
+
+    # RMC sentences of a GPS log as a tuple of arrays in the order of GPS_COLUMNS
+    rmc = rm.read_nmea(fname, types=['RMC'])['RMC']
+
+    return tuple(rmc[name].to_numpy() for name in GPS_COLUMNS)
+
+
+def _concatenate(parts, columns):
+
+    # Allocates the output columns for all the records and copies each file into its slice
+    n = sum(len(part[0]) for part in parts)
+
+    if not parts:
+        return {name: np.empty(0) for name in columns}
+
+    out = [np.empty(n, dtype=np.asarray(x).dtype) for x in parts[0]]
+
+    i = 0
+    for part in parts:
+        m = len(part[0])
+        for column, x in zip(out, part):
+            column[i:i + m] = x
+        i += m
+
+    # Sort on the time only if the files are not already in order (stable, so records with
+    # the same time stay in file order). NaT is sorted to the end
+    time = out[0]
+    if n > 1 and not (time[1:] >= time[:-1]).all():
+        order = np.argsort(time, kind='stable')
+        out   = [column[order] for column in out]
+
+    return dict(zip(columns, out))
+
+
+# Per-file reader and output columns of each kind of log
+_READERS = {'sonic': (rm.read_gill_sonic, SONIC_COLUMNS),
+            'imu'  : (rm.read_xbox_imu,   IMU_COLUMNS),
+            'gps'  : (_read_gps_rmc,      GPS_COLUMNS)}
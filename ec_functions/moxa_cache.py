@@ -0,0 +1,75 @@
+import glob
+import hashlib
+import os
+
+import numpy as np
+import pandas as pd
+
+
+def read_cached(fname, reader, columns, cache_dir):
+    """
+    Reads a raw Moxa log through a columnar on-disk cache of its decoded arrays.
+
+    The decoded arrays of each raw file are stored as one zstd compressed Parquet file in
+    cache_dir, named from the raw file's absolute path and the column names, and from its size
+    and modification time. A later call for the same unchanged file loads the columns from the
+    Parquet file instead of decoding the raw file again; a file that is new, or whose size or
+    mtime has changed, is decoded with reader and its cache entry replaced. Parquet is read and written with pandas, which needs
+    pyarrow (or fastparquet).
+
+    Args:
+        fname (str): path to the raw log file.
+        reader (callable): single file reader returning a tuple of arrays, e.g. read_gill_sonic.
+        columns (sequence of str): names of the arrays returned by reader, in order.
+        cache_dir (str): directory of the cache, created if it does not exist.
+
+    Returns:
+        tuple of np.ndarray, in the order of columns (as returned by reader).
+    """
+
+    path = _cache_path(fname, columns, cache_dir)
+
+    if os.path.exists(path):
+        table = pd.read_parquet(path)
+        return tuple(table[name].to_numpy() for name in columns)
+
+    arrays = tuple(np.asarray(x) for x in reader(fname))
+
+    # Remove the entries of older versions of the file, then write the new entry to a
+    # temporary file and move it into place, so a reader never sees a partial file
+    os.makedirs(cache_dir, exist_ok=True)
+    for old in glob.glob(path.rsplit('-', 2)[0] + '-*.parquet'):
+        _remove(old)
+
+    tmp = '%s.%d.tmp' % (path, os.getpid())
+    pd.DataFrame(dict(zip(columns, arrays))).to_parquet(tmp, compression='zstd', index=False)
+    os.replace(tmp, path)
+
+    return arrays
+
+
+def clear_cache(cache_dir):
+    """
+    Removes all entries from a Moxa cache directory.
+    """
+
+    for path in glob.glob(os.path.join(cache_dir, '*.parquet')):
+        _remove(path)
+
+
+def _cache_path(fname, columns, cache_dir):
+
+    # <hash of the absolute path and columns>-<size>-<mtime in ns>.parquet
+    stat = os.stat(fname)
+    key  = hashlib.sha1('|'.join([os.path.abspath(fname)] + list(columns)).encode()).hexdigest()
+
+    return os.path.join(cache_dir, '%s-%d-%d.parquet' % (key, stat.st_size, stat.st_mtime_ns))
+
+
+def _remove(path):
+
+    # Another process may have removed or replaced the same entry already
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
@@ -76,3 +76,180 @@ def gps_time_convert(date, utc):
     time_str = '20' + yr + '-' + mt + '-' + dy + ' ' + hr + ':' + mn + ':' + sc
     
     return time_str
+
+
+
+
+# Number of days in each month (index 0 is unused), February of a leap year has one more
+_DAYS_IN_MONTH = np.array([0, 31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31])
+
+
+def moxa_time_convert_array(time_str):
+    """
+    Array version of moxa_time_convert: converts Moxa time stamps "YYMMDDHHmmss.sss" to datetime64[ns].
+    
+    The digits are read straight from the fixed-width character codes of the array, so no
+    intermediate strings are built. Any number of decimals (or none) is accepted for the seconds.
+    
+    Args:
+    time_str (array_like): numpy bytes or str array, or pandas Series, of Moxa time stamps.
+    
+    Returns:
+    np.ndarray: datetime64[ns] array, NaT where the time stamp is not a valid date and time.
+    """
+    
+    d, is_digit, c = _char_digits(time_str, 13)
+    
+    # Date and time digits, then a decimal point (or the end of the string) and the decimals
+    valid = is_digit[:12].all(axis=0) & ((c[12] == ord('.')) | (c[12] == 0))
+    frac, places, frac_ok = _fraction(d, is_digit, c, 13)
+    valid &= frac_ok
+    
+    year   = 2000 + 10*d[0] + d[1]
+    month  = 10*d[2]  + d[3]
+    day    = 10*d[4]  + d[5]
+    hour   = 10*d[6]  + d[7]
+    minute = 10*d[8]  + d[9]
+    second = 10*d[10] + d[11]
+    
+    return _datetime64(year, month, day, hour, minute, second, _to_ns(frac, places), valid)
+
+
+def gps_time_convert_array(date, utc):
+    """
+    Array version of gps_time_convert: converts GPS dates "DDMMYY" and UTC times "HHMMSS.SSS" to datetime64[ns].
+    
+    Args:
+    - date: numpy bytes or str array, or pandas Series, of GPS dates in the format 'DDMMYY'.
+    - utc: numpy bytes or str array, or pandas Series, of UTC times in the format 'HHMMSS.SSS'.
+    
+    Returns:
+    - time: datetime64[ns] array, NaT where the date or time is not valid.
+    """
+    
+    dd, dd_digit, dc = _char_digits(date, 6)
+    dt, dt_digit, tc = _char_digits(utc, 7)
+    
+    valid = dd_digit[:6].all(axis=0) & (dc[6:] == 0).all(axis=0) & dt_digit[:6].all(axis=0) & ((tc[6] == ord('.')) | (tc[6] == 0))
+    frac, places, frac_ok = _fraction(dt, dt_digit, tc, 7)
+    valid &= frac_ok
+    
+    day    = 10*dd[0] + dd[1]
+    month  = 10*dd[2] + dd[3]
+    year   = 2000 + 10*dd[4] + dd[5]
+    hour   = 10*dt[0] + dt[1]
+    minute = 10*dt[2] + dt[3]
+    second = 10*dt[4] + dt[5]
+    
+    return _datetime64(year, month, day, hour, minute, second, _to_ns(frac, places), valid)
+
+
+def lonlat_convert_array(ln, lt):
+    """
+    Array version of lonlat_convert: converts longitudes and latitudes from degree-minute format to decimal degrees.
+    
+    The minutes are built as an integer from their digits and divided once by the power of ten
+    of their decimals, which gives the same float64 values as lonlat_convert.
+
+    Args:
+    ln (array_like): numpy bytes or str array, or pandas Series, of longitudes (DDDMM.MMMM)
+    lt (array_like): numpy bytes or str array, or pandas Series, of latitudes (DDMM.MMMM)
+
+    Returns:
+    lon (np.ndarray): float64 longitudes in decimal degrees, NaN where the input is not valid
+    lat (np.ndarray): float64 latitudes in decimal degrees, NaN where the input is not valid
+    """
+    
+    lon = _degree_minutes(ln, 3)
+    lat = _degree_minutes(lt, 2)
+    
+    return lon, lat
+
+
+def _degree_minutes(x, ndeg):
+    
+    # ndeg digits of degrees, two digits of minutes, then a decimal point and the decimals
+    d, is_digit, c = _char_digits(x, ndeg + 3)
+    
+    valid = is_digit[:ndeg + 2].all(axis=0) & ((c[ndeg + 2] == ord('.')) | (c[ndeg + 2] == 0))
+    frac, places, frac_ok = _fraction(d, is_digit, c, ndeg + 3)
+    valid &= frac_ok
+    
+    deg = np.zeros(d.shape[1], dtype=np.int64)
+    for k in range(ndeg):
+        deg = 10*deg + d[k]
+    
+    # minutes as one integer, e.g. 30.1234 -> 301234, divided once by 10**places
+    minutes = (10*d[ndeg] + d[ndeg + 1]) * 10**places + frac
+    
+    out = deg + minutes / 10.0**places / 60
+    out[~valid] = np.nan
+    
+    return out
+
+
+def _char_digits(x, width):
+    
+    # Character codes c of a bytes or str array with one row per character position (at least
+    # width rows, zero past the end of each string), and their digit values d. Characters
+    # other than digits wrap around to large values in the unsigned subtraction
+    x = np.asarray(x).ravel()
+    if x.dtype.kind not in 'SU':
+        x = x.astype('U')
+    
+    ctype = np.uint8 if x.dtype.kind == 'S' else np.uint32
+    nchar = x.dtype.itemsize // np.dtype(ctype).itemsize
+    
+    c = np.zeros((max(width, nchar), x.size), dtype=ctype)
+    c[:nchar] = np.ascontiguousarray(x).view(ctype).reshape(x.size, nchar).T
+    
+    d = c - ctype(ord('0'))
+    
+    return d.astype(np.int64), d <= 9, c
+
+
+def _fraction(d, is_digit, c, start):
+    
+    # Decimals from row start to the end of each string, as an integer and its number of
+    # decimal places (at most 15 are used)
+    frac   = np.zeros(d.shape[1], dtype=np.int64)
+    places = np.zeros(d.shape[1], dtype=np.int64)
+    ok     = np.ones(d.shape[1], dtype=bool)
+    
+    for k in range(start, d.shape[0]):
+        ok &= is_digit[k] | (c[k] == 0)
+        take = is_digit[k] & (places < 15)
+        frac = np.where(take, 10*frac + d[k], frac)
+        places += take
+    
+    return frac, places, ok
+
+
+def _to_ns(frac, places):
+    
+    # Decimals of a second to integer nanoseconds
+    return np.where(places <= 9, frac * 10**np.clip(9 - places, 0, None), frac // 10**np.clip(places - 9, 0, None))
+
+
+def _datetime64(year, month, day, hour, minute, second, ns, valid):
+    
+    # Checks the date and time fields and builds datetime64[ns] values (NaT where not valid)
+    valid = valid & (month >= 1) & (month <= 12) & (day >= 1) & (hour < 24) & (minute < 60) & (second < 60)
+    
+    # Days in the month of each date, to check that the day exists
+    leap = (year % 4 == 0) & ((year % 100 != 0) | (year % 400 == 0))
+    valid &= day <= _DAYS_IN_MONTH[np.clip(month, 0, 12)] + (leap & (month == 2))
+    
+    # Days since 1970-01-01 from the calendar date (days_from_civil, H. Hinnant)
+    y   = year - (month <= 2)
+    era = y // 400
+    yoe = y - era*400
+    doy = (153*((month + 9) % 12) + 2)//5 + day - 1
+    doe = yoe*365 + yoe//4 - yoe//100 + doy
+    days = era*146097 + doe - 719468
+    
+    time = (((days*24 + hour)*60 + minute)*60 + second)*1000000000 + ns
+    time = np.where(valid, time, 0).view('datetime64[ns]')
+    time[~valid] = np.datetime64('NaT')
+    
+    return time
@@ -1,21 +1,58 @@
-import struct
+import os
+from time import monotonic, sleep
 import numpy as np
 import pandas as pd
 import moxa_conversions as mc
 
 
-def read_gill_sonic(fname):
+# Gill Sonic R3A record as written by the Moxa logger (30 bytes): the ASCII
+# timestamp "YYMMDDhhmmss.sss", 5 header bytes, the big-endian int16 u, v, w and
+# speed of sound temperature, and a trailing byte
+SONIC_DTYPE = np.dtype([('time', 'S16'), ('header', 'V5'),
+                        ('u', '>i2'), ('v', '>i2'), ('w', '>i2'), ('t_sos', '>i2'),
+                        ('tail', 'V1')])
+
+# Crossbow NAV440 record as written by the Moxa logger (59 bytes): the ASCII
+# timestamp, 6 bytes up to the packet payload, the big-endian int16 angles,
+# angular rates and accelerations, and the rest of the packet
+IMU_DTYPE = np.dtype([('time', 'S16'), ('header', 'V6'),
+                      ('roll', '>i2'), ('pitch', '>i2'), ('yaw', '>i2'),
+                      ('x_rate', '>i2'), ('y_rate', '>i2'), ('z_rate', '>i2'),
+                      ('x_accl', '>i2'), ('y_accl', '>i2'), ('z_accl', '>i2'),
+                      ('tail', 'V19')])
+
+# Frame markers checked when searching for record starts, as (byte offset, bytes):
+# the NAV440 packet preamble follows the timestamp. The sonic records are
+# found from their timestamps alone
+SONIC_MARKER = None
+IMU_MARKER   = (17, b'UU')
+
+# Scale factors from the IMU int16 fields to degrees per second, g's and degrees,
+# in the order of the read_xbox_imu output
+_IMU_SCALE = [('x_rate', 1260 / 2 ** 16), ('y_rate', 1260 / 2 ** 16), ('z_rate', 1260 / 2 ** 16),
+              ('x_accl', 20 / 2 ** 16),   ('y_accl', 20 / 2 ** 16),   ('z_accl', 20 / 2 ** 16),
+              ('roll', 360/2**16),        ('pitch', 360/2**16),       ('yaw', 360/2**16)]
+
+# Offsets of the digits of the timestamp "YYMMDDhhmmss.sss" at the start of each record
+_STAMP_DIGITS = np.r_[0:12, 13:16]
+
+
+def read_gill_sonic(fname, return_bad=False):
     
     """
     Reads in binary data from a Gill Sonic R3A anemometer and extracts the time, u_wind, v_wind, w_wind, and t_sos.
     
-    The binary file must contain data in chunks of 30 bytes.
+    The binary file must contain data in chunks of 30 bytes. The whole file is read at once and
+    viewed as an array of SONIC_DTYPE records, so all fields are decoded as arrays. The record
+    starts are found from the timestamps (see find_records), so dropped or corrupt bytes only
+    lose the records they touch and do not misalign the rest of the file.
 
     Author: [Marcel du Plessis, marcel.du.plessis@gu.se]
     Date: [24 February 2023]
 
     Args:
         fname (str): Filepath to binary data file.
+        return_bad (bool): If True, also return the byte ranges that are not part of any record.
 
     Returns:
         time (np.ndarray): Array of datetime64[ms] timestamps.
@@ -23,81 +60,186 @@ def read_gill_sonic(fname):
         v_m (np.ndarray): Array of v-wind speeds in m/s.
         w_m (np.ndarray): Array of w-wind speeds in m/s.
         t_sos (np.ndarray): Array of temperature values in degrees Celsius.
+        bad (np.ndarray): Only if return_bad is True, (n, 2) array of [start, stop) byte ranges.
     """
     
-    time_string = []
-    u_m   = []
-    v_m   = []
-    w_m   = []
-    t_sos = []
+    # Find the 30 byte records in the file
+    records, bad = _read_records(fname, SONIC_DTYPE, SONIC_MARKER)
+    
+    if return_bad:
+        return _decode_sonic(records) + (bad,)
+    
+    return _decode_sonic(records)
 
-    # Open binary file for reading
-    with open(fname, "rb") as f:
-        
-        # Chunk size (in bytes)
-        chunk_size = 30
-        
-        # Read in first chunk
-        chunk = f.read(chunk_size)
-        
-        # Loop through chunks until end of file
-        while chunk:
+
+def _decode_sonic(records):
     
-            # Read in next chunk
-            chunk = f.read(chunk_size)
-            
-            # If chunk is empty, skip to next iteration
-            if chunk == b'': 
-                continue     
-            
-            # Extract timestamp from chunk
-            time_str = '20' + str(chunk)[2:4] + '-' + str(chunk)[4:6] + '-' + str(chunk)[6:8] + ' ' + str(chunk)[8:10] + ':' + str(chunk)[10:12] + ':' + str(chunk)[12:18],
-            
-            # Try to extract remaining data from chunk
-            try:
-                
-                # convert the time string to a datetime object
-                time = np.array(time_str, dtype='datetime64[ms]')                
-                
-                # Extract remaining data using struct.unpack
-                u_wind, = struct.unpack('!h', chunk[21:23])
-                v_wind, = struct.unpack('!h', chunk[23:25])
-                w_wind, = struct.unpack('!h', chunk[25:27])
-                tm_sos, = struct.unpack('!h', chunk[27:29])
-                
-                # Append timestamp to list
-                time_string.append(time_str)
-                
-                # Append data to lists
-                u_m.append(u_wind)
-                v_m.append(v_wind)
-                w_m.append(w_wind)
-                t_sos.append(tm_sos)
-            
-            # If there is an error extracting data, skip to next iteration
-            except:                
-                continue
-        
-    # Convert lists to numpy arrays
-    time = np.array(time_string, dtype='datetime64[ms]')
-    time = np.squeeze(time)
+    """
+    Decodes an array of SONIC_DTYPE records into the read_gill_sonic output tuple.
+    Records with an invalid timestamp are dropped.
+    """
+    
+    # Convert the ASCII timestamps and drop the records that cannot be converted
+    time, valid = _moxa_time(records['time'])
+    if not valid.all():
+        time    = time[valid]
+        records = records[valid]
     
-    u_m = np.array(u_m)/100
-    v_m = np.array(v_m)/100
-    w_m = np.array(w_m)/100
-    t_sos = np.array(t_sos)/100-273.15
+    # Scale the int16 fields to m/s and degrees Celsius
+    u_m   = records['u']/100
+    v_m   = records['v']/100
+    w_m   = records['w']/100
+    t_sos = records['t_sos']/100-273.15
     
     return time, u_m, v_m, w_m, t_sos
 
 
-def read_xbox_imu(fname):
+def _read_records(fname, dtype, marker):
+    
+    """
+    Reads a binary file into an array of records of the given structured dtype, see find_records.
+    The record at the start of the file is skipped.
+    
+    Returns:
+        records: array of dtype records
+        bad: (n, 2) array of [start, stop) byte ranges that are not part of any record
+    """
+    
+    raw = np.fromfile(fname, dtype=np.uint8)
+    starts, bad = find_records(raw, dtype, marker)
+    
+    # skip the first record of the file
+    if starts.size and starts[0] == 0:
+        starts = starts[1:]
+    
+    return _gather_records(raw, starts, dtype), bad
+
+
+def _gather_records(raw, starts, dtype):
+    
+    """
+    Returns the records of the given dtype that start at the byte offsets starts of raw.
+    """
+    
+    size = dtype.itemsize
+    
+    # records that follow each other without gaps are a view of the buffer
+    if starts.size == 0 or starts[-1] - starts[0] == (starts.size - 1)*size:
+        first = starts[0] if starts.size else 0
+        return raw[first:first + starts.size*size].view(dtype)
+    
+    return raw[starts[:, None] + np.arange(size)].view(dtype).ravel()
+
+
+def find_records(raw, dtype, marker=None):
+    
+    """
+    Finds the start of every record in a Moxa binary buffer, without assuming that the records
+    are aligned to the record size.
+    
+    A record starts at every byte offset where the 16 byte ASCII timestamp "YYMMDDhhmmss.sss" is
+    found (digits, with the decimal point of the seconds), followed by the frame marker if one is
+    given, and where the next record starts at least one record size further on. Dropped,
+    inserted or corrupt bytes therefore only lose the records they touch. All checks are done
+    as array operations over the whole buffer.
+    
+    Args:
+        raw (np.ndarray): uint8 array with the file contents
+        dtype (np.dtype): record dtype, e.g. SONIC_DTYPE or IMU_DTYPE
+        marker (tuple): optional (byte offset, bytes) frame marker, e.g. IMU_MARKER
+    
+    Returns:
+        starts: int64 array of record start offsets
+        bad: (n, 2) int64 array of [start, stop) byte ranges that are not part of any record
+    
+    Examples:
+        A buffer shorter than one record, e.g. a file that the logger has only started to
+        write, has no records, and a partial first record is reported as bad bytes:
+        
+        >>> find_records(np.frombuffer(b'230224101010.12', dtype=np.uint8), SONIC_DTYPE)
+        (array([], dtype=int64), array([[ 0, 15]]))
+        >>> rec = np.zeros(3, SONIC_DTYPE)
+        >>> rec['time'] = [b'230224101010.%03d' % k for k in range(3)]
+        >>> find_records(np.frombuffer(rec.tobytes()[20:], dtype=np.uint8), SONIC_DTYPE)
+        (array([10, 40]), array([[ 0, 10]]))
+    """
+    
+    raw  = np.asarray(raw, dtype=np.uint8)
+    size = dtype.itemsize
+    
+    # Candidate starts: a decimal point where the seconds of a timestamp would be, for
+    # every offset that leaves room for a whole record (none in a buffer shorter than one)
+    starts = np.flatnonzero(raw[12:max(12, raw.size - size + 13)] == ord('.'))
+    
+    # All other timestamp characters must be digits. Characters other than digits
+    # wrap around to values above 9 in the uint8 subtraction
+    ok = np.ones(starts.size, dtype=bool)
+    for k in _STAMP_DIGITS:
+        ok &= raw[k:][starts] - np.uint8(ord('0')) <= 9
+    
+    if marker is not None:
+        offset, tag = marker
+        for k, byte in enumerate(tag):
+            ok &= raw[offset + k:][starts] == byte
+    
+    starts = starts[ok]
+    
+    # A record is only kept if the next one does not start inside it
+    starts = starts[np.diff(starts, append=raw.size) >= size]
+    
+    # Bad byte ranges are the gaps between the records
+    gap_start = np.concatenate([[0], starts + size])
+    gap_stop  = np.concatenate([starts, [raw.size]])
+    bad = np.column_stack([gap_start, gap_stop])[gap_stop > gap_start]
+    
+    return starts, bad
+
+
+def _moxa_time(stamps):
+    
+    """
+    Converts an array of fixed width Moxa timestamps (bytes "YYMMDDhhmmss.sss") to datetime64[ms].
+    
+    Returns:
+        time: datetime64[ms] array (NaT where the timestamp is invalid)
+        valid: boolean array, False where the timestamp is not a valid date and time
+    """
+    
+    # Digit values of each character, one row per character position. Characters other
+    # than digits wrap around to values above 9 in the uint8 subtraction
+    c = np.ascontiguousarray(stamps).view(np.uint8).reshape(-1, 16)
+    d = np.ascontiguousarray(c.T) - np.uint8(ord('0'))
+    
+    # All characters must be digits apart from the decimal point of the seconds
+    valid = (d[:12].max(axis=0) <= 9) & (d[13:].max(axis=0) <= 9) & (c[:, 12] == ord('.'))
+    d = d.astype(np.int64)
+    
+    year   = 2000 + 10*d[0] + d[1]
+    month  = 10*d[2]  + d[3]
+    day    = 10*d[4]  + d[5]
+    hour   = 10*d[6]  + d[7]
+    minute = 10*d[8]  + d[9]
+    second = 10*d[10] + d[11]
+    msec   = 100*d[13] + 10*d[14] + d[15]
+    
+    # Calendar checks and conversion shared with the text timestamps of moxa_conversions
+    time  = mc._datetime64(year, month, day, hour, minute, second, msec*1000000, valid).astype('datetime64[ms]')
+    valid = ~np.isnat(time)
+    
+    return time, valid
+
+
+def read_xbox_imu(fname, return_bad=False):
     
     """
     This Python script reads data from a Crossbow NAV440 IMU file in binary format.
     The file contains measurements of angular rates and accelerations in three directions.
     Optionally, the file may also contain measurements of velocity, GPS position, temperature, and time of week.
     
-    The data is stored in lists, with each list containing measurements for one direction.
+    The file is read at once and viewed as an array of IMU_DTYPE records, and all fields are
+    scaled with array arithmetic into a single preallocated output block. The record starts are
+    found from the timestamps and the packet preamble (see find_records), so dropped or corrupt
+    bytes only lose the records they touch and do not misalign the rest of the file.
     
     Usage: 
     Call the `read_xbox_imu` function, providing the filename of the IMU data file as an argument. 
@@ -112,6 +254,7 @@ def read_xbox_imu(fname):
     
     Args:
         fname (string): The file name of the binary file containing the IMU data.
+        return_bad (bool): If True, also return the byte ranges that are not part of any record.
 
     Returns:
         time: An array of datetime64 objects representing the timestamp.
@@ -127,91 +270,43 @@ def read_xbox_imu(fname):
         roll_ang : roll angle (in degrees)
         pitch_ang: pitch angle (in degrees)
         yaw_ang  : yaw angle (in degrees)
+        bad      : only if return_bad is True, (n, 2) array of [start, stop) byte ranges
     
     """
 
-    # initialize empty lists to store data
-    time_string = []
-    
-    x_rate = [] 
-    y_rate = [] 
-    z_rate = [] 
+    # find the 59 byte records in the file
+    records, bad = _read_records(fname, IMU_DTYPE, IMU_MARKER)
     
-    x_accl = [] 
-    y_accl = [] 
-    z_accl = [] 
-    
-    roll_ang  = [] 
-    pitch_ang = [] 
-    yaw_ang   = [] 
-
-    # open the file in binary mode
-    with open(fname, "rb") as f:
-        
-        # specify the size of each chunk to read
-        chunk_size = 59
-        
-        # read the first chunk
-        chunk = f.read(chunk_size)
-        
-        # keep reading chunks until end of file
-        while chunk:
-            
-            # read the next chunk
-            chunk = f.read(chunk_size)
-            
-            # if chunk is empty, skip to next iteration
-            if chunk == b'':   
-                continue     
-            
-            # extract the time string from the chunk
-            time_str = '20' + str(chunk)[2:4] + '-' + str(chunk)[4:6] + '-' + str(chunk)[6:8] + ' ' + str(chunk)[8:10] + ':' + str(chunk)[10:12] + ':' + str(chunk)[12:18],
-            
-            try:
-                # convert the time string to a datetime object
-                time = np.array(time_str, dtype='datetime64[ms]')
-                
-                # append the time string to the list
-                time_string.append(time_str)
-                
-                # extract and convert the x, y, and z rates from the chunk
-                x_rate.append(struct.unpack('!h', chunk[17:][11:13])[0] * (1260 / 2 ** 16))
-                y_rate.append(struct.unpack('!h', chunk[17:][13:15])[0] * (1260 / 2 ** 16))
-                z_rate.append(struct.unpack('!h', chunk[17:][15:17])[0] * (1260 / 2 ** 16))
-                
-                # extract and convert the x, y, and z accelerations from the chunk
-                x_accl.append(struct.unpack('!h', chunk[17:][17:19])[0] * (20 / 2 ** 16))
-                y_accl.append(struct.unpack('!h', chunk[17:][19:21])[0] * (20 / 2 ** 16))
-                z_accl.append(struct.unpack('!h', chunk[17:][21:23])[0] * (20 / 2 ** 16))
-                
-                roll_ang .append(struct.unpack('!h', chunk[17:][5:7]) [0]*(360/2**16)   )
-                pitch_ang.append(struct.unpack('!h', chunk[17:][7:9]) [0]*(360/2**16)   )
-                yaw_ang  .append(struct.unpack('!h', chunk[17:][9:11])[0]*(360/2**16)   )              
-            
-            except:            
-                continue
-        
-    # convert the time string list to a numpy array of datetime objects
-    time = np.array(time_string, dtype='datetime64[ms]')
+    # return the data as numpy arrays
+    if return_bad:
+        return _decode_imu(records) + (bad,)
     
-    # squeeze the time array to remove any extra dimensions
-    time = np.squeeze(time)
+    return _decode_imu(records)
 
-    # convert the lists to numpy arrays
-    x_rate = np.array(x_rate)
-    y_rate = np.array(y_rate)
-    z_rate = np.array(z_rate)
 
-    x_accl = np.array(x_accl)
-    y_accl = np.array(y_accl)
-    z_accl = np.array(z_accl)
+def _decode_imu(records):
     
-    roll_ang  = np.array(roll_ang )
-    pitch_ang = np.array(pitch_ang)
-    yaw_ang   = np.array(yaw_ang  )       
+    """
+    Decodes an array of IMU_DTYPE records into the read_xbox_imu output tuple.
+    Records with an invalid timestamp are dropped.
+    """
     
-    # return the data as numpy arrays
-    return time, x_rate, y_rate, z_rate, x_accl, y_accl, z_accl, roll_ang, pitch_ang, yaw_ang  
+    # Convert the ASCII timestamps and drop the records that cannot be converted
+    time, valid = _moxa_time(records['time'])
+    if not valid.all():
+        time    = time[valid]
+        records = records[valid]
+    
+    # Scale the int16 fields to degrees per second, g's and degrees, writing
+    # straight into one output block allocated for all nine fields
+    out = np.empty((len(_IMU_SCALE), records.size))
+    for row, (field, scale) in zip(out, _IMU_SCALE):
+        np.multiply(records[field], scale, out=row)
+    
+    x_rate, y_rate, z_rate, x_accl, y_accl, z_accl, roll_ang, pitch_ang, yaw_ang = out
+    
+    return time, x_rate, y_rate, z_rate, x_accl, y_accl, z_accl, roll_ang, pitch_ang, yaw_ang
+
 
 
 
@@ -233,65 +328,420 @@ def read_gps(fname):
         cog: course over ground in degrees true
         mag_var: magnetic variation in degrees
         var_dir: variation direction ('E' for east or 'W' for west)
+    
+    The sentences are grouped by their sentence ID (see read_nmea), so they may arrive in any
+    order, and the RMC sentences are decoded as whole columns.
+    """
+    
+    rmc = read_nmea(fname, types=['RMC'])['RMC']
+    
+    time_gps   = pd.DatetimeIndex(rmc['time_gps'].to_numpy())
+    time_moxa  = pd.DatetimeIndex(rmc['time_moxa'].to_numpy())
+    pos_status = rmc['pos_status'].tolist()
+    latitude   = rmc['latitude'].to_numpy()
+    longitude  = rmc['longitude'].to_numpy()
+    sog_kts    = rmc['sog_kts'].to_numpy()
+    cog        = rmc['cog'].to_numpy()
+    mag_var    = rmc['mag_var'].tolist()
+    var_dir    = rmc['var_dir'].tolist()
+    
+    return time_gps, time_moxa, pos_status, latitude, longitude, sog_kts, cog, mag_var, var_dir
+
+
+def read_nmea(fname, types=('RMC', 'VTG', 'HDT')):
+    """
+    Reads a Moxa GPS log (Moxa time stamp, tab, NMEA sentence per line) and decodes the RMC, VTG
+    and HDT sentences, from any talker.
+    
+    The lines are grouped by sentence type in a single pass and each group is decoded with
+    vectorized pandas string operations, so missing or reordered sentences do not affect the
+    other lines.
+    
+    Args:
+        fname: A string representing the path to the file to read
+        types: sentence types to decode, any of 'RMC', 'VTG' and 'HDT'
+    
+    Returns:
+        dict of DataFrames keyed by sentence type, each with a time_moxa column (empty if the
+        file has no sentences of that type):
+            'RMC': time_gps, pos_status, latitude, longitude, sog_kts, cog, mag_var, var_dir
+            'VTG': cog_true, cog_mag, sog_kts, sog_kmh
+            'HDT': heading
+    """
+    
+    # Read the file into a DataFrame using Pandas, keeping the Moxa time stamps as text
+    gps = pd.read_csv(fname, sep='\t', header=None, names=['time', 'other'], dtype=str).dropna()
+    
+    # Sentence type from the ID "$ttSSS," (talker tt, type SSS)
+    other = gps['other']
+    valid = (other.str[0] == '$') & (other.str[6] == ',')
+    gps   = gps[valid]
+    stype = gps['other'].str[3:6]
+    
+    sentences = {name: lines for name, lines in gps.groupby(stype, sort=False)}
+    
+    return {name: _NMEA_DECODERS[name](sentences.get(name, gps.iloc[:0])) for name in types}
+
+
+def read_gps_joined(fname, tolerance='50ms'):
+    """
+    Reads a Moxa GPS log and joins the RMC, VTG and HDT sentences on the Moxa time stamp.
+    
+    Each RMC sentence is matched with the VTG and HDT sentences nearest in time, within
+    tolerance, so sentences that are missing or out of order leave NaN rather than shifting
+    the rest of the file.
+    
+    Args:
+        fname: A string representing the path to the file to read
+        tolerance: largest time difference between joined sentences (anything accepted by pd.Timedelta)
+    
+    Returns:
+        DataFrame with one row per RMC sentence and the columns of the RMC decoder, plus
+        cog_true, cog_mag, sog_kmh (VTG, with its speed over ground as vtg_sog_kts) and heading (HDT).
+        RMC sentences with an invalid Moxa time stamp come last, with NaN in the joined columns
     """
     
-    # Initialize lists for the data
-    pos_status = []
-    latitude   = []
-    longitude  = []
-    sog_kts    = []
-    cog        = []
-    mag_var    = []
-    var_dir    = []
-    time_gps   = [] 
-    time_moxa  = []
+    sentences = read_nmea(fname)
+    
+    rmc = sentences['RMC'].sort_values('time_moxa')
+    vtg = sentences['VTG'].rename(columns={'sog_kts': 'vtg_sog_kts'})
+    hdt = sentences['HDT']
+    
+    # merge_asof cannot match null keys: RMC sentences without a Moxa time stamp are
+    # set aside and appended unjoined, VTG and HDT sentences without one are dropped
+    no_time = rmc['time_moxa'].isna()
+    joined  = rmc[~no_time]
+    
+    tolerance = pd.Timedelta(tolerance)
+    for other in [vtg, hdt]:
+        other  = other[other['time_moxa'].notna()].sort_values('time_moxa')
+        joined = pd.merge_asof(joined, other, on='time_moxa', direction='nearest', tolerance=tolerance)
+    
+    if no_time.any():
+        joined = pd.concat([joined, rmc[no_time]])[joined.columns]
+    
+    return joined.reset_index(drop=True)
+
+
+def _decode_rmc(lines):
+    
+    # Split the RMC sentences into columns
+    RMC, ok = _nmea_fields(lines, 12)
+    
+    # Convert the longitude and latitude from degree-minute format to decimal degrees
+    longitude, latitude = mc.lonlat_convert_array(RMC[5], RMC[3])
+    
+    # Drop the sentences that are incomplete or have no position
+    keep = ok.to_numpy() & ~np.isnan(longitude) & ~np.isnan(latitude)
+    ok  &= keep
+    RMC  = RMC[ok]
+    
+    return pd.DataFrame({'time_moxa' : _moxa_time_column(lines['time'][ok]),
+                         'time_gps'  : _gps_time_column(RMC[9], RMC[1]),
+                         'pos_status': RMC[2].to_numpy(),
+                         'latitude'  : latitude[keep],
+                         'longitude' : longitude[keep],
+                         'sog_kts'   : pd.to_numeric(RMC[7], errors='coerce').to_numpy(np.float64),
+                         'cog'       : pd.to_numeric(RMC[8], errors='coerce').to_numpy(np.float64),
+                         'mag_var'   : RMC[10].to_numpy(),
+                         'var_dir'   : RMC[11].to_numpy()})
+
+
+def _decode_vtg(lines):
+    
+    # $GPVTG,cog,T,cog_mag,M,sog,N,sog_kmh,K,...
+    VTG, ok = _nmea_fields(lines, 8)
+    VTG = VTG[ok]
+    
+    return pd.DataFrame({'time_moxa': _moxa_time_column(lines['time'][ok]),
+                         'cog_true' : pd.to_numeric(VTG[1], errors='coerce').to_numpy(np.float64),
+                         'cog_mag'  : pd.to_numeric(VTG[3], errors='coerce').to_numpy(np.float64),
+                         'sog_kts'  : pd.to_numeric(VTG[5], errors='coerce').to_numpy(np.float64),
+                         'sog_kmh'  : pd.to_numeric(VTG[7], errors='coerce').to_numpy(np.float64)})
+
+
+def _decode_hdt(lines):
+    
+    # $GPHDT,heading,T*cs
+    HDT, ok = _nmea_fields(lines, 2)
+    
+    return pd.DataFrame({'time_moxa': _moxa_time_column(lines['time'][ok]),
+                         'heading'  : pd.to_numeric(HDT[1][ok], errors='coerce').to_numpy(np.float64)})
+
+
+_NMEA_DECODERS = {'RMC': _decode_rmc, 'VTG': _decode_vtg, 'HDT': _decode_hdt}
+
+
+def _nmea_fields(lines, n):
+    
+    # Split the sentences into n text columns, and flag the sentences that have at least n fields
+    complete = lines['other'].str.count(',') >= n - 1
+    fields   = lines['other'].str.split(',', expand=True).reindex(columns=range(n)).fillna('').astype(str)
+    
+    return fields, complete
+
+
+def _moxa_time_column(tm):
+    
+    # Moxa time stamps YYMMDDHHmmss.sss to datetime64
+    return mc.moxa_time_convert_array(tm)
+
+
+def _gps_time_column(date, utc):
     
-    # Read the file into a DataFrame using Pandas
-    gps = pd.read_csv(fname, sep='\t', header=None, names=['time', 'other'])
+    # GPS date (DDMMYY) and UTC time (HHMMSS.SSS) to datetime64
+    return mc.gps_time_convert_array(date, utc)
+
 
-    # Determine the starting index based on the first data type
-    if gps.iloc[0]['other'].split(",")[0]=='$GPRMC':
-        start_idx = 0
+
+class MoxaLog:
+    
+    """
+    Lazy, read-only view of a binary Moxa log file, as returned by open_gill_sonic and open_xbox_imu.
+    
+    The file is memory-mapped as an array of fixed size records and nothing is decoded when it is
+    opened. Indexing with an integer or a slice decodes only the selected records, so only the
+    pages of the file that hold them are read from disk.
+    
+    Usage:
+        log = open_gill_sonic(fname)
+        time, u_m, v_m, w_m, t_sos = log[72000:144000]
+        time, u_m, v_m, w_m, t_sos = log.sel('2023-02-24T10:00', '2023-02-24T11:00')
+    
+    Attributes:
+        fname: path to the binary file
+        records: np.memmap of the raw records (the first record of the file is skipped, as in the read_* functions)
+    
+    The records are mapped at a fixed stride, so the file must not contain dropped or corrupt
+    bytes. Use read_gill_sonic or read_xbox_imu, which search for the record starts, otherwise.
+    """
+    
+    def __init__(self, fname, dtype, decode):
+        
+        self.fname   = fname
+        self._decode = decode
+        
+        n = os.path.getsize(fname) // dtype.itemsize
+        
+        # skip the first record of the file
+        if n > 1:
+            self.records = np.memmap(fname, dtype=dtype, mode='r', offset=dtype.itemsize, shape=(n - 1,))
+        else:
+            self.records = np.zeros(0, dtype=dtype)
+    
+    def __len__(self):
+        return self.records.size
+    
+    def __getitem__(self, index):
+        
+        # decode the selected records only, an integer index gives arrays of length one
+        if isinstance(index, (int, np.integer)):
+            index = slice(index, index + 1 if index != -1 else None)
+        
+        return self._decode(np.asarray(self.records[index]))
+    
+    def time(self, index):
+        
+        """
+        Returns the datetime64[ms] timestamp of a single record (NaT if it is invalid).
+        """
+        
+        time, valid = _moxa_time(np.asarray(self.records['time'][index:index + 1]))
+        
+        return time[0]
+    
+    def sel(self, start, end):
+        
+        """
+        Decodes the records with start <= time < end.
+        
+        The record range is found with a binary search on the timestamps, so the timestamps are
+        assumed to increase through the file. Only the pages holding the probed records and the
+        selected records are read.
+        
+        Args:
+            start, end: anything accepted by np.datetime64, e.g. '2023-02-24T10:00'
+        """
+        
+        i0 = self._search(np.datetime64(start, 'ms'))
+        i1 = self._search(np.datetime64(end, 'ms'))
+        
+        return self[i0:i1]
+    
+    def _search(self, t):
+        
+        # first record index with a timestamp >= t
+        lo, hi = 0, len(self)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.time(mid) < t:
+                lo = mid + 1
+            else:
+                hi = mid
         
-    elif gps.iloc[0]['other'].split(",")[0]=='$GPVTG':
-        start_idx = 1
+        return lo
+
+
+def open_gill_sonic(fname):
+    
+    """
+    Opens a Gill Sonic R3A binary file (see read_gill_sonic) as a memory-mapped MoxaLog.
+    
+    Slicing the returned MoxaLog gives the same tuple as read_gill_sonic for the selected records:
+    time, u_m, v_m, w_m, t_sos.
+    
+    Args:
+        fname (str): Filepath to binary data file.
+
+    Returns:
+        MoxaLog
+    """
+    
+    return MoxaLog(fname, SONIC_DTYPE, _decode_sonic)
+
+
+def open_xbox_imu(fname):
+    
+    """
+    Opens a Crossbow NAV440 IMU binary file (see read_xbox_imu) as a memory-mapped MoxaLog.
+    
+    Slicing the returned MoxaLog gives the same tuple as read_xbox_imu for the selected records:
+    time, x_rate, y_rate, z_rate, x_accl, y_accl, z_accl, roll_ang, pitch_ang, yaw_ang.
+    
+    Args:
+        fname (string): The file name of the binary file containing the IMU data.
+
+    Returns:
+        MoxaLog
+    """
+    
+    return MoxaLog(fname, IMU_DTYPE, _decode_imu)
+
+
+def follow_gill_sonic(fname, poll=1.0, timeout=None):
+    
+    """
+    Follows a Gill Sonic R3A binary file that is still being written by the Moxa logger, and
+    yields the new records as they arrive (see read_gill_sonic).
+    
+    The file is polled every poll seconds and only the bytes added since the last poll are read,
+    so no data is decoded twice. A record that is not yet complete at the end of the file, or
+    whose boundary could still be moved by the next bytes (see find_records), is kept back and
+    yielded with the next block. The concatenated blocks are the same as read_gill_sonic of the
+    finished file.
+    
+    Usage:
+        for time, u_m, v_m, w_m, t_sos in follow_gill_sonic(fname, poll=5):
+            ...
     
-    elif gps.iloc[0]['other'].split(",")[0]=='$GPHDT':
-        start_idx = 2
+    Args:
+        fname (str): Filepath to binary data file.
+        poll (float): seconds to wait between checks for new data.
+        timeout (float): stop after the file has not grown for timeout seconds, yielding the
+            records kept back at the end. None follows the file forever.
+
+    Yields:
+        time, u_m, v_m, w_m, t_sos of the new records, as returned by read_gill_sonic.
     
-    # Iterate through every third line starting from the starting index and extract the relevant data
-    for i in range(gps.iloc[start_idx::3]['other'].size):
+    Examples:
+        Following a file that holds only part of its first record when it is opened:
         
-        try:
-            # Extract the necessary data from the line using string manipulation
-            GPRMC = gps.iloc[start_idx::3].iloc[i]['other'].split(",")        
-            utc  = GPRMC[1]
-            date = GPRMC[9]            
-            lon, lat = mc.lonlat_convert(GPRMC[5], GPRMC[3]) # Call the lonlat_convert function to convert the longitude and latitude
+        >>> import tempfile, threading
+        >>> rec = np.zeros(4, SONIC_DTYPE)
+        >>> rec['time'] = [b'230224101010.%03d' % k for k in range(4)]
+        >>> rec['u'] = [0, 100, 200, 300]
+        >>> fname = os.path.join(tempfile.mkdtemp(), 'sonic.bin')
+        >>> def write(data, mode):
+        ...     with open(fname, mode) as f:
+        ...         _ = f.write(data)
+        >>> write(rec.tobytes()[:15], 'wb')
+        >>> threading.Timer(0.2, write, [rec.tobytes()[15:], 'ab']).start()
+        >>> blocks = list(follow_gill_sonic(fname, poll=0.05, timeout=1))
+        >>> np.concatenate([u_m for time, u_m, v_m, w_m, t_sos in blocks])
+        array([1., 2., 3.])
+        >>> read_gill_sonic(fname)[1]
+        array([1., 2., 3.])
+    """
+    
+    return _follow(fname, SONIC_DTYPE, SONIC_MARKER, _decode_sonic, poll, timeout)
+
+
+def follow_xbox_imu(fname, poll=1.0, timeout=None):
+    
+    """
+    Follows a Crossbow NAV440 IMU binary file that is still being written by the Moxa logger, and
+    yields the new records as they arrive (see read_xbox_imu and follow_gill_sonic).
+    
+    Args:
+        fname (string): The file name of the binary file containing the IMU data.
+        poll (float): seconds to wait between checks for new data.
+        timeout (float): stop after the file has not grown for timeout seconds, yielding the
+            records kept back at the end. None follows the file forever.
+
+    Yields:
+        time, x_rate, y_rate, z_rate, x_accl, y_accl, z_accl, roll_ang, pitch_ang, yaw_ang of the
+        new records, as returned by read_xbox_imu.
+    """
+    
+    return _follow(fname, IMU_DTYPE, IMU_MARKER, _decode_imu, poll, timeout)
+
+
+def _follow(fname, dtype, marker, decode, poll, timeout):
+    
+    # Generator behind follow_gill_sonic and follow_xbox_imu. offset is the number of bytes of the
+    # file read so far, and tail the bytes at the end of them that are not decoded yet (a partial
+    # record, or a record that is kept back), starting at byte offset - tail.size of the file
+    size   = dtype.itemsize
+    offset = 0
+    tail   = np.zeros(0, dtype=np.uint8)
+    idle   = monotonic()
+    
+    with open(fname, 'rb') as f:
+        while True:
             
-            # Append the extracted data to the appropriate list
-            pos_status.append(GPRMC[2])
-            latitude  .append(lat)
-            longitude .append(lon)            
-            sog_kts   .append(GPRMC[7])
-            cog       .append(GPRMC[8])    
-            mag_var   .append(GPRMC[10])
-            var_dir   .append(GPRMC[11])
+            end = os.fstat(f.fileno()).st_size
             
-            # Convert the GPS time and Moxa time to the appropriate format using the gps_time_convert and moxa_time_convert functions
-            time_gps.append(mc.gps_time_convert(date, utc))
-            tm = str(gps.iloc[start_idx::3].iloc[i]['time'])            
-            time_moxa.append(mc.moxa_time_convert(tm))
+            # The file was truncated or replaced by a new one of the same name: start again
+            if end < offset:
+                offset, tail = 0, tail[:0]
             
-        except:          
-            continue 
+            final = end == offset and timeout is not None and monotonic() - idle >= timeout
             
-    sog_kts    = np.array(sog_kts).astype(np.float64)
-    latitude   = np.array(latitude).astype(np.float64)
-    longitude  = np.array(longitude).astype(np.float64)
-    cog        = np.array(cog).astype(np.float64)
-    
-    time_gps = pd.to_datetime(time_gps, format='%Y-%m-%d %H:%M:%S.%f')
-    time_moxa = pd.to_datetime(time_moxa, format='%Y-%m-%d %H:%M:%S.%f')
-    
-    return time_gps, time_moxa, pos_status, latitude, longitude, sog_kts, cog, mag_var, var_dir
+            if end > offset:
+                f.seek(offset)
+                raw    = np.concatenate([tail, np.frombuffer(f.read(end - offset), dtype=np.uint8)])
+                offset = offset + raw.size - tail.size
+                idle   = monotonic()
+            elif final:
+                raw = tail
+            else:
+                sleep(poll)
+                continue
+            
+            first  = offset - raw.size
+            starts = find_records(raw, dtype, marker)[0]
+            
+            # A record is only final once every start that could overlap it (up to one record
+            # size further on) has been seen, i.e. it ends at least one record before the end
+            # of the data. Unless this is the last block, the others are decoded next time
+            if not final:
+                starts = starts[starts <= raw.size - 2*size + 1]
+            
+            # skip the first record of the file, as read_gill_sonic and read_xbox_imu
+            if starts.size and first + starts[0] == 0:
+                starts = starts[1:]
+                cut = size
+            else:
+                cut = 0
+            
+            if starts.size:
+                cut = starts[-1] + size
+            
+            # Bytes before the last possible start of a kept back record are not part of any record
+            tail = raw[max(cut, raw.size - 2*size + 2):].copy()
+            
+            if starts.size:
+                yield decode(_gather_records(raw, starts, dtype))
+            
+            if final:
+                return